@@ -5,12 +5,16 @@ Common module for shared functionality across the system.
 # Create required directories
 from .utils import (
     create_directory_if_not_exists,
+    get_issuers_dir,
     get_credentials_dir,
     get_wallets_dir,
-    get_revocation_dir
+    get_revocation_dir,
+    get_keys_dir
 )
 
 # Ensure directories exist
+create_directory_if_not_exists(get_issuers_dir())
 create_directory_if_not_exists(get_credentials_dir())
 create_directory_if_not_exists(get_wallets_dir())
-create_directory_if_not_exists(get_revocation_dir())
\ No newline at end of file
+create_directory_if_not_exists(get_revocation_dir())
+create_directory_if_not_exists(get_keys_dir())
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""
+Process-wide cache of parsed JSON documents.
+
+Issuer key files and public revocation roots are read on every
+verification and every web request. The cache keeps their parsed form
+keyed by path and revalidates each entry with a single os.stat: an entry
+is served only while the file's inode, mtime and size are unchanged.
+The write path also invalidates entries explicitly.
+
+Cached documents are shared between callers and must not be modified.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict
+
+
+class DocumentCache:
+    """
+    Bounded LRU cache of parsed documents, validated against file metadata.
+    """
+
+    def __init__(self, max_entries: int = 4096, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries (int): Maximum number of cached documents
+            max_bytes (int): Maximum total on-disk size of the cached documents
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # Path -> (signature, size, document)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, filepath: str, loader: Callable[[str], Any], default=None):
+        """
+        Get the parsed document of a file.
+
+        Args:
+            filepath (str): Path of the file
+            loader (callable): Parses the file at a path; returns None on failure
+            default: Returned if the file does not exist or cannot be parsed
+
+        Returns:
+            The parsed document, shared with other callers
+        """
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            self.invalidate(filepath)
+            return default
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._entries.get(filepath)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(filepath)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        document = loader(filepath)
+        if document is None:
+            return default
+
+        with self._lock:
+            self._remove(filepath)
+            if stat.st_size <= self.max_bytes:
+                self._entries[filepath] = (signature, stat.st_size, document)
+                self._bytes += stat.st_size
+                self._evict()
+        return document
+
+    def _remove(self, filepath: str) -> bool:
+        """Drop an entry. Called with the lock held."""
+        entry = self._entries.pop(filepath, None)
+        if entry is None:
+            return False
+        self._bytes -= entry[1]
+        return True
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until within bounds. Called with the lock held."""
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or self._bytes > self.max_bytes):
+            _, (_, size, _) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def invalidate(self, filepath: str) -> None:
+        """Drop the entry of a file, e.g. after writing it."""
+        with self._lock:
+            if self._remove(filepath):
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the cache metrics.
+
+        Returns:
+            dict: hits, misses, evictions, invalidations, entries and bytes
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+            }
+
+
+_document_cache = DocumentCache()
+
+
+def get_document_cache() -> DocumentCache:
+    """Get the process-wide document cache."""
+    return _document_cache
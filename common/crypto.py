@@ -3,7 +3,7 @@ Cryptographic utilities for the privacy-preserving digital credential system.
 """
 
 import base64
-from typing import List, Tuple
+from typing import Dict, Iterable, List, Tuple
 from cryptography.hazmat.primitives.asymmetric import ed25519
 from cryptography.hazmat.primitives import serialization
 from hashlib import sha256
@@ -85,7 +85,54 @@ class CryptoManager:
         except Exception:
             return False
 
-    
+    @staticmethod
+    def load_public_key(public_key_b64):
+        """
+        Parse a public key once, for verifying many signatures with verify_with_key.
+
+        Args:
+            public_key_b64 (str): Base64-encoded public key
+
+        Returns:
+            Ed25519PublicKey: The parsed key
+        """
+        return ed25519.Ed25519PublicKey.from_public_bytes(base64.b64decode(public_key_b64))
+
+    @staticmethod
+    def derive_public_key(private_key_b64):
+        """Get the base64-encoded public key of a base64-encoded private key."""
+        private_key = ed25519.Ed25519PrivateKey.from_private_bytes(base64.b64decode(private_key_b64))
+        public_bytes = private_key.public_key().public_bytes(
+            encoding=serialization.Encoding.Raw,
+            format=serialization.PublicFormat.Raw
+        )
+        return base64.b64encode(public_bytes).decode('utf-8')
+
+    @staticmethod
+    def key_id(public_key_b64):
+        """Get the short ID (kid) of a public key: a prefix of the SHA-256 of its bytes."""
+        return sha256(base64.b64decode(public_key_b64)).hexdigest()[:16]
+
+    @staticmethod
+    def verify_with_key(public_key, message, signature_b64):
+        """
+        Verify a signature with an already parsed public key.
+
+        Args:
+            public_key (Ed25519PublicKey): Key from load_public_key
+            message (str): Original message
+            signature_b64 (str): Base64-encoded signature
+
+        Returns:
+            bool: True if the signature is valid, False otherwise
+        """
+        try:
+            public_key.verify(base64.b64decode(signature_b64), message.encode('utf-8'))
+            return True
+        except Exception:
+            return False
+
+
     @staticmethod
     def hash_sha256(data: str) -> str:
         return sha256(data.encode("utf-8")).hexdigest()
@@ -134,6 +181,36 @@ class CryptoManager:
 
         return proof
 
+    @staticmethod
+    def generate_proofs(leaves: List[str], cred_uuids: Iterable[str]) -> Dict[str, List[Tuple[str, bool]]]:
+        """
+        Generate the proofs of several leaves, building the tree only once.
+        Leaves that are not in the tree (revoked credentials) are left out.
+        """
+        positions = {}
+        for index, leaf in enumerate(leaves):
+            positions.setdefault(leaf, index)
+        wanted = {cred_uuid: positions[cred_uuid] for cred_uuid in cred_uuids if cred_uuid in positions}
+        if not wanted:
+            return {}
+
+        # Keep every layer, padded the same way as in generate_proof
+        layers = [[CryptoManager.hash_sha256(leaf) for leaf in leaves]]
+        while len(layers[-1]) > 1:
+            layer = layers[-1]
+            if len(layer) % 2 != 0:
+                layer.append(layer[-1])
+            layers.append([CryptoManager.hash_sha256(layer[i] + layer[i + 1]) for i in range(0, len(layer), 2)])
+
+        proofs = {}
+        for cred_uuid, cred_index in wanted.items():
+            proof = []
+            for layer in layers[:-1]:
+                proof.append((layer[(cred_index // 2 * 2) + ((cred_index + 1) % 2)], bool((cred_index + 1) % 2)))
+                cred_index = cred_index // 2
+            proofs[cred_uuid] = proof
+        return proofs
+
     @staticmethod
     def check_proof(proof: List[Tuple[str, bool]], cred_uuid: str, root_hash: str) -> bool:
         running_hash = CryptoManager.hash_sha256(cred_uuid)
@@ -0,0 +1,194 @@
+"""
+Secondary indexes over the credentials of the file storage backend.
+
+Each indexed value has a small append-only file listing the IDs of the
+credentials carrying it. Credentials are indexed by issuer_id, holder_id
+and type, and by expiration day (expiration_date // 86400), so that a
+query only loads the credentials that can match instead of every
+credential ever issued.
+
+Index entries are hints: they are appended before the credential itself
+is committed and are never removed, so query results are always
+re-checked against the credential documents.
+"""
+
+import os
+import shutil
+from typing import Any, Dict, Iterable, Iterator, Optional, Set
+
+from common.utils import (
+    append_line, get_index_dir, get_index_file_path, get_expiration_index_file_path
+)
+
+
+INDEXED_FIELDS = ('issuer_id', 'holder_id', 'type')
+
+SECONDS_PER_DAY = 86400
+
+# Written once every existing credential has been indexed
+_READY_MARKER = 'READY'
+
+# Number of credentials indexed in memory between flushes during a rebuild
+_REBUILD_BUFFER_SIZE = 100000
+
+
+def get_expiration_day(expiration_date: int) -> int:
+    """Get the expiration bucket of a timestamp."""
+    return expiration_date // SECONDS_PER_DAY
+
+
+class CredentialIndex:
+    """
+    On-write secondary indexes for credential documents.
+    """
+
+    def __init__(self, durable: bool = False):
+        """
+        Initialize the indexes.
+
+        Args:
+            durable (bool): fsync index appends (or leave them to the batch commit)
+        """
+        self.durable = durable
+
+    def _get_marker_path(self) -> str:
+        """Get the path of the marker showing that the indexes are complete."""
+        return os.path.join(get_index_dir(), _READY_MARKER)
+
+    def is_ready(self) -> bool:
+        """Check whether every stored credential is covered by the indexes."""
+        return os.path.exists(self._get_marker_path())
+
+    def mark_ready(self) -> None:
+        """Record that every stored credential is covered by the indexes."""
+        os.makedirs(get_index_dir(), exist_ok=True)
+        with open(self._get_marker_path(), 'w'):
+            pass
+
+    def mark_stale(self) -> None:
+        """Record that some stored credentials are missing from the indexes."""
+        try:
+            os.remove(self._get_marker_path())
+        except FileNotFoundError:
+            pass
+
+    def _get_entry_paths(self, document: Dict[str, Any]) -> Iterator[str]:
+        """Get the index files a credential document belongs to."""
+        for field in INDEXED_FIELDS:
+            value = document.get(field)
+            if value is not None:
+                yield get_index_file_path(field, value)
+
+        expiration_date = document.get('expiration_date')
+        if expiration_date is not None:
+            yield get_expiration_index_file_path(get_expiration_day(expiration_date))
+
+    def add(self, credential_id: str, document: Dict[str, Any],
+            previous: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Index a credential document.
+
+        Args:
+            credential_id (str): ID of the credential
+            document (dict): The credential document being written
+            previous (dict, optional): The document it replaces, whose
+                entries do not need to be written again
+        """
+        existing = set(self._get_entry_paths(previous)) if previous else set()
+        for path in self._get_entry_paths(document):
+            if path not in existing:
+                append_line(credential_id, path, fsync=self.durable)
+
+    def _read_ids(self, path: str) -> Set[str]:
+        """Read the credential IDs of an index file."""
+        try:
+            with open(path, 'r') as f:
+                return {line.strip() for line in f if line.strip()}
+        except FileNotFoundError:
+            return set()
+
+    def _read_expiration_ids(self, expires_after: Optional[int],
+                             expires_before: Optional[int]) -> Set[str]:
+        """Read the credential IDs of every expiration day overlapping a range."""
+        directory = os.path.dirname(get_expiration_index_file_path(0))
+        if not os.path.isdir(directory):
+            return set()
+
+        first_day = get_expiration_day(expires_after) if expires_after is not None else None
+        last_day = get_expiration_day(expires_before - 1) if expires_before is not None else None
+
+        ids = set()
+        for filename in os.listdir(directory):
+            if not filename.endswith('.ids'):
+                continue
+            day = int(filename[:-len('.ids')])
+            if first_day is not None and day < first_day:
+                continue
+            if last_day is not None and day > last_day:
+                continue
+            ids |= self._read_ids(os.path.join(directory, filename))
+        return ids
+
+    def lookup(self, issuer_id=None, holder_id=None, credential_type=None,
+               expires_after=None, expires_before=None) -> Optional[Set[str]]:
+        """
+        Get the IDs of the credentials that may match the given filters.
+
+        Returns:
+            set: Candidate credential IDs, or None if no filter was given
+                and every credential is a candidate
+        """
+        candidates = None
+        for field, value in (('holder_id', holder_id), ('issuer_id', issuer_id),
+                             ('type', credential_type)):
+            if value is None:
+                continue
+            ids = self._read_ids(get_index_file_path(field, value))
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                return set()
+
+        if expires_after is not None or expires_before is not None:
+            ids = self._read_expiration_ids(expires_after, expires_before)
+            candidates = ids if candidates is None else candidates & ids
+
+        return candidates
+
+    def rebuild(self, documents: Iterable[Dict[str, Any]]) -> int:
+        """
+        Rebuild the indexes from scratch.
+
+        Entries are buffered and written one file at a time, rather than
+        one append per entry. Until the rebuild completes, queries fall
+        back to scanning every credential.
+
+        Args:
+            documents: Every stored credential document
+
+        Returns:
+            int: Number of indexed credentials
+        """
+        index_dir = get_index_dir()
+        if os.path.isdir(index_dir):
+            shutil.rmtree(index_dir)
+
+        count = 0
+        buffered = {}
+        for document in documents:
+            for path in self._get_entry_paths(document):
+                buffered.setdefault(path, []).append(document['id'])
+            count += 1
+            if count % _REBUILD_BUFFER_SIZE == 0:
+                self._flush(buffered)
+
+        self._flush(buffered)
+        self.mark_ready()
+        return count
+
+    def _flush(self, buffered: Dict[str, list]) -> None:
+        """Append buffered entries to their index files and clear the buffer."""
+        for path, credential_ids in buffered.items():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a') as f:
+                f.write(''.join(f"{credential_id}\n" for credential_id in credential_ids))
+        buffered.clear()
@@ -0,0 +1,224 @@
+"""
+Per-stage latency histograms.
+
+Verification and issuance can time each of their stages (key lookup,
+root lookup, serialization, proof hashing, Ed25519, ...) with
+time.perf_counter_ns and record the durations in fixed-bucket
+histograms, one per (operation, stage) pair. Recording is off by
+default; while it is off, an instrumented call only pays for one
+attribute check per stage. Turn it on with get_metrics().enable() or
+the CREDENTIAL_METRICS=1 environment variable.
+
+The histograms can be dumped as JSON or in the Prometheus text format.
+"""
+
+import os
+import json
+import threading
+from bisect import bisect_left
+from time import perf_counter_ns
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+# Upper bounds of the histogram buckets in nanoseconds, from 1 µs to 1 s
+LATENCY_BUCKETS_NS = (
+    1_000, 2_500, 5_000, 10_000, 25_000, 50_000, 100_000, 250_000, 500_000,
+    1_000_000, 2_500_000, 5_000_000, 10_000_000, 25_000_000, 50_000_000,
+    100_000_000, 250_000_000, 500_000_000, 1_000_000_000,
+)
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets. Durations above the last bound
+    are counted in an overflow bucket.
+    """
+
+    def __init__(self, bounds: Sequence[int] = LATENCY_BUCKETS_NS):
+        """
+        Initialize the histogram.
+
+        Args:
+            bounds (sequence): Increasing upper bounds of the buckets in nanoseconds
+        """
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self._lock = threading.Lock()
+
+    def observe(self, duration_ns: int) -> None:
+        """Record a duration."""
+        index = bisect_left(self.bounds, duration_ns)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total_ns += duration_ns
+            if duration_ns > self.max_ns:
+                self.max_ns = duration_ns
+
+    def quantile(self, fraction: float) -> Optional[int]:
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in.
+
+        Returns:
+            int: Bound in nanoseconds (the maximum for the overflow bucket),
+                or None if nothing was recorded
+        """
+        with self._lock:
+            counts, count, max_ns = list(self.counts), self.count, self.max_ns
+        if not count:
+            return None
+        rank = fraction * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return min(self.bounds[index], max_ns) if index < len(self.bounds) else max_ns
+        return max_ns
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get the counts of the histogram as a JSON-serializable dict."""
+        with self._lock:
+            return {
+                'count': self.count,
+                'sum_ns': self.total_ns,
+                'max_ns': self.max_ns,
+                'buckets': [[bound, count] for bound, count in zip(self.bounds, self.counts)]
+                           + [[None, self.counts[-1]]],
+            }
+
+
+class StageTrace:
+    """
+    Times the stages of one operation. Each mark records the time since
+    the previous mark (or the start) under the given stage.
+    """
+
+    __slots__ = ('_metrics', '_operation', '_started', '_last')
+
+    def __init__(self, metrics: 'LatencyMetrics', operation: str):
+        self._metrics = metrics
+        self._operation = operation
+        self._started = self._last = perf_counter_ns()
+
+    def mark(self, stage: str) -> None:
+        """Record the time spent in a stage that just ended."""
+        now = perf_counter_ns()
+        self._metrics.observe(self._operation, stage, now - self._last)
+        self._last = now
+
+    def skip(self) -> None:
+        """Start the next stage now, without recording the time since the last mark."""
+        self._last = perf_counter_ns()
+
+    def finish(self) -> None:
+        """Record the duration of the whole operation under the 'total' stage."""
+        self._metrics.observe(self._operation, 'total', perf_counter_ns() - self._started)
+
+
+class LatencyMetrics:
+    """
+    Histograms of stage latencies, keyed by operation and stage.
+    """
+
+    def __init__(self, enabled: bool = False, bounds: Sequence[int] = LATENCY_BUCKETS_NS):
+        """
+        Initialize the metrics.
+
+        Args:
+            enabled (bool): Whether traces are recorded
+            bounds (sequence): Bucket bounds of the histograms in nanoseconds
+        """
+        self.enabled = enabled
+        self.bounds = tuple(bounds)
+        self._histograms = {}  # Map of (operation, stage) to Histogram
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        """Start recording."""
+        self.enabled = True
+
+    def disable(self) -> None:
+        """Stop recording. Recorded histograms are kept."""
+        self.enabled = False
+
+    def trace(self, operation: str) -> Optional[StageTrace]:
+        """
+        Start timing an operation.
+
+        Returns:
+            StageTrace: The trace, or None while recording is off
+        """
+        return StageTrace(self, operation) if self.enabled else None
+
+    def observe(self, operation: str, stage: str, duration_ns: int) -> None:
+        """Record the duration of a stage."""
+        histogram = self._histograms.get((operation, stage))
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault((operation, stage), Histogram(self.bounds))
+        histogram.observe(duration_ns)
+
+    def histograms(self) -> List[Tuple[str, str, Histogram]]:
+        """Get the (operation, stage, histogram) triples, sorted."""
+        with self._lock:
+            return sorted((operation, stage, histogram)
+                          for (operation, stage), histogram in self._histograms.items())
+
+    def reset(self) -> None:
+        """Drop all recorded histograms."""
+        with self._lock:
+            self._histograms = {}
+
+    def to_dict(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        Get the histograms as a dict of operation to stage to snapshot,
+        with p50, p90 and p99 estimates in nanoseconds.
+        """
+        result = {}
+        for operation, stage, histogram in self.histograms():
+            snapshot = histogram.snapshot()
+            for name, fraction in (('p50_ns', 0.50), ('p90_ns', 0.90), ('p99_ns', 0.99)):
+                snapshot[name] = histogram.quantile(fraction)
+            result.setdefault(operation, {})[stage] = snapshot
+        return result
+
+    def to_json(self, indent: Optional[int] = None) -> str:
+        """Dump the histograms as JSON."""
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(self, name: str = 'credential_stage_latency_seconds') -> str:
+        """
+        Dump the histograms in the Prometheus text exposition format, as
+        one histogram metric labelled by operation and stage.
+        """
+        lines = [
+            f"# HELP {name} Latency of the stages of credential operations.",
+            f"# TYPE {name} histogram",
+        ]
+        for operation, stage, histogram in self.histograms():
+            snapshot = histogram.snapshot()
+            labels = f'operation="{operation}",stage="{stage}"'
+            cumulative = 0
+            for bound, count in snapshot['buckets']:
+                cumulative += count
+                le = '+Inf' if bound is None else repr(bound / 1e9)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {snapshot["sum_ns"] / 1e9!r}')
+            lines.append(f'{name}_count{{{labels}}} {snapshot["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+_metrics = LatencyMetrics(enabled=os.environ.get('CREDENTIAL_METRICS') == '1')
+
+
+def get_metrics() -> LatencyMetrics:
+    """
+    Get the process-wide latency metrics.
+
+    Recording is off unless the CREDENTIAL_METRICS environment variable
+    is set to 1 or get_metrics().enable() is called.
+    """
+    return _metrics
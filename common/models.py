@@ -4,7 +4,7 @@ Data models for the privacy-preserving digital credential system.
 
 import json
 import time
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, fields
 from typing import Dict, Any, Optional, List, Tuple
 import warnings
 from common.crypto import CryptoManager
@@ -25,6 +25,13 @@ class Credential:
     non_revoked_proof: List[Tuple[str, bool]]
     expiration_date: Optional[int] = None
     signature: Optional[str] = None
+    # Selective disclosure: a secret salt per attribute, and the issuer's
+    # signature over the salted attribute digests (see presentation_signable_json)
+    disclosure_salts: Optional[Dict[str, str]] = None
+    presentation_signature: Optional[str] = None
+    # The holder's public key, certified by the issuer; the holder proves
+    # possession of it when answering a verifier's challenge
+    holder_public_key: Optional[str] = None
     
     def to_json(self):
         """Convert credential to JSON string."""
@@ -39,12 +46,95 @@ class Credential:
     def to_signable_json(self):
         """
         Convert credential to a JSON string that can be signed.
-        Excludes the signature field itself.
+        Excludes the signature fields themselves and the disclosure salts,
+        so credentials issued before selective disclosure keep verifying,
+        and the holder key if there is none, so credentials issued before
+        holder keys do too.
         """
-        data = asdict(self)
-        if 'signature' in data:
-            del data['signature']
+        # A shallow copy serializes the same as asdict() without deep-copying
+        data = {name: getattr(self, name) for name in _SIGNED_FIELDS}
+        if self.holder_public_key is None:
+            del data['holder_public_key']
         return json.dumps(data, sort_keys=True)
+    
+    def attribute_digests(self) -> List[str]:
+        """Get the salted digests of all attributes, in sorted order."""
+        return sorted(
+            attribute_digest(self.disclosure_salts[name], name, value)
+            for name, value in self.attributes.items()
+        )
+    
+    def to_presentation_signable_json(self):
+        """
+        Convert credential to the JSON string the presentation signature covers.
+        Requires disclosure salts.
+        """
+        return presentation_signable_json({
+            'credential_id': self.id,
+            'issuer_id': self.issuer_id,
+            'holder_id': self.holder_id,
+            'issuer_name': self.issuer_name,
+            'type': self.type,
+            'issuance_date': self.issuance_date,
+            'expiration_date': self.expiration_date,
+            'revocation_uuid': self.revocation_uuid,
+            'holder_public_key': self.holder_public_key,
+            'attribute_digests': self.attribute_digests(),
+        })
+
+
+# Presentation fields covered by the presentation signature, besides the attribute digests
+PRESENTATION_SIGNED_FIELDS = (
+    'credential_id', 'issuer_id', 'holder_id', 'issuer_name', 'type',
+    'issuance_date', 'expiration_date', 'revocation_uuid',
+)
+
+
+def attribute_digest(salt: str, name: str, value: Any) -> str:
+    """
+    Get the digest of one attribute. The salt keeps undisclosed values
+    from being guessed from their digest.
+    """
+    return CryptoManager.hash_sha256(json.dumps([salt, name, value]))
+
+
+def presentation_signable_json(presentation: Dict[str, Any]) -> str:
+    """
+    Get the JSON string signed for the presentations of a credential.
+    
+    It covers every attribute only through its salted digest, so a
+    presentation disclosing some attributes carries a signature the
+    verifier can check. The non-revocation proof is not covered; it is
+    checked against the issuer's root through the signed revocation_uuid.
+    The holder's public key is covered if the credential has one.
+    """
+    data = {field: presentation.get(field) for field in PRESENTATION_SIGNED_FIELDS}
+    if presentation.get('holder_public_key') is not None:
+        data['holder_public_key'] = presentation['holder_public_key']
+    data['attribute_digests'] = sorted(presentation['attribute_digests'])
+    return json.dumps(data, sort_keys=True)
+
+
+def holder_binding_json(challenge: str, credential_id: str, disclosed_digests: List[str]) -> str:
+    """
+    Get the JSON string a holder signs with their key to answer a challenge.
+    
+    It covers the challenge, the credential and the digests of the
+    disclosed attributes, so the signature cannot be moved to another
+    challenge or to other disclosed values.
+    """
+    return json.dumps({
+        'challenge': challenge,
+        'credential_id': credential_id,
+        'disclosed_digests': sorted(disclosed_digests),
+    }, sort_keys=True)
+
+
+# Credential fields covered by the credential signature
+_SIGNED_FIELDS = tuple(
+    field.name for field in fields(Credential)
+    if field.name not in ('signature', 'disclosure_salts', 'presentation_signature')
+)
 
 
 @dataclass
@@ -67,6 +157,19 @@ class RevocationList:
         data = json.loads(json_str)
         return cls(**data)
     
+    def copy(self) -> "RevocationList":
+        """
+        Return an independent copy of the revocation list.
+        Writers mutate a copy and publish it, so readers holding the
+        previous object keep a consistent snapshot.
+        """
+        return RevocationList(
+            issuer_id=self.issuer_id,
+            non_revoked=list(self.non_revoked),
+            root_hash=self.root_hash,
+            last_updated=self.last_updated,
+        )
+    
     def is_revoked(self, cred_uuid: str):
         """Check if a credential with the given index is revoked."""
         return cred_uuid in self.non_revoked
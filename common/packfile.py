@@ -0,0 +1,299 @@
+"""
+Packfile archive for credential records.
+
+Millions of small credential files cost inodes, open/close calls and
+backup time. A pack stores the records back to back in one append-only
+file and locates them through a sorted, fixed-width offset index:
+
+    credentials.pack   PACK_MAGIC, then one compact JSON record per line
+    credentials.idx    INDEX_MAGIC
+                       fan-out table: 256 big-endian uint64, entry i
+                           counting the records whose UUID starts with a
+                           byte <= i
+                       entries sorted by UUID: 16-byte UUID,
+                           uint64 offset, uint32 length
+    credentials.deleted  UUIDs of records deleted since they were packed
+
+Both files are memory-mapped. A lookup narrows the search range with the
+fan-out table, binary-searches the index and decodes the record straight
+from the mapped pack, so a cold read usually costs one page fault in the
+pack. Records are never rewritten in place: packing a credential again
+appends a new record, and the index points at the newest one.
+"""
+
+import os
+import json
+import mmap
+import uuid
+import struct
+import threading
+import heapq
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from common.utils import create_directory_if_not_exists
+
+
+PACK_MAGIC = b'CREDPACK\x00\x01'
+INDEX_MAGIC = b'CREDIDX\x00\x00\x01'
+
+_FANOUT = struct.Struct('>256Q')
+_ENTRY = struct.Struct('>16sQI')
+_INDEX_HEADER_SIZE = len(INDEX_MAGIC) + _FANOUT.size
+
+
+def _key_bytes(credential_id: str) -> Optional[bytes]:
+    """Get the 16-byte form of a credential UUID, or None if it is not a UUID."""
+    try:
+        return uuid.UUID(credential_id).bytes
+    except (ValueError, AttributeError, TypeError):
+        return None
+
+
+class _PackView:
+    """Read-only mapping of one generation of a pack and its index."""
+
+    def __init__(self, pack_path: str, index_path: str):
+        self.index_stat = os.stat(index_path)
+        self._files = []
+        self.index = self._map(index_path)
+        self.pack = self._map(pack_path)
+
+        if self.index[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError(f"Not a credential pack index: {index_path}")
+        self.fanout = _FANOUT.unpack_from(self.index, len(INDEX_MAGIC))
+        self.count = self.fanout[255]
+
+    def _map(self, path: str) -> mmap.mmap:
+        """Memory-map a whole file read-only."""
+        f = open(path, 'rb')
+        self._files.append(f)
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _entry(self, position: int) -> Tuple[bytes, int, int]:
+        """Get the (uuid, offset, length) index entry at a position."""
+        return _ENTRY.unpack_from(self.index, _INDEX_HEADER_SIZE + position * _ENTRY.size)
+
+    def find(self, key: bytes) -> Optional[Tuple[int, int]]:
+        """Binary-search the index for a UUID and get its (offset, length)."""
+        low = self.fanout[key[0] - 1] if key[0] > 0 else 0
+        high = self.fanout[key[0]]
+        while low < high:
+            middle = (low + high) // 2
+            entry_key, offset, length = self._entry(middle)
+            if entry_key < key:
+                low = middle + 1
+            elif entry_key > key:
+                high = middle
+            else:
+                return offset, length
+        return None
+
+    def read(self, offset: int, length: int) -> Dict[str, Any]:
+        """Decode the record at an offset of the pack."""
+        # json only accepts bytes, so the slice is copied once out of the mapping
+        return json.loads(self.pack[offset:offset + length])
+
+    def entries(self) -> Iterator[bytes]:
+        """Iterate over the raw index entries in UUID order."""
+        for position in range(self.count):
+            start = _INDEX_HEADER_SIZE + position * _ENTRY.size
+            yield self.index[start:start + _ENTRY.size]
+
+    def close(self) -> None:
+        """Unmap the files."""
+        self.index.close()
+        self.pack.close()
+        for f in self._files:
+            f.close()
+
+
+class CredentialPack:
+    """
+    An append-only archive of credential records with an mmap'd index.
+
+    Reads are safe from any number of threads. Packing is serialized
+    within the process and publishes a new index atomically; readers in
+    other processes pick it up the next time a lookup misses.
+    """
+
+    def __init__(self, directory: str, name: str = 'credentials'):
+        """
+        Open (without creating) the pack in a directory.
+
+        Args:
+            directory (str): Directory of the pack files
+            name (str): Base name of the pack files
+        """
+        self.directory = directory
+        self.pack_path = os.path.join(directory, f"{name}.pack")
+        self.index_path = os.path.join(directory, f"{name}.idx")
+        self.deleted_path = os.path.join(directory, f"{name}.deleted")
+        self._view = None
+        self._deleted = frozenset()
+        self._reload_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._reload()
+
+    def _reload(self, force: bool = False) -> bool:
+        """
+        Map the current generation of the pack if it changed.
+
+        Returns:
+            bool: True if a new generation was mapped
+        """
+        with self._reload_lock:
+            try:
+                index_stat = os.stat(self.index_path)
+            except FileNotFoundError:
+                return False
+
+            view = self._view
+            if (not force and view is not None
+                    and view.index_stat.st_ino == index_stat.st_ino
+                    and view.index_stat.st_mtime_ns == index_stat.st_mtime_ns):
+                return False
+
+            # The old view is left to the garbage collector, since other
+            # threads may still be reading from it
+            self._view = _PackView(self.pack_path, self.index_path)
+            self._deleted = frozenset(self._read_deleted())
+            return True
+
+    def _read_deleted(self) -> Iterator[str]:
+        """Read the IDs of deleted records."""
+        try:
+            with open(self.deleted_path, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        yield line.strip()
+        except FileNotFoundError:
+            return
+
+    def get(self, credential_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Read a credential record.
+
+        Args:
+            credential_id (str): ID of the credential
+
+        Returns:
+            dict: The credential document, or None if it is not packed
+        """
+        key = _key_bytes(credential_id)
+        if key is None:
+            return None
+
+        view = self._view
+        location = view.find(key) if view is not None else None
+        if location is None and self._reload():
+            # The pack may have been extended by another process
+            view = self._view
+            location = view.find(key)
+        if location is None or credential_id in self._deleted:
+            return None
+        return view.read(*location)
+
+    def __contains__(self, credential_id: str) -> bool:
+        key = _key_bytes(credential_id)
+        view = self._view
+        return (key is not None and view is not None and view.find(key) is not None
+                and credential_id not in self._deleted)
+
+    def keys(self) -> Iterator[str]:
+        """Iterate over the IDs of the packed credentials in UUID order."""
+        self._reload()
+        view = self._view
+        if view is None:
+            return
+        for entry in view.entries():
+            credential_id = str(uuid.UUID(bytes=entry[:16]))
+            if credential_id not in self._deleted:
+                yield credential_id
+
+    def add(self, documents: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        """
+        Append credential records to the pack and publish a new index.
+
+        Records whose ID is not a UUID are skipped; they stay loose.
+
+        Args:
+            documents: (credential_id, document) pairs to pack
+
+        Returns:
+            int: Number of packed records
+        """
+        with self._write_lock:
+            create_directory_if_not_exists(self.directory)
+            new_entries = []
+            packed_ids = set()
+
+            with open(self.pack_path, 'ab') as pack:
+                if pack.tell() == 0:
+                    pack.write(PACK_MAGIC)
+                for credential_id, document in documents:
+                    key = _key_bytes(credential_id)
+                    if key is None:
+                        continue
+                    record = json.dumps(document, separators=(',', ':')).encode('utf-8')
+                    offset = pack.tell()
+                    pack.write(record + b'\n')
+                    new_entries.append(_ENTRY.pack(key, offset, len(record)))
+                    packed_ids.add(credential_id)
+                pack.flush()
+                os.fsync(pack.fileno())
+
+            if not new_entries:
+                return 0
+
+            new_entries.sort()
+            self._write_index(new_entries)
+            if self._deleted & packed_ids:
+                self._write_deleted(self._deleted - packed_ids)
+            self._reload(force=True)
+            return len(new_entries)
+
+    def _write_index(self, new_entries: list) -> None:
+        """Merge new entries into the index and publish it atomically."""
+        view = self._view
+        existing = view.entries() if view is not None else iter(())
+
+        temp_path = self.index_path + '.tmp'
+        fanout = [0] * 256
+        with open(temp_path, 'wb') as index:
+            index.write(INDEX_MAGIC)
+            index.write(_FANOUT.pack(*fanout))
+
+            # Entries sort by UUID and then offset, so the last entry of
+            # a UUID is its newest record
+            previous = None
+            for entry in heapq.merge(existing, new_entries):
+                if previous is not None and previous[:16] != entry[:16]:
+                    index.write(previous)
+                    fanout[previous[0]] += 1
+                previous = entry
+            if previous is not None:
+                index.write(previous)
+                fanout[previous[0]] += 1
+
+            for i in range(1, 256):
+                fanout[i] += fanout[i - 1]
+            index.seek(len(INDEX_MAGIC))
+            index.write(_FANOUT.pack(*fanout))
+            index.flush()
+            os.fsync(index.fileno())
+
+        os.replace(temp_path, self.index_path)
+
+    def _write_deleted(self, deleted: Iterable[str]) -> None:
+        """Replace the list of deleted records."""
+        temp_path = self.deleted_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(''.join(f"{credential_id}\n" for credential_id in deleted))
+        os.replace(temp_path, self.deleted_path)
+
+    def delete(self, credential_id: str) -> None:
+        """Hide a packed record."""
+        with self._write_lock:
+            if credential_id in self:
+                self._write_deleted(self._deleted | {credential_id})
+                self._reload(force=True)
@@ -0,0 +1,767 @@
+"""
+Storage backends for the privacy-preserving digital credential system.
+
+Every persistent object is a JSON document identified by a collection
+name and a key (the object's ID). Issuers, revocation lists, wallets,
+the verifier and the demo layers only talk to a StorageBackend, so the
+on-disk representation can be swapped without touching them.
+
+Two backends are provided:
+- FileStorage: one JSON file per document under the data directory,
+  with credentials fanned out over hashed subdirectories.
+- SQLiteStorage: a single SQLite database (WAL mode) with indexed
+  credential columns, so credential queries do not scan every record.
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from common.indexes import CredentialIndex
+from common.packfile import CredentialPack
+from common.utils import (
+    save_json, load_json, json_exists, remove_json, write_batch, iter_sharded_keys,
+    save_lines, read_lines, append_lines,
+    get_data_dir, get_issuers_dir, get_credentials_dir, get_wallets_dir,
+    get_revocation_dir, get_packs_dir, get_keys_dir, get_issuer_file_path, get_issuer_keys_file_path, get_credential_file_path,
+    get_legacy_issuer_file_path, get_legacy_credential_file_path,
+    get_wallet_file_path, get_wallet_records_file_path, get_revocation_file_path
+)
+
+
+# Collection names
+ISSUERS = 'issuers'
+CREDENTIALS = 'credentials'
+WALLETS = 'wallets'
+REVOCATION_PUBLIC = 'revocation_public'
+REVOCATION_PRIVATE = 'revocation_private'
+META = 'meta'
+# Public keys of the issuers, readable without access to ISSUERS
+ISSUER_KEYS = 'issuer_keys'
+
+COLLECTIONS = (ISSUERS, CREDENTIALS, WALLETS, REVOCATION_PUBLIC, REVOCATION_PRIVATE, META,
+               ISSUER_KEYS)
+
+
+def _matches(document, issuer_id=None, holder_id=None, credential_type=None,
+             expires_after=None, expires_before=None) -> bool:
+    """Check a credential document against the filters of find_credentials."""
+    if issuer_id is not None and document.get('issuer_id') != issuer_id:
+        return False
+    if holder_id is not None and document.get('holder_id') != holder_id:
+        return False
+    if credential_type is not None and document.get('type') != credential_type:
+        return False
+    if expires_after is not None or expires_before is not None:
+        expiration_date = document.get('expiration_date')
+        if expiration_date is None:
+            return False
+        if expires_after is not None and expiration_date < expires_after:
+            return False
+        if expires_before is not None and expiration_date >= expires_before:
+            return False
+    return True
+
+
+class StorageBackend:
+    """
+    Interface of a document store.
+
+    Documents are JSON-serializable dicts. Reads return None (or the given
+    default) for missing documents, mirroring load_json.
+    """
+
+    def get(self, collection: str, key: str, default=None) -> Optional[Dict[str, Any]]:
+        """Get a document, or default if it does not exist."""
+        raise NotImplementedError
+
+    def get_readonly(self, collection: str, key: str, default=None) -> Optional[Dict[str, Any]]:
+        """
+        Get a document the caller will not modify.
+        Backends may serve it from a cache shared with other callers.
+        """
+        return self.get(collection, key, default)
+
+    def put(self, collection: str, key: str, document: Dict[str, Any]) -> None:
+        """Create or replace a document."""
+        raise NotImplementedError
+
+    def delete(self, collection: str, key: str) -> None:
+        """Delete a document if it exists."""
+        raise NotImplementedError
+
+    def exists(self, collection: str, key: str) -> bool:
+        """Check whether a document exists."""
+        return self.get(collection, key) is not None
+
+    def keys(self, collection: str) -> Iterator[str]:
+        """Iterate over the keys of a collection."""
+        raise NotImplementedError
+
+    def items(self, collection: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Iterate over the (key, document) pairs of a collection."""
+        for key in self.keys(collection):
+            document = self.get(collection, key)
+            if document is not None:
+                yield key, document
+
+    def find_credentials(
+        self,
+        issuer_id: Optional[str] = None,
+        holder_id: Optional[str] = None,
+        credential_type: Optional[str] = None,
+        expires_after: Optional[int] = None,
+        expires_before: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Find credential documents matching all of the given filters.
+
+        Args:
+            issuer_id (str, optional): ID of the issuing issuer
+            holder_id (str, optional): ID of the holder
+            credential_type (str, optional): Type of the credential
+            expires_after (int, optional): Inclusive lower bound on expiration_date
+            expires_before (int, optional): Exclusive upper bound on expiration_date
+
+        Returns:
+            Iterator over the matching credential documents
+        """
+        for _, document in self.items(CREDENTIALS):
+            if _matches(document, issuer_id, holder_id, credential_type,
+                        expires_after, expires_before):
+                yield document
+
+    def read_wallet_records(self, holder_id: str) -> List[str]:
+        """
+        Get the records of a wallet's container, in the order they were appended.
+
+        Args:
+            holder_id (str): ID of the holder
+
+        Returns:
+            list: The records (empty if the wallet has none)
+        """
+        raise NotImplementedError
+
+    def append_wallet_records(self, holder_id: str, records: List[str]) -> None:
+        """
+        Append records to a wallet's container without rewriting it.
+
+        Args:
+            holder_id (str): ID of the holder
+            records (list): Single-line text records
+        """
+        raise NotImplementedError
+
+    def replace_wallet_records(self, holder_id: str, records: List[str],
+                               expected_count: Optional[int] = None) -> bool:
+        """
+        Replace every record of a wallet's container, e.g. to compact it.
+
+        Args:
+            holder_id (str): ID of the holder
+            records (list): Single-line text records
+            expected_count (int, optional): Only replace the records if the
+                container still holds this many, i.e. nothing was appended
+                since it was read
+
+        Returns:
+            bool: Whether the records were replaced
+        """
+        raise NotImplementedError
+
+    def collection_version(self, collection: str) -> Optional[Any]:
+        """
+        Get a token that changes whenever a document of a collection is
+        written or deleted, so readers can skip reloading an unchanged
+        collection.
+
+        Returns:
+            The token, or None if the backend cannot tell changes apart
+            cheaply; callers must then assume the collection changed
+        """
+        return None
+
+    def rebuild_indexes(self) -> None:
+        """Rebuild any secondary indexes the backend maintains."""
+        pass
+
+    @contextmanager
+    def suspend_indexing(self):
+        """
+        Skip per-write index maintenance for bulk loads.
+        Callers must run rebuild_indexes() afterwards.
+        """
+        yield self
+
+    @contextmanager
+    def batch(self):
+        """
+        Group several writes together.
+        Backends with transactions commit them at once when the block exits.
+        """
+        yield self
+
+    def close(self) -> None:
+        """Release any resources held by the backend."""
+        pass
+
+
+# Serializes FileStorage batches; reentrant so nested batches join the outermost one
+_file_batch_lock = threading.RLock()
+
+
+class FileStorage(StorageBackend):
+    """
+    Stores every document as its own JSON file under the data directory.
+
+    Issuers live in their own directory and credentials are fanned out
+    over hashed subdirectories (credentials/ab/cd/<id>.json), so no single
+    directory grows with the number of credentials. Files still in the
+    flat layout used before sharding are read until they are migrated
+    with migrate_legacy_layout().
+
+    Credentials are indexed on write by issuer_id, holder_id, type and
+    expiration day (see common.indexes), so find_credentials only loads
+    credentials that can match. Data written before the indexes existed
+    is scanned until rebuild_indexes() has run.
+
+    pack_credentials() moves loose credential files into a packfile (see
+    common.packfile). Loose files always take precedence, so a credential
+    written again after packing is read from its new file.
+
+    Wallet records live in one append-only file per wallet
+    (wallets/wallet_<id>.records), read with a single sequential read.
+
+    Every file is replaced atomically. Writes inside batch() become
+    visible together when the batch exits; with durable=True that commit
+    is also a single fsync barrier for all files of the batch. Like a
+    database write transaction, a batch holds a process-wide lock until
+    it has committed, so read-modify-write updates of shared documents
+    (the issuer registry, revocation lists) made in concurrent batches
+    never start from a version another batch is about to replace.
+    get_readonly() is served from the process-wide document cache.
+    """
+
+    # Directory, file name prefix and file name suffix of each flat collection
+    _LAYOUT = {
+        ISSUERS: (get_issuers_dir, "", ".json"),
+        WALLETS: (get_wallets_dir, "wallet_", ".json"),
+        REVOCATION_PUBLIC: (get_revocation_dir, "revocation_list_", "_public.json"),
+        REVOCATION_PRIVATE: (get_revocation_dir, "revocation_list_", "_private.json"),
+        META: (get_data_dir, "", ".json"),
+        ISSUER_KEYS: (get_keys_dir, "", ".json"),
+    }
+
+    # File name prefix of each collection in the legacy flat credentials directory
+    _LEGACY_PREFIX = {
+        ISSUERS: "issuer_",
+        CREDENTIALS: "credential_",
+    }
+
+    def __init__(self, durable: bool = False):
+        """
+        Initialize a file store.
+
+        Args:
+            durable (bool): fsync every write (or every batch) to disk
+        """
+        self.durable = durable
+        self.credential_index = CredentialIndex(durable=durable)
+        self.credential_pack = CredentialPack(get_packs_dir())
+        self._checked_unindexed = False
+        self._indexing = True
+        # Serializes wallet record appends with the compaction of their file
+        self._wallet_records_lock = threading.Lock()
+
+    def _indexes_usable(self) -> bool:
+        """
+        Check whether the credential indexes cover every stored credential.
+        A store without credentials is marked as indexed before it gets any.
+        """
+        if self.credential_index.is_ready():
+            return True
+        if not self._checked_unindexed:
+            self._checked_unindexed = True
+            if next(iter(self.keys(CREDENTIALS)), None) is None:
+                self.credential_index.mark_ready()
+                return True
+        return False
+
+    def _get_path(self, collection: str, key: str) -> str:
+        """Get the file path of a document."""
+        if collection == ISSUERS:
+            return get_issuer_file_path(key)
+        if collection == CREDENTIALS:
+            return get_credential_file_path(key)
+        if collection == WALLETS:
+            return get_wallet_file_path(key)
+        if collection == REVOCATION_PUBLIC:
+            return get_revocation_file_path(key, public=True)
+        if collection == REVOCATION_PRIVATE:
+            return get_revocation_file_path(key, public=False)
+        if collection == META:
+            return os.path.join(get_data_dir(), f"{key}.json")
+        if collection == ISSUER_KEYS:
+            return get_issuer_keys_file_path(key)
+        raise ValueError(f"Unknown collection: {collection}")
+
+    def _get_legacy_path(self, collection: str, key: str) -> Optional[str]:
+        """Get the pre-sharding file path of a document, if it had another one."""
+        if collection == ISSUERS:
+            return get_legacy_issuer_file_path(key)
+        if collection == CREDENTIALS:
+            return get_legacy_credential_file_path(key)
+        return None
+
+    def get(self, collection, key, default=None):
+        path = self._get_path(collection, key)
+        document = load_json(path)
+        if document is None:
+            legacy_path = self._get_legacy_path(collection, key)
+            if legacy_path:
+                # Check the new path again in case the file was migrated in between
+                document = load_json(legacy_path) or load_json(path)
+        if document is None and collection == CREDENTIALS:
+            # Check the new path again in case the file was packed in between
+            document = self.credential_pack.get(key) or load_json(path)
+        return default if document is None else document
+
+    def get_readonly(self, collection, key, default=None):
+        document = load_json(self._get_path(collection, key), cached=True)
+        if document is None:
+            return self.get(collection, key, default)
+        return document
+
+    def put(self, collection, key, document):
+        if collection == CREDENTIALS and self._indexing:
+            self._indexes_usable()
+            self.credential_index.add(key, document, previous=self.get(CREDENTIALS, key))
+        save_json(document, self._get_path(collection, key), fsync=self.durable)
+
+    def delete(self, collection, key):
+        remove_json(self._get_path(collection, key))
+        legacy_path = self._get_legacy_path(collection, key)
+        if legacy_path:
+            remove_json(legacy_path)
+        if collection == CREDENTIALS:
+            self.credential_pack.delete(key)
+
+    def exists(self, collection, key):
+        path = self._get_path(collection, key)
+        legacy_path = self._get_legacy_path(collection, key)
+        return (json_exists(path)
+                or (legacy_path is not None and json_exists(legacy_path))
+                or (collection == CREDENTIALS and key in self.credential_pack)
+                or json_exists(path))
+
+    def keys(self, collection):
+        if collection == CREDENTIALS:
+            yield from iter_sharded_keys(get_credentials_dir())
+            for key in self.credential_pack.keys():
+                if not os.path.exists(self._get_path(CREDENTIALS, key)):
+                    yield key
+        else:
+            get_dir, prefix, suffix = self._LAYOUT[collection]
+            directory = get_dir()
+            if os.path.isdir(directory):
+                for filename in os.listdir(directory):
+                    if (filename.startswith(prefix) and filename.endswith(suffix)
+                            and not filename.startswith('.')):
+                        yield filename[len(prefix):len(filename) - len(suffix)]
+
+        yield from self._legacy_keys(collection)
+
+    def _legacy_keys(self, collection):
+        """Iterate over the keys of a collection still in the flat layout."""
+        prefix = self._LEGACY_PREFIX.get(collection)
+        if prefix is None or not os.path.isdir(get_credentials_dir()):
+            return
+
+        for filename in os.listdir(get_credentials_dir()):
+            if filename.startswith(prefix) and filename.endswith('.json'):
+                key = filename[len(prefix):-len('.json')]
+                # Skip files migrated since the new layout was listed
+                if not os.path.exists(self._get_path(collection, key)):
+                    yield key
+
+    def collection_version(self, collection):
+        if collection not in self._LAYOUT:
+            return None
+        # Files are replaced by renames, which always touch their directory.
+        # Other files sharing the directory only cause spurious changes.
+        try:
+            stat = os.stat(self._LAYOUT[collection][0]())
+        except FileNotFoundError:
+            return ()
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def find_credentials(self, issuer_id=None, holder_id=None, credential_type=None,
+                         expires_after=None, expires_before=None):
+        candidates = None
+        if self._indexes_usable():
+            candidates = self.credential_index.lookup(
+                issuer_id, holder_id, credential_type, expires_after, expires_before
+            )
+
+        if candidates is None:
+            yield from super().find_credentials(
+                issuer_id, holder_id, credential_type, expires_after, expires_before
+            )
+            return
+
+        for credential_id in sorted(candidates):
+            document = self.get(CREDENTIALS, credential_id)
+            # Index entries are never removed, so check the document itself
+            if document is not None and _matches(document, issuer_id, holder_id, credential_type,
+                                                 expires_after, expires_before):
+                yield document
+
+    def rebuild_indexes(self):
+        self.credential_index.rebuild(document for _, document in self.items(CREDENTIALS))
+
+    @contextmanager
+    def suspend_indexing(self):
+        # Queries scan instead of trusting the incomplete indexes
+        self.credential_index.mark_stale()
+        self._checked_unindexed = True
+        self._indexing = False
+        try:
+            yield self
+        finally:
+            self._indexing = True
+
+    def read_wallet_records(self, holder_id):
+        return read_lines(get_wallet_records_file_path(holder_id)) or []
+
+    def append_wallet_records(self, holder_id, records):
+        with self._wallet_records_lock:
+            append_lines(records, get_wallet_records_file_path(holder_id), fsync=self.durable)
+
+    def replace_wallet_records(self, holder_id, records, expected_count=None):
+        path = get_wallet_records_file_path(holder_id)
+        with self._wallet_records_lock:
+            if expected_count is not None and len(read_lines(path) or []) != expected_count:
+                return False
+            save_lines(records, path, fsync=self.durable)
+        return True
+
+    def _iter_loose_credentials(self) -> Iterator[Tuple[str, str]]:
+        """Iterate over the (credential_id, path) of credential files."""
+        for key in iter_sharded_keys(get_credentials_dir()):
+            yield key, self._get_path(CREDENTIALS, key)
+        for key in self._legacy_keys(CREDENTIALS):
+            yield key, self._get_legacy_path(CREDENTIALS, key)
+
+    def pack_credentials(self, chunk_size: int = 100000, progress=None) -> int:
+        """
+        Move loose credential files into the packfile.
+
+        Credentials are packed in chunks; each chunk is appended to the
+        pack, published with a new index and only then removed from its
+        loose files. A file changed while its chunk was being packed is
+        left in place, since it is newer than the packed copy.
+
+        Args:
+            chunk_size (int): Number of credentials per chunk
+            progress (callable, optional): Called with the number of
+                credentials packed so far after each chunk
+
+        Returns:
+            int: Number of packed credentials
+        """
+        total = 0
+        chunk = []
+
+        def flush():
+            nonlocal total
+            self.credential_pack.add((key, document) for key, _, _, document in chunk)
+            for _, path, stat, _ in chunk:
+                try:
+                    current = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if (current.st_ino, current.st_mtime_ns) == (stat.st_ino, stat.st_mtime_ns):
+                    remove_json(path)
+            total += len(chunk)
+            chunk.clear()
+            if progress:
+                progress(total)
+
+        for key, path in self._iter_loose_credentials():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            document = load_json(path)
+            if document is None:
+                continue
+            chunk.append((key, path, stat, document))
+            if len(chunk) >= chunk_size:
+                flush()
+
+        if chunk:
+            flush()
+        return total
+
+    @contextmanager
+    def batch(self):
+        # The lock is released only after the outermost batch has committed
+        with _file_batch_lock, write_batch(fsync=self.durable):
+            yield self
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    Stores documents in a single SQLite database.
+
+    Credentials live in their own table with indexed issuer_id, holder_id,
+    type and expiration_date columns; all other collections share a
+    generic documents table. Wallet records are rows of a wallet_records
+    table in insertion order. The database runs in WAL mode so readers do
+    not block the writer. Each thread gets its own connection.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS documents (
+            collection TEXT NOT NULL,
+            key TEXT NOT NULL,
+            body TEXT NOT NULL,
+            PRIMARY KEY (collection, key)
+        );
+        CREATE TABLE IF NOT EXISTS credentials (
+            id TEXT PRIMARY KEY,
+            issuer_id TEXT,
+            holder_id TEXT,
+            type TEXT,
+            expiration_date INTEGER,
+            body TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_credentials_issuer_id ON credentials (issuer_id);
+        CREATE INDEX IF NOT EXISTS idx_credentials_holder_id ON credentials (holder_id);
+        CREATE INDEX IF NOT EXISTS idx_credentials_type ON credentials (type);
+        CREATE INDEX IF NOT EXISTS idx_credentials_expiration_date ON credentials (expiration_date);
+        CREATE TABLE IF NOT EXISTS wallet_records (
+            holder_id TEXT NOT NULL,
+            record TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_wallet_records_holder_id ON wallet_records (holder_id);
+    """
+
+    def __init__(self, path: Optional[str] = None, durable: bool = False):
+        """
+        Open (and create if needed) an SQLite store.
+
+        Args:
+            path (str, optional): Path of the database file.
+                Defaults to storage.db in the data directory.
+            durable (bool): Sync the WAL on every commit instead of
+                only at checkpoints
+        """
+        self.path = path or os.path.join(get_data_dir(), 'storage.db')
+        self.durable = durable
+        self._local = threading.local()
+        self._connect().executescript(self._SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get the connection of the calling thread, opening it if needed."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # Autocommit mode; batch() opens explicit transactions
+            connection = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(f"PRAGMA synchronous={'FULL' if self.durable else 'NORMAL'}")
+            self._local.connection = connection
+            self._local.batch_depth = 0
+        return connection
+
+    def get(self, collection, key, default=None):
+        if collection == CREDENTIALS:
+            row = self._connect().execute(
+                "SELECT body FROM credentials WHERE id = ?", (key,)
+            ).fetchone()
+        else:
+            row = self._connect().execute(
+                "SELECT body FROM documents WHERE collection = ? AND key = ?",
+                (collection, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def put(self, collection, key, document):
+        body = json.dumps(document)
+        if collection == CREDENTIALS:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO credentials "
+                "(id, issuer_id, holder_id, type, expiration_date, body) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, document.get('issuer_id'), document.get('holder_id'),
+                 document.get('type'), document.get('expiration_date'), body)
+            )
+        else:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO documents (collection, key, body) VALUES (?, ?, ?)",
+                (collection, key, body)
+            )
+
+    def delete(self, collection, key):
+        if collection == CREDENTIALS:
+            self._connect().execute("DELETE FROM credentials WHERE id = ?", (key,))
+        else:
+            self._connect().execute(
+                "DELETE FROM documents WHERE collection = ? AND key = ?", (collection, key)
+            )
+
+    def keys(self, collection):
+        if collection == CREDENTIALS:
+            cursor = self._connect().execute("SELECT id FROM credentials")
+        else:
+            cursor = self._connect().execute(
+                "SELECT key FROM documents WHERE collection = ?", (collection,)
+            )
+        for (key,) in cursor:
+            yield key
+
+    def items(self, collection):
+        if collection == CREDENTIALS:
+            cursor = self._connect().execute("SELECT id, body FROM credentials")
+        else:
+            cursor = self._connect().execute(
+                "SELECT key, body FROM documents WHERE collection = ?", (collection,)
+            )
+        for key, body in cursor:
+            yield key, json.loads(body)
+
+    def find_credentials(self, issuer_id=None, holder_id=None, credential_type=None,
+                         expires_after=None, expires_before=None):
+        clauses = []
+        params = []
+        for column, value in (('issuer_id', issuer_id), ('holder_id', holder_id),
+                              ('type', credential_type)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if expires_after is not None:
+            clauses.append("expiration_date >= ?")
+            params.append(expires_after)
+        if expires_before is not None:
+            clauses.append("expiration_date < ?")
+            params.append(expires_before)
+
+        query = "SELECT body FROM credentials"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        for (body,) in self._connect().execute(query, params):
+            yield json.loads(body)
+
+    def read_wallet_records(self, holder_id):
+        cursor = self._connect().execute(
+            "SELECT record FROM wallet_records WHERE holder_id = ? ORDER BY rowid", (holder_id,)
+        )
+        return [record for (record,) in cursor]
+
+    def append_wallet_records(self, holder_id, records):
+        with self.batch():
+            self._connect().executemany(
+                "INSERT INTO wallet_records (holder_id, record) VALUES (?, ?)",
+                ((holder_id, record) for record in records)
+            )
+
+    def replace_wallet_records(self, holder_id, records, expected_count=None):
+        connection = self._connect()
+        with self.batch():
+            if expected_count is not None:
+                (count,) = connection.execute(
+                    "SELECT COUNT(*) FROM wallet_records WHERE holder_id = ?", (holder_id,)
+                ).fetchone()
+                if count != expected_count:
+                    return False
+            connection.execute("DELETE FROM wallet_records WHERE holder_id = ?", (holder_id,))
+            connection.executemany(
+                "INSERT INTO wallet_records (holder_id, record) VALUES (?, ?)",
+                ((holder_id, record) for record in records)
+            )
+        return True
+
+    def rebuild_indexes(self):
+        self._connect().execute("REINDEX credentials")
+        self._connect().execute("ANALYZE credentials")
+
+    @contextmanager
+    def batch(self):
+        connection = self._connect()
+        outermost = self._local.batch_depth == 0
+        if outermost:
+            connection.execute("BEGIN IMMEDIATE")
+        self._local.batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._local.batch_depth -= 1
+            if outermost:
+                connection.execute("ROLLBACK")
+            raise
+        else:
+            self._local.batch_depth -= 1
+            if outermost:
+                connection.execute("COMMIT")
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def create_storage(kind: str, path: Optional[str] = None, durable: bool = False) -> StorageBackend:
+    """
+    Create a storage backend by name.
+
+    Args:
+        kind (str): Either 'file' or 'sqlite'
+        path (str, optional): Database path for the SQLite backend
+        durable (bool): Whether committed writes must survive a crash
+
+    Returns:
+        StorageBackend: The new backend
+    """
+    if kind == 'file':
+        return FileStorage(durable=durable)
+    if kind == 'sqlite':
+        return SQLiteStorage(path, durable=durable)
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+def get_storage() -> StorageBackend:
+    """
+    Get the process-wide storage backend.
+
+    Defaults to FileStorage; set the CREDENTIAL_STORAGE environment
+    variable to 'sqlite' (and optionally CREDENTIAL_STORAGE_PATH) or call
+    set_storage() to use another backend. Set CREDENTIAL_STORAGE_DURABLE=1
+    to make committed writes crash-safe.
+    """
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage(
+                    os.environ.get('CREDENTIAL_STORAGE', 'file'),
+                    os.environ.get('CREDENTIAL_STORAGE_PATH'),
+                    os.environ.get('CREDENTIAL_STORAGE_DURABLE') == '1'
+                )
+    return _storage
+
+
+def set_storage(storage: StorageBackend) -> None:
+    """Replace the process-wide storage backend."""
+    global _storage
+    with _storage_lock:
+        _storage = storage
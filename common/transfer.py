@@ -0,0 +1,204 @@
+"""
+Streaming export and import of a whole credential store.
+
+A dump is NDJSON: a header line followed by one line per document,
+
+    {"format": "credential-store", "version": 1, "exported_at": ...}
+    {"collection": "issuers", "key": "<id>", "document": {...}}
+
+in the order issuers, published issuer keys, revocation lists, wallets,
+wallet records, credentials. The records of a wallet's container are
+exported as one {"records": [...]} document per wallet. Documents are
+streamed one at a time in both directions, so memory use does not
+depend on the size of the store. Derived data (public revocation roots,
+the issuer registry, secondary indexes) is not exported; it is rebuilt
+after an import.
+"""
+
+import io
+import gzip
+import json
+from typing import IO, Callable, Dict, Iterator, Optional
+
+from common.crypto import CryptoManager
+from common.storage import (
+    StorageBackend, get_storage, ISSUERS, CREDENTIALS, WALLETS,
+    REVOCATION_PUBLIC, REVOCATION_PRIVATE, ISSUER_KEYS
+)
+from common.utils import current_timestamp
+from issuer.registry import rebuild_registry
+
+
+EXPORT_FORMAT = 'credential-store'
+EXPORT_VERSION = 1
+
+# Pseudo-collection of the wallet container records
+WALLET_RECORDS = 'wallet_records'
+
+# Exported collections, in dump order
+EXPORTED_COLLECTIONS = (ISSUERS, ISSUER_KEYS, REVOCATION_PRIVATE, WALLETS, WALLET_RECORDS, CREDENTIALS)
+
+_GZIP_MAGIC = b'\x1f\x8b'
+
+
+def open_dump_for_writing(binary_stream: IO[bytes], compress: bool = False) -> IO[str]:
+    """Wrap a binary stream as a text stream for a dump, optionally gzipped."""
+    if compress:
+        binary_stream = gzip.GzipFile(fileobj=binary_stream, mode='wb')
+    return io.TextIOWrapper(binary_stream, encoding='utf-8', newline='\n')
+
+
+def open_dump_for_reading(binary_stream: IO[bytes]) -> IO[str]:
+    """Wrap a binary stream of a dump as text, detecting gzip compression."""
+    buffered = binary_stream if hasattr(binary_stream, 'peek') else io.BufferedReader(binary_stream)
+    if buffered.peek(2)[:2] == _GZIP_MAGIC:
+        buffered = gzip.GzipFile(fileobj=buffered, mode='rb')
+    return io.TextIOWrapper(buffered, encoding='utf-8')
+
+
+def export_data(output: IO[str], storage: Optional[StorageBackend] = None,
+                progress: Optional[Callable[[int], None]] = None) -> Dict[str, int]:
+    """
+    Stream every exported document of a store as NDJSON.
+
+    Args:
+        output: Text stream to write the dump to
+        storage (StorageBackend, optional): Storage to export instead of the default
+        progress (callable, optional): Called with the number of documents
+            written so far, every 100000 documents
+
+    Returns:
+        dict: Number of exported documents per collection
+    """
+    storage = storage or get_storage()
+    counts = {collection: 0 for collection in EXPORTED_COLLECTIONS}
+    total = 0
+
+    output.write(json.dumps({
+        'format': EXPORT_FORMAT,
+        'version': EXPORT_VERSION,
+        'exported_at': current_timestamp(),
+    }) + '\n')
+
+    for collection in EXPORTED_COLLECTIONS:
+        for key, document in _iter_documents(storage, collection):
+            output.write(json.dumps(
+                {'collection': collection, 'key': key, 'document': document},
+                separators=(',', ':')
+            ) + '\n')
+            counts[collection] += 1
+            total += 1
+            if progress and total % 100000 == 0:
+                progress(total)
+
+    output.flush()
+    return counts
+
+
+def _iter_documents(storage: StorageBackend, collection: str):
+    """Iterate over the (key, document) pairs of an exported collection."""
+    if collection != WALLET_RECORDS:
+        yield from storage.items(collection)
+        return
+    for holder_id in storage.keys(WALLETS):
+        records = storage.read_wallet_records(holder_id)
+        if records:
+            yield holder_id, {'records': records}
+
+
+def _read_records(lines: Iterator[str]) -> Iterator[dict]:
+    """Parse and validate the lines of a dump."""
+    header = json.loads(next(lines, 'null'))
+    if not isinstance(header, dict) or header.get('format') != EXPORT_FORMAT:
+        raise ValueError("Not a credential store dump.")
+    if header.get('version') != EXPORT_VERSION:
+        raise ValueError(f"Unsupported dump version: {header.get('version')}")
+
+    for line_number, line in enumerate(lines, 2):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if record.get('collection') not in EXPORTED_COLLECTIONS:
+            raise ValueError(f"Unknown collection on line {line_number}: {record.get('collection')}")
+        yield record
+
+
+def import_data(input_stream: IO[str], storage: Optional[StorageBackend] = None,
+                batch_size: int = 1000,
+                progress: Optional[Callable[[int], None]] = None) -> Dict[str, int]:
+    """
+    Load a dump into a store.
+
+    Documents are written in batches of batch_size, so each batch is one
+    transaction (SQLite) or one fsync barrier (durable file storage).
+    Per-write index maintenance is suspended; once everything is loaded,
+    the public revocation roots, the issuer registry and the secondary
+    indexes are rebuilt in one pass each. The registry then lists the
+    imported issuers along with those already in the store.
+
+    Args:
+        input_stream: Text stream of the dump
+        storage (StorageBackend, optional): Storage to import into instead of the default
+        batch_size (int): Number of documents per write batch
+        progress (callable, optional): Called with the number of documents
+            imported so far, about every 100000 documents
+
+    Returns:
+        dict: Number of imported documents per collection
+    """
+    storage = storage or get_storage()
+    counts = {collection: 0 for collection in EXPORTED_COLLECTIONS}
+    revocation_issuer_ids = []
+    pending = []
+    reported = 0
+
+    def flush():
+        nonlocal reported
+        with storage.batch():
+            for record in pending:
+                if record['collection'] == WALLET_RECORDS:
+                    storage.replace_wallet_records(record['key'], record['document']['records'])
+                else:
+                    storage.put(record['collection'], record['key'], record['document'])
+        pending.clear()
+        total = sum(counts.values())
+        if progress and total // 100000 > reported // 100000:
+            progress(total)
+        reported = total
+
+    with storage.suspend_indexing():
+        for record in _read_records(iter(input_stream)):
+            pending.append(record)
+            counts[record['collection']] += 1
+            if record['collection'] == REVOCATION_PRIVATE:
+                revocation_issuer_ids.append(record['key'])
+            if len(pending) >= batch_size:
+                flush()
+        if pending:
+            flush()
+
+        rebuild_revocation_roots(revocation_issuer_ids, storage)
+
+    storage.rebuild_indexes()
+    rebuild_registry(storage)
+    return counts
+
+
+def rebuild_revocation_roots(issuer_ids, storage: Optional[StorageBackend] = None) -> None:
+    """
+    Recompute the public hash-tree roots from the private revocation lists.
+
+    Args:
+        issuer_ids: IDs of the issuers whose roots to rebuild
+        storage (StorageBackend, optional): Storage to use instead of the default
+    """
+    storage = storage or get_storage()
+    with storage.batch():
+        for issuer_id in issuer_ids:
+            private_data = storage.get(REVOCATION_PRIVATE, issuer_id)
+            if private_data is None:
+                continue
+            non_revoked = private_data.get('non_revoked', [])
+            # An empty list keeps the empty root written when it was created
+            root_hash = CryptoManager.generate_root_hash(non_revoked) if non_revoked else ""
+            storage.put(REVOCATION_PUBLIC, issuer_id, {"root_hash": root_hash})
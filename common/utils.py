@@ -6,8 +6,14 @@ import os
 import json
 import time
 import uuid
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 
+from common.cache import get_document_cache
+
 
 def generate_id():
     """Generate a unique ID for credentials, issuers, or holders."""
@@ -24,27 +30,379 @@ def create_directory_if_not_exists(directory):
     Path(directory).mkdir(parents=True, exist_ok=True)
 
 
-def save_json(data, filepath):
-    """Save data as JSON to the specified filepath."""
+class WriteBatch:
+    """
+    A group of JSON writes committed together.
+
+    Files saved while a batch is active are written to temporary files
+    next to their targets and only renamed into place on commit. With
+    fsync enabled, commit is a single durability barrier: every temporary
+    file is flushed to disk, all of them are renamed, and each parent
+    directory is flushed once. Until then other readers keep seeing the
+    previous version of each file; the writing thread reads its own
+    pending writes.
+    """
+
+    def __init__(self, fsync=True):
+        self.fsync = fsync
+        self.pending = {}  # Target path -> temporary file path
+        self.created_directories = set()  # Parents of newly created directories
+        self.appended_files = set()  # Files appended to in place, flushed on commit
+
+    def track_append(self, filepath):
+        """Register a file appended to in place so the commit flushes it."""
+        self.appended_files.add(filepath)
+
+    def stage(self, filepath, temp_path):
+        """Register a temporary file to be renamed to filepath on commit."""
+        previous = self.pending.pop(filepath, None)
+        if previous:
+            _remove_quietly(previous)
+        self.pending[filepath] = temp_path
+
+    def discard(self, filepath):
+        """Drop a pending write to filepath."""
+        temp_path = self.pending.pop(filepath, None)
+        if temp_path:
+            _remove_quietly(temp_path)
+
+    def commit(self):
+        """Flush and rename all pending files into place."""
+        if self.fsync:
+            for temp_path in self.pending.values():
+                _fsync_file(temp_path)
+            for filepath in self.appended_files:
+                _fsync_file(filepath)
+        self.appended_files.clear()
+
+        directories = set(self.created_directories)
+        for filepath, temp_path in self.pending.items():
+            os.replace(temp_path, filepath)
+            get_document_cache().invalidate(filepath)
+            directories.add(os.path.dirname(filepath))
+        self.pending.clear()
+        self.created_directories.clear()
+
+        if self.fsync:
+            for directory in directories:
+                _fsync_directory(directory)
+
+    def abort(self):
+        """Remove all pending temporary files."""
+        for temp_path in self.pending.values():
+            _remove_quietly(temp_path)
+        self.pending.clear()
+
+
+_batch_state = threading.local()
+
+# Process umask, read once since querying it requires setting it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _current_batch():
+    """Get the write batch active in the calling thread, if any."""
+    return getattr(_batch_state, 'batch', None)
+
+
+@contextmanager
+def write_batch(fsync=True):
+    """
+    Defer the commit of every save_json call in the block to its end.
+
+    Nested batches join the outermost one. If the block raises, none of
+    its writes become visible.
+
+    Args:
+        fsync (bool): Whether the commit should be durable
+    """
+    if _current_batch() is not None:
+        yield _current_batch()
+        return
+
+    batch = WriteBatch(fsync=fsync)
+    _batch_state.batch = batch
+    try:
+        yield batch
+    except BaseException:
+        batch.abort()
+        raise
+    else:
+        batch.commit()
+    finally:
+        _batch_state.batch = None
+
+
+def _remove_quietly(filepath):
+    """Remove a file, ignoring it if it is already gone."""
+    try:
+        os.remove(filepath)
+    except FileNotFoundError:
+        pass
+
+
+def _fsync_file(filepath):
+    """Flush a file's contents to disk."""
+    fd = os.open(filepath, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_directory(directory):
+    """Flush a directory entry to disk (no-op where unsupported)."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _create_parent_directories(directory):
+    """
+    Create a directory and its missing parents.
+
+    Returns:
+        list: The directories that had to be created, so that the entries
+            linking them into their parents can be flushed too
+    """
+    missing = []
+    while directory and not os.path.isdir(directory):
+        missing.append(directory)
+        directory = os.path.dirname(directory)
+    if missing:
+        create_directory_if_not_exists(missing[0])
+    return missing
+
+
+def _save_atomically(filepath, write, fsync=False):
+    """
+    Write a file through a temporary file renamed over the target.
+
+    Args:
+        filepath (str): Target file path
+        write (callable): Writes the contents to an open text file
+        fsync (bool): Flush the file and its directory to disk before
+            returning. Ignored inside a write_batch, which decides itself.
+    """
+    batch = _current_batch()
+    
     # Ensure the parent directory exists
-    create_directory_if_not_exists(os.path.dirname(filepath))
+    directory = os.path.dirname(filepath)
+    created_directories = _create_parent_directories(directory)
     
-    # Write the JSON data
-    with open(filepath, 'w') as f:
-        json.dump(data, f, indent=2)
+    # Write the data to a temporary file in the same directory
+    fd, temp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(filepath)}.", suffix=".tmp"
+    )
+    try:
+        if hasattr(os, 'fchmod'):
+            # mkstemp creates the file as 0600; use the permissions open() would
+            os.fchmod(fd, 0o666 & ~_UMASK)
+        with os.fdopen(fd, 'w') as f:
+            write(f)
+            if fsync and batch is None:
+                f.flush()
+                os.fsync(f.fileno())
+    except BaseException:
+        _remove_quietly(temp_path)
+        raise
+
+    if batch is not None:
+        batch.stage(filepath, temp_path)
+        batch.created_directories.update(os.path.dirname(d) for d in created_directories)
+        return
+
+    os.replace(temp_path, filepath)
+    get_document_cache().invalidate(filepath)
+    if fsync:
+        _fsync_directory(directory)
+        for created_directory in created_directories:
+            _fsync_directory(os.path.dirname(created_directory))
+
+
+def save_json(data, filepath, fsync=False):
+    """
+    Save data as JSON to the specified filepath.
+
+    The data is written to a temporary file which is then renamed over
+    the target, so readers see either the old or the new file and never
+    a truncated one. Inside a write_batch the rename is deferred to the
+    batch commit.
+
+    Args:
+        data: JSON-serializable data
+        filepath (str): Target file path
+        fsync (bool): Flush the file and its directory to disk before
+            returning. Ignored inside a write_batch, which decides itself.
+    """
+    _save_atomically(filepath, lambda f: json.dump(data, f, indent=2), fsync=fsync)
+
+
+def save_lines(lines, filepath, fsync=False):
+    """
+    Replace a file of lines atomically, like save_json.
+
+    Args:
+        lines: Lines of text, without trailing newlines
+        filepath (str): Target file path
+        fsync (bool): Flush the file and its directory to disk before
+            returning. Ignored inside a write_batch, which decides itself.
+    """
+    _save_atomically(filepath, lambda f: f.write(''.join(f"{line}\n" for line in lines)),
+                     fsync=fsync)
+
+
+def read_lines(filepath):
+    """
+    Read the complete lines of a file with a single read.
+
+    A last line without its newline was cut short by an interrupted
+    append and is left out.
+
+    Args:
+        filepath (str): Path of the file
+
+    Returns:
+        list: The lines without their newlines, or None if the file does not exist
+    """
+    try:
+        with open(_resolve_pending(filepath), 'rb') as f:
+            contents = f.read()
+    except FileNotFoundError:
+        return None
+    return contents[:contents.rfind(b'\n') + 1].decode('utf-8').splitlines()
+
+
+def append_line(line, filepath, fsync=False):
+    """
+    Append a line of text to a file.
+
+    Appends are not atomic like save_json, so they suit files where
+    readers tolerate a missing last entry. Inside a write_batch the file
+    is flushed with the batch commit.
+
+    Args:
+        line (str): Text to append, without the trailing newline
+        filepath (str): Target file path
+        fsync (bool): Flush the file to disk before returning.
+            Ignored inside a write_batch, which decides itself.
+    """
+    batch = _current_batch()
+    directory = os.path.dirname(filepath)
+    created_directories = _create_parent_directories(directory)
+
+    with open(filepath, 'a') as f:
+        f.write(line + '\n')
+        if fsync and batch is None:
+            f.flush()
+            os.fsync(f.fileno())
+
+    if batch is not None:
+        batch.track_append(filepath)
+        batch.created_directories.update(os.path.dirname(d) for d in created_directories)
+    elif fsync:
+        for created_directory in created_directories:
+            _fsync_directory(os.path.dirname(created_directory))
+
+
+def append_lines(lines, filepath, fsync=False):
+    """
+    Append lines of text to a file with a single write.
+
+    A partial last line left by an interrupted append is cut off first,
+    so it cannot merge with the new lines. Inside a write_batch the file
+    is flushed with the batch commit, and a pending replacement of the
+    file made by the batch is appended to instead.
+
+    Args:
+        lines: Lines of text, without trailing newlines
+        filepath (str): Target file path
+        fsync (bool): Flush the file to disk before returning.
+            Ignored inside a write_batch, which decides itself.
+    """
+    batch = _current_batch()
+    path = _resolve_pending(filepath)
+    created_directories = _create_parent_directories(os.path.dirname(path))
 
+    with open(path, 'a+b') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size:
+            f.seek(size - 1)
+            if f.read(1) != b'\n':
+                f.seek(0)
+                contents = f.read()
+                f.truncate(contents.rfind(b'\n') + 1)
+        f.write(''.join(f"{line}\n" for line in lines).encode('utf-8'))
+        if fsync and batch is None:
+            f.flush()
+            os.fsync(f.fileno())
 
-def load_json(filepath, default=None):
-    """Load JSON data from the specified filepath."""
+    if batch is not None:
+        if path == filepath:
+            batch.track_append(filepath)
+        batch.created_directories.update(os.path.dirname(d) for d in created_directories)
+    elif fsync:
+        for created_directory in created_directories:
+            _fsync_directory(os.path.dirname(created_directory))
+
+
+def _resolve_pending(filepath):
+    """Get the path holding the latest version of filepath for this thread."""
+    batch = _current_batch()
+    if batch is not None:
+        return batch.pending.get(filepath, filepath)
+    return filepath
+
+
+def _read_json(filepath):
+    """Parse a JSON file, or return None if it is missing or invalid."""
     try:
         with open(filepath, 'r') as f:
             return json.load(f)
     except (FileNotFoundError, json.JSONDecodeError):
-        return default
+        return None
 
 
-def get_data_dir():
-    """Get the data directory path."""
+def load_json(filepath, default=None, cached=False):
+    """
+    Load JSON data from the specified filepath.
+
+    Args:
+        filepath (str): Path of the file
+        default: Returned if the file is missing or invalid
+        cached (bool): Serve the data from the process-wide document
+            cache (see common.cache). The returned data is then shared
+            with other callers and must not be modified.
+    """
+    path = _resolve_pending(filepath)
+    if cached and path == filepath:
+        return get_document_cache().get(filepath, _read_json, default)
+
+    data = _read_json(path)
+    return default if data is None else data
+
+
+def json_exists(filepath):
+    """Check whether a JSON file exists, including pending batch writes."""
+    return os.path.exists(_resolve_pending(filepath))
+
+
+def remove_json(filepath):
+    """Remove a JSON file, including any pending batch write to it."""
+    batch = _current_batch()
+    if batch is not None:
+        batch.discard(filepath)
+    _remove_quietly(filepath)
+    get_document_cache().invalidate(filepath)
+
+
+def _find_data_dir():
+    """Locate the data directory relative to this file."""
     # Get the directory of the current file
     current_dir = os.path.dirname(os.path.abspath(__file__))
     # Go up one level to get to the project root
@@ -53,6 +411,15 @@ def get_data_dir():
     return os.path.join(project_root, 'Privacy Project/data')
 
 
+# Resolved once, since every storage path is built from it
+_DATA_DIR = _find_data_dir()
+
+
+def get_data_dir():
+    """Get the data directory path."""
+    return _DATA_DIR
+
+
 def get_credentials_dir():
     """Get the credentials directory path."""
     return os.path.join(get_data_dir(), 'credentials')
@@ -65,4 +432,160 @@ def get_wallets_dir():
 
 def get_revocation_dir():
     """Get the revocation directory path."""
-    return os.path.join(get_data_dir(), 'revocation')
\ No newline at end of file
+    return os.path.join(get_data_dir(), 'revocation')
+
+
+def get_issuers_dir():
+    """Get the issuers directory path."""
+    return os.path.join(get_data_dir(), 'issuers')
+
+
+def get_keys_dir():
+    """Get the directory path of the issuers' published public keys."""
+    return os.path.join(get_data_dir(), 'keys')
+
+
+def get_shard(key):
+    """
+    Get the two-level fan-out directories of a key.
+    The levels come from a hash of the key, so they are evenly filled
+    whatever the shape of the IDs.
+    """
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    return digest[:2], digest[2:4]
+
+
+def get_issuer_file_path(issuer_id):
+    """Get the file path of an issuer's data."""
+    return os.path.join(get_issuers_dir(), f"{issuer_id}.json")
+
+
+def get_issuer_keys_file_path(issuer_id):
+    """Get the file path of an issuer's published public keys."""
+    return os.path.join(get_keys_dir(), f"{issuer_id}.json")
+
+
+def get_credential_file_path(credential_id):
+    """Get the file path of a credential, e.g. credentials/ab/cd/<id>.json."""
+    return os.path.join(get_credentials_dir(), *get_shard(credential_id), f"{credential_id}.json")
+
+
+def get_packs_dir():
+    """Get the credential packfile directory path."""
+    return os.path.join(get_data_dir(), 'packs')
+
+
+def get_index_dir():
+    """Get the secondary index directory path."""
+    return os.path.join(get_data_dir(), 'index')
+
+
+def get_index_file_path(field, value):
+    """
+    Get the file path of the secondary index entry for a field value.
+    Values are hashed into file names, and fanned out like credentials.
+    """
+    value_hash = hashlib.sha256(str(value).encode('utf-8')).hexdigest()
+    return os.path.join(get_index_dir(), field, *get_shard(value_hash), f"{value_hash}.ids")
+
+
+def get_expiration_index_file_path(day):
+    """
+    Get the file path of the expiration index entry for a day number.
+    Days are kept as plain file names so that ranges can be listed.
+    """
+    return os.path.join(get_index_dir(), 'expiration_day', f"{day}.ids")
+
+
+def get_legacy_issuer_file_path(issuer_id):
+    """Get the file path of an issuer in the flat layout used before sharding."""
+    return os.path.join(get_credentials_dir(), f"issuer_{issuer_id}.json")
+
+
+def get_legacy_credential_file_path(credential_id):
+    """Get the file path of a credential in the flat layout used before sharding."""
+    return os.path.join(get_credentials_dir(), f"credential_{credential_id}.json")
+
+
+def get_wallet_file_path(holder_id):
+    """Get the file path of a holder's wallet."""
+    return os.path.join(get_wallets_dir(), f"wallet_{holder_id}.json")
+
+
+def get_wallet_records_file_path(holder_id):
+    """Get the file path of the credential records of a holder's wallet."""
+    return os.path.join(get_wallets_dir(), f"wallet_{holder_id}.records")
+
+
+def get_revocation_file_path(issuer_id, public=True):
+    """Get the file path of the public or private part of a revocation list."""
+    visibility = "public" if public else "private"
+    return os.path.join(get_revocation_dir(), f"revocation_list_{issuer_id}_{visibility}.json")
+
+
+
+def iter_sharded_keys(directory):
+    """Iterate over the keys of the JSON files in a sharded directory."""
+    if not os.path.isdir(directory):
+        return
+
+    for first in os.scandir(directory):
+        if not first.is_dir() or len(first.name) != 2:
+            continue
+        for second in os.scandir(first.path):
+            if not second.is_dir():
+                continue
+            for entry in os.scandir(second.path):
+                if entry.name.endswith('.json') and not entry.name.startswith('.'):
+                    yield entry.name[:-len('.json')]
+
+
+def migrate_legacy_layout(progress=None):
+    """
+    Move issuer and credential files from the flat credentials directory
+    into the sharded layout.
+
+    Each file is hard-linked into place, which never clobbers a newer copy
+    written since the switch, and then unlinked from the flat directory.
+    Readers fall back to the legacy location while it still exists, so
+    the migration can run while the system is in use. Running it again
+    is harmless.
+
+    Args:
+        progress (callable, optional): Called with the number of files
+            moved so far, every 10000 files
+
+    Returns:
+        dict: Number of moved 'issuers' and 'credentials'
+    """
+    moved = {'issuers': 0, 'credentials': 0}
+    legacy_dir = get_credentials_dir()
+    if not os.path.isdir(legacy_dir):
+        return moved
+
+    for entry in os.scandir(legacy_dir):
+        if not entry.is_file() or not entry.name.endswith('.json'):
+            continue
+        key = entry.name[:-len('.json')]
+        if key.startswith('issuer_'):
+            kind, target = 'issuers', get_issuer_file_path(key[len('issuer_'):])
+        elif key.startswith('credential_'):
+            kind, target = 'credentials', get_credential_file_path(key[len('credential_'):])
+        else:
+            continue
+
+        create_directory_if_not_exists(os.path.dirname(target))
+        try:
+            # Linking never replaces an existing target, unlike a rename
+            os.link(entry.path, target)
+        except FileExistsError:
+            # The object was rewritten after the switch; the flat copy is stale
+            pass
+        _remove_quietly(entry.path)
+        moved[kind] += 1
+
+        total = moved['issuers'] + moved['credentials']
+        if progress and total % 10000 == 0:
+            progress(total)
+
+    return moved
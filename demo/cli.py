@@ -3,21 +3,40 @@ Command-line interface for the privacy-preserving digital credential system.
 """
 
 import os
+import sys
 import json
 import click
 import time
+import asyncio
+import itertools
+import threading
 from datetime import datetime
 
-from issuer import Issuer, create_issuer, load_issuer
+from issuer import Issuer, create_issuer, load_issuer, get_issuer_summaries
 from holder import Wallet
+from holder.benchmark import run_presentation_benchmark
 from verifier import Verifier
-from common.utils import get_credentials_dir, get_wallets_dir, get_revocation_dir
+from verifier.server import VerificationServer
+from verifier.loadtest import run_load_test
+from verifier.bundle import VerifierBundle, build_bundle, generate_signing_key
+from verifier.roots import FAST
+from common.storage import (
+    get_storage, set_storage, create_storage, FileStorage, CREDENTIALS, WALLETS
+)
+from common.utils import migrate_legacy_layout
+from common.metrics import get_metrics
+from common.transfer import (
+    export_data, import_data, open_dump_for_writing, open_dump_for_reading
+)
 
 
 @click.group()
-def cli():
+@click.option('--storage', type=click.Choice(['file', 'sqlite']), default=None,
+              help='Storage backend (default: file, or $CREDENTIAL_STORAGE)')
+def cli(storage):
     """Privacy-Preserving Digital Credential System CLI."""
-    pass
+    if storage:
+        set_storage(create_storage(storage))
 
 
 # Issuer commands
@@ -39,17 +58,16 @@ def create_issuer_cmd(name):
 @issuer.command('list')
 def list_issuers():
     """List all issuers."""
-    issuer_files = [f for f in os.listdir(get_credentials_dir()) if f.startswith("issuer_")]
+    summaries = get_issuer_summaries()
     
-    if not issuer_files:
+    if not summaries:
         click.echo("No issuers found.")
         return
     
     click.echo("Available issuers:")
-    for issuer_file in issuer_files:
-        issuer_id = issuer_file.replace("issuer_", "").replace(".json", "")
-        issuer = load_issuer(issuer_id)
-        click.echo(f"- {issuer.name} (ID: {issuer.issuer_id})")
+    for summary in summaries:
+        click.echo(f"- {summary['name']} (ID: {summary['id']}, "
+                   f"credentials: {summary['credential_count']})")
 
 
 @issuer.command('issue')
@@ -83,12 +101,20 @@ def issue_credential_cmd(issuer_id, holder_id, type, attribute, expires):
             click.echo("Invalid expiration days.")
             return
     
+    # Certify the holder's key, so the credential can answer challenges
+    holder_public_key = None
+    if get_storage().exists(WALLETS, holder_id):
+        holder_public_key = Wallet(holder_id=holder_id).public_key
+    if holder_public_key is None:
+        click.echo("Warning: holder has no key to certify; the credential cannot answer challenges.")
+    
     # Issue the credential
     credential = issuer.issue_credential(
         holder_id=holder_id, 
         credential_type=type, 
         attributes=attributes, 
-        expiration_date=expiration_date
+        expiration_date=expiration_date,
+        holder_public_key=holder_public_key
     )
     
     click.echo(f"Issued credential: {credential.id}")
@@ -116,8 +142,7 @@ def revoke_credential_cmd(issuer_id, credential_id):
         return
     
     # Load the credential
-    credential_path = os.path.join(get_credentials_dir(), f"credential_{credential_id}.json")
-    if not os.path.exists(credential_path):
+    if not get_storage().exists(CREDENTIALS, credential_id):
         click.echo(f"Credential with ID {credential_id} not found.")
         return
     
@@ -129,6 +154,19 @@ def revoke_credential_cmd(issuer_id, credential_id):
         click.echo(f"Failed to revoke credential {credential_id}.")
 
 
+@issuer.command('rotate-keys')
+@click.option('--issuer-id', '-i', required=True, help='ID of the issuer')
+def rotate_keys_cmd(issuer_id):
+    """Replace an issuer's signing key, keeping the old public key trusted."""
+    issuer = load_issuer(issuer_id)
+    if not issuer:
+        click.echo(f"Issuer with ID {issuer_id} not found.")
+        return
+
+    kid = issuer.rotate_keys()
+    click.echo(f"Rotated the keys of issuer {issuer.name}. New key ID: {kid}")
+
+
 # Wallet commands
 @cli.group()
 def wallet():
@@ -136,36 +174,78 @@ def wallet():
     pass
 
 
+def passphrase_option(command):
+    """Add the --passphrase option of encrypted wallets to a command."""
+    return click.option('--passphrase', envvar='WALLET_PASSPHRASE',
+                        help='Passphrase of an encrypted wallet (or $WALLET_PASSPHRASE)')(command)
+
+
+def open_wallet(holder_id, passphrase=None):
+    """Open a wallet, reporting a missing or wrong passphrase instead of failing."""
+    try:
+        wallet = Wallet(holder_id=holder_id, passphrase=passphrase)
+    except ValueError as e:
+        click.echo(f"Cannot open wallet: {e}")
+        return None
+    if wallet.encrypted and wallet.key is None:
+        click.echo("Cannot open wallet: it is encrypted; pass --passphrase.")
+        return None
+    return wallet
+
+
 @wallet.command('create')
 @click.option('--name', '-n', help='Name of the wallet holder')
-def create_wallet_cmd(name):
-    """Create a new wallet."""
-    wallet = Wallet(name=name)
+@passphrase_option
+def create_wallet_cmd(name, passphrase):
+    """Create a new wallet, encrypted at rest if a passphrase is given."""
+    wallet = Wallet(name=name, passphrase=passphrase)
+    # Store the holder key (and encryption parameters) right away, for issuers to certify
+    wallet.save()
     click.echo(f"Created wallet for: {wallet.name} (ID: {wallet.holder_id})")
 
 
+@wallet.command('encrypt')
+@click.option('--holder-id', '-h', required=True, help='ID of the holder')
+@click.option('--passphrase', envvar='WALLET_PASSPHRASE', prompt=True, hide_input=True,
+              confirmation_prompt=True, help='New passphrase of the wallet')
+def encrypt_wallet_cmd(holder_id, passphrase):
+    """Encrypt an existing wallet at rest."""
+    wallet = Wallet(holder_id=holder_id)
+    if wallet.encrypted:
+        click.echo("Wallet is already encrypted.")
+        return
+    try:
+        wallet.enable_encryption(passphrase)
+    except ValueError as e:
+        click.echo(f"Cannot encrypt wallet: {e}")
+        return
+    click.echo(f"Encrypted wallet of {wallet.name} ({len(wallet.credentials)} credentials).")
+
+
 @wallet.command('list')
 def list_wallets():
     """List all wallets."""
-    wallet_files = [f for f in os.listdir(get_wallets_dir()) if f.startswith("wallet_")]
+    holder_ids = list(get_storage().keys(WALLETS))
     
-    if not wallet_files:
+    if not holder_ids:
         click.echo("No wallets found.")
         return
     
     click.echo("Available wallets:")
-    for wallet_file in wallet_files:
-        holder_id = wallet_file.replace("wallet_", "").replace(".json", "")
+    for holder_id in holder_ids:
         wallet = Wallet(holder_id=holder_id)
         click.echo(f"- {wallet.name} (ID: {wallet.holder_id})")
 
 
 @wallet.command('credentials')
 @click.option('--holder-id', '-h', required=True, help='ID of the holder')
-def list_credentials_cmd(holder_id):
+@passphrase_option
+def list_credentials_cmd(holder_id, passphrase):
     """List all credentials in a wallet."""
     # Load the wallet
-    wallet = Wallet(holder_id=holder_id)
+    wallet = open_wallet(holder_id, passphrase)
+    if wallet is None:
+        return
     
     credentials = wallet.list_credentials()
     if not credentials:
@@ -185,10 +265,13 @@ def list_credentials_cmd(holder_id):
 @wallet.command('show')
 @click.option('--holder-id', '-h', required=True, help='ID of the holder')
 @click.option('--credential-id', '-c', required=True, help='ID of the credential to show')
-def show_credential_cmd(holder_id, credential_id):
+@passphrase_option
+def show_credential_cmd(holder_id, credential_id, passphrase):
     """Show details of a specific credential."""
     # Load the wallet
-    wallet = Wallet(holder_id=holder_id)
+    wallet = open_wallet(holder_id, passphrase)
+    if wallet is None:
+        return
     
     credential = wallet.get_credential(credential_id)
     if not credential:
@@ -211,10 +294,14 @@ def show_credential_cmd(holder_id, credential_id):
 @click.option('--holder-id', '-h', required=True, help='ID of the holder')
 @click.option('--credential-id', '-c', required=True, help='ID of the credential to present')
 @click.option('--attribute', '-a', multiple=True, help='Attribute to include in the presentation')
-def present_credential_cmd(holder_id, credential_id, attribute):
+@click.option('--challenge', help="Verifier's challenge to answer (e.g. from GET /challenge)")
+@passphrase_option
+def present_credential_cmd(holder_id, credential_id, attribute, challenge, passphrase):
     """Create a presentation of a credential."""
     # Load the wallet
-    wallet = Wallet(holder_id=holder_id)
+    wallet = open_wallet(holder_id, passphrase)
+    if wallet is None:
+        return
     
     credential = wallet.get_credential(credential_id)
     if not credential:
@@ -223,12 +310,45 @@ def present_credential_cmd(holder_id, credential_id, attribute):
     
     # Create the presentation
     selective_disclosure = list(attribute) if attribute else None
-    presentation = wallet.create_presentation(credential_id, selective_disclosure)
+    presentation = wallet.create_presentation(credential_id, selective_disclosure, challenge)
     
     click.echo("Credential Presentation:")
     click.echo(json.dumps(presentation, indent=2))
 
 
+@wallet.command('benchmark')
+@click.option('--holder-id', '-h', required=True, help='ID of the holder')
+@click.option('--requests', '-n', 'request_count', default=1000, show_default=True,
+              help='Number of presentations per run')
+@click.option('--rounds', default=5, show_default=True, help='Timed runs of each side; the fastest counts')
+@click.option('--serialize', is_flag=True, help='Time JSON strings instead of dicts')
+@passphrase_option
+def benchmark_presentations_cmd(holder_id, request_count, rounds, serialize, passphrase):
+    """Compare batch presentation creation with a loop over single presentations."""
+    wallet = open_wallet(holder_id, passphrase)
+    if wallet is None:
+        return
+
+    # Cycle through the credentials, disclosing everything, one attribute or half of them
+    disclosures = []
+    for credential_id in list(wallet.credentials):
+        names = sorted(wallet.get_credential(credential_id).attributes)
+        disclosures.extend((credential_id, subset) for subset in (None, names[:1], names[:len(names) // 2 or 1]))
+    if not disclosures:
+        click.echo("No credentials to present.")
+        return
+    requests = [
+        {'credential_id': credential_id, 'selective_disclosure': subset}
+        for credential_id, subset in itertools.islice(itertools.cycle(disclosures), request_count)
+    ]
+
+    report = run_presentation_benchmark(wallet, requests, rounds=rounds, serialize=serialize)
+    for side in ('loop', 'batch'):
+        click.echo(f"{side:>5}: {report[side]['seconds']:.4f}s  "
+                   f"{report[side]['presentations_per_second']} presentations/s")
+    click.echo(f"Speedup: {report['speedup']}x over {report['presentations']} presentations")
+
+
 # Verifier commands
 @cli.group()
 def verifier():
@@ -236,12 +356,37 @@ def verifier():
     pass
 
 
+def bundle_key_option(command):
+    """Add the --bundle-key option naming the key offline bundles must be signed with."""
+    return click.option('--bundle-key', envvar='VERIFIER_BUNDLE_PUBLIC_KEY',
+                        help='Public key the bundle must be signed with '
+                             '(or $VERIFIER_BUNDLE_PUBLIC_KEY)')(command)
+
+
+def open_verifier(bundle_path=None, bundle_key=None, **kwargs):
+    """Create a verifier, from a bundle if given, reporting a bundle that cannot be trusted."""
+    if not bundle_path:
+        return Verifier(**kwargs)
+    if not bundle_key:
+        click.echo("Cannot open bundle: pass --bundle-key with the public key it was signed with.")
+        return None
+    try:
+        return Verifier.from_bundle(bundle_path, bundle_key)
+    except (OSError, ValueError) as e:
+        click.echo(f"Cannot open bundle: {e}")
+        return None
+
+
 @verifier.command('verify')
 @click.option('--presentation', '-p', help='Path to a presentation JSON file')
 @click.option('--credential-id', '-c', help='ID of a credential to verify directly')
-def verify_credential_cmd(presentation, credential_id):
+@click.option('--bundle', 'bundle_path', help='Verify offline against a verifier bundle')
+@bundle_key_option
+def verify_credential_cmd(presentation, credential_id, bundle_path, bundle_key):
     """Verify a credential or presentation."""
-    verifier = Verifier()
+    verifier = open_verifier(bundle_path, bundle_key)
+    if verifier is None:
+        return
     
     if presentation:
         try:
@@ -251,16 +396,13 @@ def verify_credential_cmd(presentation, credential_id):
             click.echo("Invalid presentation file.")
             return
         
-        is_valid, details = verifier.verify_credential(presentation_data)
+        is_valid, details = verifier.verify_presentation(presentation_data)
     elif credential_id:
-        credential_path = os.path.join(get_credentials_dir(), f"credential_{credential_id}.json")
-        if not os.path.exists(credential_path):
+        credential_data = get_storage().get(CREDENTIALS, credential_id)
+        if not credential_data:
             click.echo(f"Credential with ID {credential_id} not found.")
             return
         
-        with open(credential_path, 'r') as f:
-            credential_data = json.load(f)
-        
         from common.models import Credential
         credential = Credential(**credential_data)
         is_valid, details = verifier.verify_credential(credential)
@@ -274,5 +416,274 @@ def verify_credential_cmd(presentation, credential_id):
         click.echo(f"❌ Credential is invalid: {details.get('error', 'Unknown error')}")
 
 
+@verifier.command('verify-batch')
+@click.option('--input', '-i', 'input_file', type=click.File('r'), required=True,
+              help='NDJSON file of credentials, or - for stdin')
+@click.option('--output', '-o', 'output_file', type=click.File('w'), default='-',
+              help='File to write one NDJSON result line per credential to (default: stdout)')
+@click.option('--workers', default=4, show_default=True, help='Number of verification threads')
+@click.option('--window', default=1000, show_default=True,
+              help='Maximum number of credentials read ahead')
+@click.option('--bundle', 'bundle_path', help='Verify offline against a verifier bundle')
+@click.option('--metrics', 'metrics_file', type=click.File('w'),
+              help='File to write stage latency histograms to afterwards')
+@click.option('--metrics-format', type=click.Choice(['json', 'prometheus']), default='json',
+              show_default=True, help='Format of the latency histograms')
+@bundle_key_option
+def verify_batch_cmd(input_file, output_file, workers, window, bundle_path, metrics_file, metrics_format,
+                     bundle_key):
+    """Verify a stream of credentials, one JSON document per line."""
+    verifier = open_verifier(bundle_path, bundle_key)
+    if verifier is None:
+        return
+    if metrics_file:
+        get_metrics().enable()
+    lines = (line for line in input_file if line.strip())
+
+    total = valid = 0
+    for result in verifier.verify_stream(lines, max_in_flight=window, max_workers=workers):
+        output_file.write(json.dumps(result, separators=(',', ':')) + '\n')
+        total += 1
+        valid += result['valid']
+    output_file.flush()
+
+    click.echo(f"Verified {total} credentials: {valid} valid, {total - valid} invalid.", err=True)
+    if metrics_file:
+        metrics = get_metrics()
+        metrics_file.write(metrics.to_json(indent=2) + '\n' if metrics_format == 'json'
+                           else metrics.to_prometheus())
+
+
+@verifier.command('serve')
+@click.option('--bind', '-b', default='127.0.0.1:8080', show_default=True,
+              help='Address and port to listen on')
+@click.option('--workers', type=int, help='Number of verification threads (default: CPU count)')
+@click.option('--bundle', 'bundle_path', help='Serve offline from a verifier bundle')
+@click.option('--metrics', is_flag=True, help='Record stage latencies, served on GET /metrics')
+@click.option('--require-challenge', is_flag=True,
+              help='Only accept presentations answering a challenge from GET /challenge')
+@bundle_key_option
+def serve_cmd(bind, workers, bundle_path, metrics, require_challenge, bundle_key):
+    """Run the standalone verification HTTP service."""
+    host, _, port = bind.rpartition(':')
+    if not host or not port.isdigit():
+        click.echo("Expected --bind in the form host:port.")
+        return
+    port = int(port)
+    if metrics:
+        get_metrics().enable()
+    verifier = open_verifier(bundle_path, bundle_key, root_policy=FAST)
+    if verifier is None:
+        return
+    verifier.require_challenge = require_challenge
+    server = VerificationServer(verifier, host=host, port=port, workers=workers)
+    issuers = server.warm_up()
+    click.echo(f"Loaded keys and roots of {issuers} issuers.")
+    click.echo(f"Serving verification on http://{host}:{port} (POST /verify, /verify/batch)")
+    server.run()
+
+
+@verifier.command('loadtest')
+@click.option('--url', help='Base URL of a running service (default: start one in-process)')
+@click.option('--input', '-i', 'input_file', type=click.File('r'),
+              help='NDJSON file of credentials or presentations to send (default: stored credentials)')
+@click.option('--sample', default=100, show_default=True, help='Number of distinct documents to send')
+@click.option('--requests', '-n', 'request_count', default=2000, show_default=True,
+              help='Number of requests')
+@click.option('--concurrency', '-c', default=16, show_default=True, help='Number of client connections')
+@click.option('--batch-size', default=1, show_default=True,
+              help='Items per request; more than 1 uses /verify/batch')
+def loadtest_cmd(url, input_file, sample, request_count, concurrency, batch_size):
+    """Measure the throughput and latency of the verification service."""
+    if input_file:
+        documents = [json.loads(line) for line in itertools.islice(
+            (line for line in input_file if line.strip()), sample)]
+    else:
+        documents = [document for _, document in itertools.islice(get_storage().items(CREDENTIALS), sample)]
+    if not documents:
+        click.echo("No credentials to send.")
+        return
+
+    server = None
+    if not url:
+        # Clients and server then share one interpreter, so numbers are conservative
+        server = VerificationServer(port=0)
+        server.warm_up()
+        started = threading.Event()
+
+        async def serve():
+            await server.start()
+            started.set()
+            await server.serve_forever()
+
+        threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+        started.wait()
+        url = f"http://127.0.0.1:{server.port}"
+
+    click.echo(f"Sending {request_count} requests of {batch_size} to {url} "
+               f"over {concurrency} connections...")
+    report = run_load_test(url, documents, requests=request_count,
+                           concurrency=concurrency, batch_size=batch_size)
+    latency = report['latency_ms']
+    click.echo(f"Requests/s: {report['requests_per_second']}  Items/s: {report['items_per_second']}  "
+               f"Errors: {report['errors']}")
+    click.echo(f"Latency ms: p50 {latency['p50']}  p90 {latency['p90']}  "
+               f"p99 {latency['p99']}  max {latency['max']}")
+
+
+@verifier.group('bundle')
+def bundle():
+    """Commands for offline verifier bundles."""
+    pass
+
+
+@bundle.command('keygen')
+def bundle_keygen_cmd():
+    """Create a key pair for signing offline bundles."""
+    keypair = generate_signing_key()
+    click.echo("Keep the signing key secret; give the public key to the field verifiers.")
+    click.echo(f"export VERIFIER_BUNDLE_SIGNING_KEY={keypair['private_key']}")
+    click.echo(f"export VERIFIER_BUNDLE_PUBLIC_KEY={keypair['public_key']}")
+
+
+@bundle.command('build')
+@click.option('--output', '-o', required=True, help='Path of the bundle file to write')
+@click.option('--valid-for', default=24.0, show_default=True, help='Hours the bundle may be used for')
+@click.option('--filters', is_flag=True,
+              help='Include revocation filters, so proofs for older roots are still accepted')
+@click.option('--signing-key', envvar='VERIFIER_BUNDLE_SIGNING_KEY', required=True,
+              help='Private key signing the bundle (or $VERIFIER_BUNDLE_SIGNING_KEY)')
+def bundle_build_cmd(output, valid_for, filters, signing_key):
+    """Write the issuer keys and revocation roots to a signed offline bundle."""
+    try:
+        counts = build_bundle(output, signing_key, valid_for=int(valid_for * 3600), include_filters=filters)
+    except ValueError as e:
+        click.echo(f"Invalid signing key: {e}")
+        return
+    click.echo(f"Wrote {output}: {counts['issuers']} issuers, {counts['keys']} keys, "
+               f"{counts['filter_entries']} filter entries ({os.path.getsize(output)} bytes).")
+
+
+@bundle.command('info')
+@click.argument('path')
+@bundle_key_option
+def bundle_info_cmd(path, bundle_key):
+    """Show the contents of an offline bundle."""
+    if not bundle_key:
+        click.echo("Pass --bundle-key with the public key the bundle was signed with.")
+        return
+    try:
+        verifier_bundle = VerifierBundle(path, bundle_key)
+    except (OSError, ValueError) as e:
+        click.echo(f"Invalid bundle: {e}")
+        return
+    created = datetime.fromtimestamp(verifier_bundle.created_at).strftime('%Y-%m-%d %H:%M:%S')
+    expires = datetime.fromtimestamp(verifier_bundle.expires_at).strftime('%Y-%m-%d %H:%M:%S')
+    status = "expired" if verifier_bundle.expired() else "valid"
+    click.echo(f"Created: {created}  Expires: {expires} ({status})")
+    click.echo(f"Signed with key: {verifier_bundle.signer_kid}")
+    click.echo(f"Revocation filters: {'yes' if verifier_bundle.has_filters else 'no'}")
+    for issuer_id in verifier_bundle.issuer_ids():
+        kids = ', '.join(kid for kid, _ in verifier_bundle.get_keys(issuer_id))
+        click.echo(f"- {issuer_id}: keys {kids}, root {verifier_bundle.get_root(issuer_id) or '(none)'}")
+    verifier_bundle.close()
+
+
+# Administration commands
+@cli.group()
+def admin():
+    """Commands for maintaining the data directory."""
+    pass
+
+
+@admin.command('migrate-layout')
+def migrate_layout_cmd():
+    """Move flat issuer and credential files into the sharded layout."""
+    if not isinstance(get_storage(), FileStorage):
+        click.echo("Layout migration only applies to the file storage backend.")
+        return
+    
+    moved = migrate_legacy_layout(
+        progress=lambda total: click.echo(f"  {total} files moved...")
+    )
+    click.echo(f"Moved {moved['issuers']} issuers and {moved['credentials']} credentials.")
+
+
+@admin.command('pack-credentials')
+@click.option('--chunk-size', default=100000, show_default=True,
+              help='Number of credentials packed per index update')
+def pack_credentials_cmd(chunk_size):
+    """Move loose credential files into the credential packfile."""
+    if not isinstance(get_storage(), FileStorage):
+        click.echo("Packing only applies to the file storage backend.")
+        return
+    
+    total = get_storage().pack_credentials(
+        chunk_size=chunk_size,
+        progress=lambda total: click.echo(f"  {total} credentials packed...")
+    )
+    click.echo(f"Packed {total} credentials.")
+
+
+@admin.command('rebuild-indexes')
+def rebuild_indexes_cmd():
+    """Rebuild the secondary credential indexes."""
+    get_storage().rebuild_indexes()
+    click.echo("Credential indexes rebuilt.")
+
+
+@admin.command('export')
+@click.option('--output', '-o', default='-', show_default=True,
+              help='File to write the NDJSON dump to, or - for stdout')
+@click.option('--gzip', 'compress', is_flag=True, help='Compress the dump with gzip')
+def export_cmd(output, compress):
+    """Export issuers, wallets, credentials and revocation state as NDJSON."""
+    binary_stream = sys.stdout.buffer if output == '-' else open(output, 'wb')
+    stream = open_dump_for_writing(binary_stream, compress=compress)
+    try:
+        counts = export_data(
+            stream,
+            progress=lambda total: click.echo(f"  {total} documents exported...", err=True)
+        )
+    finally:
+        stream.flush()
+        inner_stream = stream.detach()
+        if compress:
+            # Writes the gzip trailer without closing the underlying stream
+            inner_stream.close()
+        if output != '-':
+            binary_stream.close()
+    
+    click.echo(f"Exported {sum(counts.values())} documents: " +
+               ", ".join(f"{count} {collection}" for collection, count in counts.items()),
+               err=True)
+
+
+@admin.command('import')
+@click.option('--input', '-i', 'input_path', default='-', show_default=True,
+              help='NDJSON dump to import (plain or gzip), or - for stdin')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Number of documents written per batch')
+def import_cmd(input_path, batch_size):
+    """Import an NDJSON dump and rebuild derived data."""
+    binary_stream = sys.stdin.buffer if input_path == '-' else open(input_path, 'rb')
+    stream = open_dump_for_reading(binary_stream)
+    try:
+        counts = import_data(
+            stream,
+            batch_size=batch_size,
+            progress=lambda total: click.echo(f"  {total} documents imported...")
+        )
+    except ValueError as e:
+        click.echo(f"Invalid dump: {e}")
+        return
+    finally:
+        stream.detach()
+        if input_path != '-':
+            binary_stream.close()
+    
+    click.echo(f"Imported {sum(counts.values())} documents: " +
+               ", ".join(f"{count} {collection}" for collection, count in counts.items()))
+
 if __name__ == '__main__':
     cli()
\ No newline at end of file
@@ -2,17 +2,16 @@
 Web-based demo interface for the privacy-preserving digital credential system.
 """
 
-import os
 import json
+import threading
 from datetime import datetime
 from flask import Flask, render_template, request, redirect, url_for, jsonify, abort
 
-from issuer import Issuer, create_issuer, load_issuer
+from issuer import Issuer, create_issuer, load_issuer, get_issuer_summaries
 from holder import Wallet
 from verifier import Verifier
-from common.utils import (
-    get_credentials_dir, get_wallets_dir, get_revocation_dir, load_json
-)
+from common.storage import get_storage, CREDENTIALS, ISSUERS, WALLETS
+from common.cache import get_document_cache
 from datetime import datetime
 
 
@@ -20,30 +19,35 @@ from datetime import datetime
 app = Flask(__name__)
 
 
+# One Issuer per issuer ID, shared by all requests, so concurrent
+# requests of an issuer go through the same revocation manager
+_issuers = {}
+_issuers_lock = threading.Lock()
+
+
 # Helper functions
+def get_issuer(issuer_id):
+    """Get the shared Issuer of an issuer ID, or None if there is no such issuer."""
+    with _issuers_lock:
+        issuer = _issuers.get(issuer_id)
+        if issuer is None and get_storage().exists(ISSUERS, issuer_id):
+            issuer = _issuers[issuer_id] = load_issuer(issuer_id)
+        return issuer
+
+
 def get_all_issuers():
     """Get all issuers."""
-    issuer_files = [f for f in os.listdir(get_credentials_dir()) if f.startswith("issuer_")]
-    issuers = []
-    
-    for issuer_file in issuer_files:
-        issuer_id = issuer_file.replace("issuer_", "").replace(".json", "")
-        issuer = load_issuer(issuer_id)
-        issuers.append({
-            'id': issuer.issuer_id,
-            'name': issuer.name
-        })
-    
-    return issuers
+    return [
+        {'id': summary['id'], 'name': summary['name']}
+        for summary in get_issuer_summaries()
+    ]
 
 
 def get_all_wallets():
     """Get all wallets."""
-    wallet_files = [f for f in os.listdir(get_wallets_dir()) if f.startswith("wallet_")]
     wallets = []
     
-    for wallet_file in wallet_files:
-        holder_id = wallet_file.replace("wallet_", "").replace(".json", "")
+    for holder_id in get_storage().keys(WALLETS):
         wallet = Wallet(holder_id=holder_id)
         wallets.append({
             'id': wallet.holder_id,
@@ -69,6 +73,8 @@ def create_issuer_route():
     if request.method == 'POST':
         name = request.form.get('name')
         issuer = create_issuer(name=name)
+        with _issuers_lock:
+            _issuers[issuer.issuer_id] = issuer
         return redirect(url_for('index'))
     
     return render_template('create_issuer.html')
@@ -90,23 +96,20 @@ def create_issuer_route():
 @app.route('/issuer/<issuer_id>')
 def issuer_details(issuer_id):
     """View issuer details."""
-    issuer = load_issuer(issuer_id)
+    issuer = get_issuer(issuer_id)
     if not issuer:
         abort(404)
     
     # Find credentials issued by this issuer
-    credential_files = [f for f in os.listdir(get_credentials_dir()) if f.startswith("credential_")]
     credential_count = 0
     revoked_count = 0
     credentials = []
     
-    for credential_file in credential_files:
-        credential_data = load_json(os.path.join(get_credentials_dir(), credential_file))
-        if credential_data and credential_data.get('issuer_id') == issuer_id:
-            credential_count += 1
-            credentials.append(credential_data)
-            if issuer.revocation_manager.is_revoked(credential_data.get('index', -1)):
-                revoked_count += 1
+    for credential_data in get_storage().find_credentials(issuer_id=issuer_id):
+        credential_count += 1
+        credentials.append(credential_data)
+        if issuer.revocation_manager.is_revoked(credential_data.get('index', -1)):
+            revoked_count += 1
     
     return render_template('issuer_details.html', 
                           issuer=issuer, 
@@ -124,7 +127,7 @@ def timestamp_to_date(timestamp):
 @app.route('/issuer/<issuer_id>/issue', methods=['GET', 'POST'])
 def issue_credential_route(issuer_id):
     """Issue a new credential."""
-    issuer = load_issuer(issuer_id)
+    issuer = get_issuer(issuer_id)
     if not issuer:
         abort(404)
     
@@ -157,18 +160,19 @@ def issue_credential_route(issuer_id):
                                        wallets=get_all_wallets(),
                                        error="Invalid expiration value")
         
-        # Issue the credential
+        # Issue the credential, certifying the holder's key
         try:
+            wallet = Wallet(holder_id=holder_id)
             credential = issuer.issue_credential(
                 holder_id=holder_id,
                 credential_type=credential_type,
                 attributes=attributes,
-                expiration_date=expiration_date
+                expiration_date=expiration_date,
+                holder_public_key=wallet.public_key
             )
             
             # Try to add the credential to the holder's wallet automatically
             try:
-                wallet = Wallet(holder_id=holder_id)
                 wallet.add_credential(credential)
             except Exception as e:
                 print(f"Warning: Could not add credential to wallet: {e}")
@@ -191,7 +195,7 @@ def issue_credential_route(issuer_id):
 @app.route('/issuer/<issuer_id>/revoke', methods=['GET', 'POST'])
 def revoke_credential_route(issuer_id):
     """Revoke a credential."""
-    issuer = load_issuer(issuer_id)
+    issuer = get_issuer(issuer_id)
     if not issuer:
         abort(404)
     
@@ -201,13 +205,7 @@ def revoke_credential_route(issuer_id):
         return redirect(url_for('issuer_details', issuer_id=issuer_id))
     
     # Get all credentials issued by this issuer
-    credentials = []
-    credential_files = [f for f in os.listdir(get_credentials_dir()) if f.startswith("credential_")]
-    
-    for credential_file in credential_files:
-        credential_data = load_json(os.path.join(get_credentials_dir(), credential_file))
-        if credential_data and credential_data.get('issuer_id') == issuer_id:
-            credentials.append(credential_data)
+    credentials = list(get_storage().find_credentials(issuer_id=issuer_id))
     
     return render_template('revoke_credential.html', 
                           issuer=issuer, 
@@ -238,7 +236,7 @@ def create_wallet_route():
         print(f"Created wallet with ID: {wallet.holder_id} and name: {wallet.name}")
         
         # Save the wallet
-        wallet._save_wallet()
+        wallet.save()
         
         # Redirect to the wallet details page
         return redirect(url_for('wallet_details', holder_id=wallet.holder_id))
@@ -281,7 +279,7 @@ def present_credential_route(holder_id, credential_id):
     # Check if credential is revoked
     is_revoked = False
     try:
-        issuer = load_issuer(credential.issuer_id)
+        issuer = get_issuer(credential.issuer_id)
         if issuer:
             is_revoked = issuer.revocation_manager.is_revoked(credential.index)
     except Exception:
@@ -317,25 +315,32 @@ def verifier_home():
     return render_template('verifier.html')
 
 
+@app.route('/verifier/challenge')
+def create_challenge_route():
+    """Hand out a challenge for a holder to include in one presentation."""
+    return jsonify({'challenge': Verifier().create_challenge()})
+
+
 @app.route('/verifier/verify', methods=['POST'])
 def verify_credential_route():
     """Verify a credential or presentation."""
+    # Verifiers share the process-wide nonce store, so this one accepts
+    # challenges handed out by /verifier/challenge
     verifier = Verifier()
     
     if 'presentation' in request.form:
         try:
             presentation = json.loads(request.form.get('presentation'))
-            is_valid, details = verifier.verify_credential(presentation)
+            is_valid, details = verifier.verify_presentation(presentation)
         except Exception as e:
             return jsonify({'valid': False, 'error': str(e)})
     elif 'credential_id' in request.form:
         credential_id = request.form.get('credential_id')
-        credential_path = os.path.join(get_credentials_dir(), f"credential_{credential_id}.json")
+        credential_data = get_storage().get(CREDENTIALS, credential_id)
         
-        if not os.path.exists(credential_path):
+        if not credential_data:
             return jsonify({'valid': False, 'error': 'Credential not found'})
         
-        credential_data = load_json(credential_path)
         from common.models import Credential
         credential = Credential(**credential_data)
         
@@ -346,14 +351,53 @@ def verify_credential_route():
     return jsonify({'valid': is_valid, 'details': details})
 
 
+# Credential fields returned by the search API. Attribute values and
+# disclosure salts stay out: the salts would let anyone link the
+# undisclosed attribute digests of the holder's presentations
+SEARCH_RESULT_FIELDS = ('id', 'type', 'issuer_id', 'holder_id', 'issuance_date', 'expiration_date')
+
+
+@app.route('/api/credentials')
+def search_credentials_route():
+    """
+    Query credentials by issuer, holder, type and expiration range.
+    
+    Query parameters: issuer_id, holder_id, type, expires_after and
+    expires_before (Unix timestamps), limit (default 100).
+    Results only carry the SEARCH_RESULT_FIELDS of each credential.
+    """
+    try:
+        expires_after = request.args.get('expires_after', type=int)
+        expires_before = request.args.get('expires_before', type=int)
+        limit = request.args.get('limit', default=100, type=int)
+    except ValueError:
+        abort(400)
+    
+    results = []
+    for credential_data in get_storage().find_credentials(
+        issuer_id=request.args.get('issuer_id'),
+        holder_id=request.args.get('holder_id'),
+        credential_type=request.args.get('type'),
+        expires_after=expires_after,
+        expires_before=expires_before
+    ):
+        if len(results) >= limit:
+            break
+        results.append({field: credential_data.get(field) for field in SEARCH_RESULT_FIELDS})
+    
+    return jsonify({'credentials': results, 'count': len(results)})
+
+
+@app.route('/api/stats/cache')
+def cache_stats_route():
+    """Hit/miss metrics of the process-wide document cache."""
+    return jsonify(get_document_cache().stats())
+
+
 @app.route('/credential/<credential_id>')
 def credential_details(credential_id):
     """View credential details."""
-    credential_path = os.path.join(get_credentials_dir(), f"credential_{credential_id}.json")
-    if not os.path.exists(credential_path):
-        abort(404)
-    
-    credential_data = load_json(credential_path)
+    credential_data = get_storage().get(CREDENTIALS, credential_id)
     if not credential_data:
         abort(404)
     
@@ -366,7 +410,7 @@ def credential_details(credential_id):
     issuer_id = credential_data.get('issuer_id')
     if issuer_id:
         try:
-            issuer = load_issuer(issuer_id)
+            issuer = get_issuer(issuer_id)
             if issuer:
                 issuers_lookup[issuer_id] = issuer.name
                 # Check revocation status
@@ -378,11 +422,9 @@ def credential_details(credential_id):
     holder_id = credential_data.get('holder_id')
     if holder_id:
         try:
-            wallet_file = os.path.join(get_wallets_dir(), f"wallet_{holder_id}.json")
-            if os.path.exists(wallet_file):
-                wallet_data = load_json(wallet_file)
-                if wallet_data:
-                    wallets_lookup[holder_id] = wallet_data.get('name', 'Unknown Holder')
+            wallet_data = get_storage().get(WALLETS, holder_id)
+            if wallet_data:
+                wallets_lookup[holder_id] = wallet_data.get('name', 'Unknown Holder')
         except Exception:
             pass
     
@@ -395,7 +437,7 @@ def credential_details(credential_id):
 @app.route('/issuer/<issuer_id>/revocation-status')
 def revocation_status_route(issuer_id):
     """View the revocation status list for an issuer."""
-    issuer = load_issuer(issuer_id)
+    issuer = get_issuer(issuer_id)
     if not issuer:
         abort(404)
     
@@ -412,13 +454,7 @@ def revocation_status_route(issuer_id):
             any_revoked = True
     
     # Get all credentials issued by this issuer for reference
-    credentials = []
-    credential_files = [f for f in os.listdir(get_credentials_dir()) if f.startswith("credential_")]
-    
-    for credential_file in credential_files:
-        credential_data = load_json(os.path.join(get_credentials_dir(), credential_file))
-        if credential_data and credential_data.get('issuer_id') == issuer_id:
-            credentials.append(credential_data)
+    credentials = list(get_storage().find_credentials(issuer_id=issuer_id))
     
     # Create a mapping of index to credential details for display
     index_to_credential = {}
@@ -441,7 +477,7 @@ def revocation_status_route(issuer_id):
 @app.route('/issuer/<issuer_id>/toggle-revocation/<int:index>', methods=['POST'])
 def toggle_revocation_route(issuer_id, index):
     """Toggle the revocation status of a credential by index."""
-    issuer = load_issuer(issuer_id)
+    issuer = get_issuer(issuer_id)
     if not issuer:
         abort(404)
     
@@ -460,7 +496,7 @@ def toggle_revocation_route(issuer_id, index):
 @app.route('/issuer/<issuer_id>/direct-revoke/<credential_id>', methods=['POST'])
 def direct_revoke_credential_route(issuer_id, credential_id):
     """Directly revoke a credential by its ID."""
-    issuer = load_issuer(issuer_id)
+    issuer = get_issuer(issuer_id)
     if not issuer:
         abort(404)
     
@@ -19,7 +19,7 @@ sys.path.insert(0, current_dir)
 from issuer.issuer import create_issuer
 from holder.wallet import Wallet
 from verifier.verifier import Verifier
-from common.utils import create_directory_if_not_exists, get_data_dir, get_credentials_dir, get_wallets_dir, get_revocation_dir
+from common.utils import create_directory_if_not_exists, get_data_dir, get_issuers_dir, get_credentials_dir, get_wallets_dir, get_revocation_dir
 
 
 def setup_directories():
@@ -32,6 +32,7 @@ def setup_directories():
         shutil.rmtree(data_dir)
     
     # Create directories
+    create_directory_if_not_exists(get_issuers_dir())
     create_directory_if_not_exists(get_credentials_dir())
     create_directory_if_not_exists(get_wallets_dir())
     create_directory_if_not_exists(get_revocation_dir())
@@ -73,7 +74,8 @@ def issue_sample_credential(issuer, wallet):
         holder_id=wallet.holder_id,
         credential_type="RealID",
         attributes=attributes,
-        expiration_date=int(time.time()) + (365 * 86400)  # Valid for 1 year
+        expiration_date=int(time.time()) + (365 * 86400),  # Valid for 1 year
+        holder_public_key=wallet.public_key
     )
     
     # Add the credential to the wallet
@@ -115,7 +117,7 @@ def verify_credential(credential, presentation=None):
     verifier = Verifier()
     
     if presentation:
-        is_valid, details = verifier.verify_credential(presentation)
+        is_valid, details = verifier.verify_presentation(presentation)
         print(f"Verifying presentation for credential: {presentation['credential_id']}")
     else:
         is_valid, details = verifier.verify_credential(credential)
@@ -2,6 +2,14 @@
 Holder package for the privacy-preserving digital credential system.
 """
 
-from .wallet import Wallet
+from .wallet import (
+    Wallet, LazyCredentialMap, PresentationCache, compact_wallet, replay_wallet_records
+)
+from .matching import WalletIndex, normalize_request
+from .encryption import WalletKey
+from .refresh import ProofRefresher
 
-__all__ = ['Wallet']
\ No newline at end of file
+__all__ = [
+    'Wallet', 'LazyCredentialMap', 'PresentationCache', 'compact_wallet', 'replay_wallet_records',
+    'WalletIndex', 'normalize_request', 'WalletKey', 'ProofRefresher'
+]
\ No newline at end of file
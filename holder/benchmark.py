@@ -0,0 +1,83 @@
+"""
+Benchmark of batch presentation creation.
+
+Times Wallet.create_presentations against a loop calling
+Wallet.create_presentation once per request, on the same requests, and
+reports the presentations per second of each and the speedup.
+"""
+
+import json
+import time
+from typing import Any, Dict, List
+
+from holder.wallet import PresentationCache
+
+
+def _best_time(run, rounds: int) -> float:
+    """Get the shortest of several timed runs, in seconds."""
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run_presentation_benchmark(wallet, requests: List[Dict[str, Any]], rounds: int = 5,
+                               serialize: bool = False) -> Dict[str, Any]:
+    """
+    Create presentations for the same requests in a loop and in one batch.
+
+    The loop starts each round with an empty presentation cache, so both
+    sides prepare each credential once per round.
+
+    Args:
+        wallet (Wallet): Wallet holding the credentials
+        requests (list): Dicts with credential_id and optionally
+            selective_disclosure, as for create_presentations
+        rounds (int): Number of timed runs of each side; the fastest counts
+        serialize (bool): Time JSON strings instead of dicts; the loop
+            encodes each presentation with json.dumps
+
+    Returns:
+        dict: presentations, rounds, loop and batch (seconds and
+            presentations_per_second of each) and speedup
+    """
+    if not requests:
+        raise ValueError("No requests to present")
+
+    def loop():
+        wallet.presentation_cache = PresentationCache()
+        for request in requests:
+            presentation = wallet.create_presentation(
+                request['credential_id'], request.get('selective_disclosure')
+            )
+            if serialize:
+                json.dumps(presentation)
+
+    def batch():
+        for _ in wallet.create_presentations(requests, serialize=serialize):
+            pass
+
+    cache = wallet.presentation_cache
+    try:
+        loop_seconds = _best_time(loop, rounds)
+    finally:
+        wallet.presentation_cache = cache
+    batch_seconds = _best_time(batch, rounds)
+
+    def report(seconds):
+        return {
+            'seconds': round(seconds, 6),
+            'presentations_per_second': round(len(requests) / seconds, 1) if seconds else 0.0,
+        }
+
+    return {
+        'presentations': len(requests),
+        'rounds': rounds,
+        'loop': report(loop_seconds),
+        'batch': report(batch_seconds),
+        'speedup': round(loop_seconds / batch_seconds, 2) if batch_seconds else 0.0,
+    }
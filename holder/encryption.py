@@ -0,0 +1,190 @@
+"""
+Encryption of wallet containers at rest.
+
+Each credential record of an encrypted wallet is sealed on its own with
+AES-256-GCM, so a single credential can be decrypted on demand. A record
+stores the credential under a blinded key (an HMAC of its ID) and carries
+two ciphertexts: a small header holding the credential ID, and the body
+holding the credential. Opening a wallet only decrypts the headers.
+Both ciphertexts are bound to the holder and the blinded key as
+associated data, so records cannot be swapped between wallets or slots.
+
+The keys are derived once per session from the holder's passphrase with
+scrypt; the KDF parameters and salt are kept in the wallet document.
+"""
+
+import os
+import hmac
+import base64
+import hashlib
+from typing import Any, Dict
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+
+CIPHER = 'AES-256-GCM'
+
+# scrypt cost parameters of new wallets
+SCRYPT_N = 2 ** 15
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+_NONCE_SIZE = 12
+_SALT_SIZE = 16
+
+# Plaintext of the value that lets a wrong passphrase be told apart
+_CHECK_PLAINTEXT = b'wallet-key-check'
+
+
+def _encode(data: bytes) -> str:
+    """Encode bytes as unpadded URL-safe base64."""
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _decode(text: str) -> bytes:
+    """Decode unpadded URL-safe base64."""
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class WalletKey:
+    """
+    The keys of one encrypted wallet, derived from its passphrase.
+    """
+
+    def __init__(self, holder_id: str, master_key: bytes):
+        """
+        Initialize the keys from a master key.
+
+        Args:
+            holder_id (str): ID of the holder the keys belong to
+            master_key (bytes): 32-byte key derived from the passphrase
+        """
+        self.holder_id = holder_id
+        self._aead = AESGCM(self._expand(master_key, b'wallet-record-encryption'))
+        self._blinding_key = self._expand(master_key, b'wallet-record-blinding')
+
+    @staticmethod
+    def _expand(master_key: bytes, purpose: bytes) -> bytes:
+        """Derive a subkey for one purpose."""
+        return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=purpose).derive(master_key)
+
+    @staticmethod
+    def new_parameters() -> Dict[str, Any]:
+        """Create the KDF parameters of a new encrypted wallet."""
+        return {
+            'cipher': CIPHER,
+            'kdf': 'scrypt',
+            'salt': _encode(os.urandom(_SALT_SIZE)),
+            'n': SCRYPT_N,
+            'r': SCRYPT_R,
+            'p': SCRYPT_P,
+        }
+
+    @classmethod
+    def derive(cls, holder_id: str, passphrase: str, parameters: Dict[str, Any]) -> "WalletKey":
+        """
+        Derive the keys of a wallet from its passphrase.
+
+        Args:
+            holder_id (str): ID of the holder
+            passphrase (str): The holder's passphrase
+            parameters (dict): KDF parameters stored with the wallet
+
+        Returns:
+            WalletKey: The derived keys
+
+        Raises:
+            ValueError: If the parameters are not supported, or the
+                passphrase does not match their key check
+        """
+        if parameters.get('cipher') != CIPHER or parameters.get('kdf') != 'scrypt':
+            raise ValueError("Unsupported wallet encryption parameters")
+
+        master_key = Scrypt(
+            salt=_decode(parameters['salt']), length=32,
+            n=parameters['n'], r=parameters['r'], p=parameters['p']
+        ).derive(passphrase.encode('utf-8'))
+        key = cls(holder_id, master_key)
+
+        check = parameters.get('check')
+        if check is not None and not key.verify_check(check):
+            raise ValueError("Wrong wallet passphrase")
+        return key
+
+    def make_check(self) -> str:
+        """Seal a known value, stored with the wallet to detect wrong passphrases."""
+        return self.encrypt(_CHECK_PLAINTEXT, 'check')
+
+    def verify_check(self, check: str) -> bool:
+        """Check whether a stored key check was sealed with these keys."""
+        try:
+            return self.decrypt(check, 'check') == _CHECK_PLAINTEXT
+        except (InvalidTag, ValueError):
+            return False
+
+    def blind(self, credential_id: str) -> str:
+        """Get the blinded record key of a credential."""
+        digest = hmac.new(self._blinding_key, credential_id.encode('utf-8'), hashlib.sha256).digest()
+        return _encode(digest[:18])
+
+    def _associated_data(self, context: str) -> bytes:
+        """Bind a ciphertext to the holder and its place in the wallet."""
+        return f"{self.holder_id}|{context}".encode('utf-8')
+
+    def encrypt(self, plaintext: bytes, context: str) -> str:
+        """
+        Seal data.
+
+        Args:
+            plaintext (bytes): The data
+            context (str): Where the ciphertext is stored; must be given
+                again to decrypt it
+
+        Returns:
+            str: Base64 of the nonce followed by the ciphertext
+        """
+        nonce = os.urandom(_NONCE_SIZE)
+        return _encode(nonce + self._aead.encrypt(nonce, plaintext, self._associated_data(context)))
+
+    def decrypt(self, token: str, context: str) -> bytes:
+        """
+        Open data sealed by encrypt.
+
+        Raises:
+            cryptography.exceptions.InvalidTag: If the data was modified,
+                moved or sealed with another key
+        """
+        data = _decode(token)
+        return self._aead.decrypt(data[:_NONCE_SIZE], data[_NONCE_SIZE:], self._associated_data(context))
+
+    def seal_record(self, credential_id: str, credential_json: str) -> str:
+        """
+        Seal a credential into the key and payload of a container record.
+
+        Returns:
+            str: '<blinded key> <sealed header> <sealed body>'
+        """
+        blinded = self.blind(credential_id)
+        header = self.encrypt(credential_id.encode('utf-8'), f"{blinded}|header")
+        body = self.encrypt(credential_json.encode('utf-8'), f"{blinded}|body")
+        return f"{blinded} {header} {body}"
+
+    def open_header(self, blinded: str, sealed: str) -> str:
+        """
+        Get the credential ID of a sealed record payload without opening its body.
+
+        Args:
+            blinded (str): Blinded key of the record
+            sealed (str): '<sealed header> <sealed body>'
+        """
+        header = sealed.partition(' ')[0]
+        return self.decrypt(header, f"{blinded}|header").decode('utf-8')
+
+    def open_body(self, blinded: str, sealed: str) -> str:
+        """Get the credential JSON of a sealed record payload."""
+        body = sealed.partition(' ')[2]
+        return self.decrypt(body, f"{blinded}|body").decode('utf-8')
@@ -0,0 +1,213 @@
+"""
+Wallet query index for matching verifier requests.
+
+A presentation request names what a verifier wants, e.g.
+
+    {"type": "driver_license", "issuer_id": "<id>",
+     "attributes": ["DOB", "license_class"]}
+
+The index keeps the credential IDs of a wallet by type, issuer_id and
+attribute name, so a request is answered by intersecting a few sets
+instead of inspecting every credential. Proof checks against the
+issuer's current revocation root are only run for the candidates and
+are remembered per root.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from common.crypto import CryptoManager
+from common.models import Credential
+from common.utils import current_timestamp
+from common.storage import REVOCATION_PUBLIC
+
+
+def normalize_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validate a presentation request and bring it into canonical form.
+
+    Args:
+        request (dict): The request; every key is optional:
+            type (str): Required credential type
+            issuer_id (str or list): Accepted issuer ID(s)
+            attributes (list): Attribute names the credential must have
+            limit (int): Maximum number of candidates to return
+
+    Returns:
+        dict: The request with issuer_ids as a set and attributes as a list
+    """
+    if not isinstance(request, dict):
+        raise ValueError("A presentation request must be a dict")
+
+    issuer_ids = request.get('issuer_id', request.get('issuer_ids'))
+    if isinstance(issuer_ids, str):
+        issuer_ids = {issuer_ids}
+    elif issuer_ids is not None:
+        issuer_ids = set(issuer_ids)
+
+    attributes = request.get('attributes') or []
+    if isinstance(attributes, str) or not all(isinstance(a, str) for a in attributes):
+        raise ValueError("Requested attributes must be a list of names")
+
+    return {
+        'type': request.get('type'),
+        'issuer_ids': issuer_ids,
+        'attributes': list(attributes),
+        'limit': request.get('limit'),
+    }
+
+
+class WalletIndex:
+    """
+    In-memory indexes over the credentials of one wallet.
+    """
+
+    def __init__(self, storage, credentials: Iterable[Credential] = ()):
+        """
+        Initialize the index.
+
+        Args:
+            storage (StorageBackend): Storage holding the issuers' revocation roots
+            credentials: Credentials to index
+        """
+        self.storage = storage
+        self._credentials = {}  # Map of credential ID to credential
+        self._by_type = {}
+        self._by_issuer = {}
+        self._by_attribute = {}
+        self._proof_status = {}  # Map of credential ID to (root hash, proof is current)
+        for credential in credentials:
+            self.add(credential)
+
+    def add(self, credential: Credential) -> None:
+        """Index a credential, replacing any earlier version of it."""
+        self.remove(credential.id)
+        self._credentials[credential.id] = credential
+        self._by_type.setdefault(credential.type, set()).add(credential.id)
+        self._by_issuer.setdefault(credential.issuer_id, set()).add(credential.id)
+        for attribute in credential.attributes:
+            self._by_attribute.setdefault(attribute, set()).add(credential.id)
+
+    def remove(self, credential_id: str) -> None:
+        """Drop a credential from the index if it is indexed."""
+        credential = self._credentials.pop(credential_id, None)
+        if credential is None:
+            return
+        self._proof_status.pop(credential_id, None)
+        self._discard(self._by_type, credential.type, credential_id)
+        self._discard(self._by_issuer, credential.issuer_id, credential_id)
+        for attribute in credential.attributes:
+            self._discard(self._by_attribute, attribute, credential_id)
+
+    @staticmethod
+    def _discard(index: Dict[str, Set[str]], value: str, credential_id: str) -> None:
+        """Remove a credential ID from an index entry, dropping the entry once empty."""
+        ids = index.get(value)
+        if ids is not None:
+            ids.discard(credential_id)
+            if not ids:
+                del index[value]
+
+    def __len__(self):
+        return len(self._credentials)
+
+    def candidates(self, request: Dict[str, Any]) -> Set[str]:
+        """
+        Get the IDs of the credentials matching the type, issuers and
+        attributes of a normalized request.
+        """
+        id_sets = []
+        if request['type'] is not None:
+            id_sets.append(self._by_type.get(request['type'], set()))
+        if request['issuer_ids'] is not None:
+            id_sets.append(set().union(*(self._by_issuer.get(issuer_id, set())
+                                         for issuer_id in request['issuer_ids'])))
+        for attribute in request['attributes']:
+            id_sets.append(self._by_attribute.get(attribute, set()))
+
+        if not id_sets:
+            return set(self._credentials)
+        # Intersect starting from the smallest set
+        id_sets.sort(key=len)
+        candidates = set(id_sets[0])
+        for ids in id_sets[1:]:
+            if not candidates:
+                break
+            candidates &= ids
+        return candidates
+
+    def _get_root_hash(self, issuer_id: str, roots: Dict[str, Optional[str]]) -> Optional[str]:
+        """Get the current revocation root of an issuer, once per query."""
+        if issuer_id not in roots:
+            data = self.storage.get_readonly(REVOCATION_PUBLIC, issuer_id)
+            roots[issuer_id] = data.get('root_hash') if data else None
+        return roots[issuer_id]
+
+    def has_current_proof(self, credential: Credential, root_hash: Optional[str]) -> bool:
+        """Check a credential's non-revocation proof against a root, remembering the result."""
+        if root_hash is None:
+            return False
+        status = self._proof_status.get(credential.id)
+        if status is None or status[0] != root_hash:
+            status = (root_hash, CryptoManager.check_proof(
+                credential.non_revoked_proof, credential.revocation_uuid, root_hash
+            ))
+            self._proof_status[credential.id] = status
+        return status[1]
+
+    def stale(self, now: Optional[int] = None) -> List[Credential]:
+        """
+        Find the non-expired credentials whose proof does not match their
+        issuer's current revocation root.
+
+        Args:
+            now (int, optional): Timestamp to check expiration against
+
+        Returns:
+            list: The stale credentials
+        """
+        now = current_timestamp() if now is None else now
+        roots = {}
+
+        stale = []
+        for credential in self._credentials.values():
+            if credential.expiration_date and credential.expiration_date < now:
+                continue
+            root_hash = self._get_root_hash(credential.issuer_id, roots)
+            # Without a published root there is nothing to refresh against
+            if root_hash is not None and not self.has_current_proof(credential, root_hash):
+                stale.append(credential)
+        return stale
+
+    def match(self, request: Dict[str, Any], now: Optional[int] = None) -> List[Credential]:
+        """
+        Find the credentials able to answer a request.
+
+        Expired credentials and credentials whose proof does not match the
+        issuer's current revocation root are left out. The rest are ranked
+        by issuance date (newest first), then by expiration date (latest first).
+
+        Args:
+            request (dict): The presentation request (see normalize_request)
+            now (int, optional): Timestamp to check expiration against
+
+        Returns:
+            list: The matching credentials, best first
+        """
+        request = normalize_request(request)
+        now = current_timestamp() if now is None else now
+        roots = {}
+
+        matches = []
+        for credential_id in self.candidates(request):
+            credential = self._credentials[credential_id]
+            if credential.expiration_date and credential.expiration_date < now:
+                continue
+            if not self.has_current_proof(credential, self._get_root_hash(credential.issuer_id, roots)):
+                continue
+            matches.append(credential)
+
+        matches.sort(key=lambda c: (c.issuance_date, c.expiration_date or float('inf'), c.id),
+                     reverse=True)
+        if request['limit'] is not None:
+            matches = matches[:request['limit']]
+        return matches
@@ -0,0 +1,164 @@
+"""
+Background refresh of non-revocation proofs.
+
+A credential's proof only verifies against the issuer's revocation root
+it was generated for, and the root changes on every issuance and
+revocation. The refresher periodically compares the proofs held by
+wallets with the current public roots, asks each issuer once for fresh
+proofs of all of its stale credentials, and writes each wallet's
+refreshed credentials back with a single save.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+from common.models import Credential
+from common.storage import get_storage, ISSUERS, WALLETS
+from issuer import Issuer
+from .wallet import Wallet
+from .encryption import WalletKey
+
+
+logger = logging.getLogger(__name__)
+
+# Refreshes the credentials with the given IDs for one issuer
+IssuerClient = Callable[[str, List[str]], Dict[str, Credential]]
+
+
+class ProofRefresher:
+    """
+    Keeps the non-revocation proofs of wallets current, on a schedule.
+
+    A background run that fails is logged and retried on the next
+    interval; failures counts the failed runs and last_error holds the
+    exception of the latest one.
+    """
+
+    def __init__(self, holder_ids: Optional[Iterable[str]] = None, interval: float = 300,
+                 max_workers: int = 4, issuer_client: Optional[IssuerClient] = None,
+                 wallet_keys: Optional[Dict[str, WalletKey]] = None, storage=None):
+        """
+        Initialize the refresher.
+
+        Args:
+            holder_ids (iterable, optional): Wallets to refresh; every stored
+                wallet if not given
+            interval (float): Seconds between refresh runs
+            max_workers (int): Maximum number of issuer requests in flight
+            issuer_client (callable, optional): Called with an issuer ID and
+                credential IDs; returns the refreshed credentials by ID.
+                Defaults to asking the locally stored issuer.
+            wallet_keys (dict, optional): Session keys of encrypted wallets
+                by holder ID; encrypted wallets without a key are skipped
+            storage (StorageBackend, optional): Storage to use instead of the default
+        """
+        self.storage = storage or get_storage()
+        self.holder_ids = list(holder_ids) if holder_ids is not None else None
+        self.interval = interval
+        self.max_workers = max_workers
+        self.issuer_client = issuer_client or self._refresh_with_local_issuer
+        self.wallet_keys = wallet_keys or {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.failures = 0
+        self.last_error = None
+
+    def _refresh_with_local_issuer(self, issuer_id: str, credential_ids: List[str]) -> Dict[str, Credential]:
+        """Refresh credentials through an issuer of the same storage."""
+        if not self.storage.exists(ISSUERS, issuer_id):
+            return {}
+        return Issuer(issuer_id=issuer_id, storage=self.storage).refresh_credentials(credential_ids)
+
+    def refresh(self, now: Optional[int] = None) -> Dict[str, int]:
+        """
+        Run one refresh over the wallets.
+
+        Stale credentials of every wallet are grouped by issuer, so each
+        issuer gets a single request per run, and at most max_workers
+        requests run at once.
+
+        Args:
+            now (int, optional): Timestamp to check expiration against
+
+        Returns:
+            dict: Number of wallets, stale credentials, refreshed
+                credentials and failed issuer requests
+        """
+        holder_ids = self.holder_ids
+        if holder_ids is None:
+            holder_ids = list(self.storage.keys(WALLETS))
+
+        wallets = {}
+        stale_by_issuer = {}  # Map of issuer ID to IDs of its stale credentials
+        stale_count = 0
+        for holder_id in holder_ids:
+            wallet = Wallet(holder_id=holder_id, storage=self.storage,
+                            key=self.wallet_keys.get(holder_id))
+            if wallet.encrypted and wallet.key is None:
+                continue
+            stale = wallet.find_stale_credentials(now=now)
+            if not stale:
+                continue
+            wallets[holder_id] = wallet
+            stale_count += len(stale)
+            for credential in stale:
+                stale_by_issuer.setdefault(credential.issuer_id, []).append(credential.id)
+
+        refreshed = {}  # Map of credential ID to refreshed credential
+        failed = 0
+        if stale_by_issuer:
+            with ThreadPoolExecutor(max_workers=self.max_workers,
+                                    thread_name_prefix='proof-refresh') as executor:
+                futures = {issuer_id: executor.submit(self.issuer_client, issuer_id, credential_ids)
+                           for issuer_id, credential_ids in stale_by_issuer.items()}
+                for issuer_id, future in futures.items():
+                    try:
+                        refreshed.update(future.result())
+                    except Exception:
+                        # The issuer is retried on the next run
+                        failed += 1
+                        logger.warning("Refreshing proofs with issuer %s failed", issuer_id, exc_info=True)
+
+        refreshed_count = 0
+        for wallet in wallets.values():
+            updates = [refreshed[credential_id] for credential_id in wallet.credentials
+                       if credential_id in refreshed]
+            if updates:
+                wallet.update_credentials(updates)
+                refreshed_count += len(updates)
+
+        return {
+            'wallets': len(wallets),
+            'stale': stale_count,
+            'refreshed': refreshed_count,
+            'failed': failed,
+        }
+
+    def start(self) -> None:
+        """Start refreshing in a background thread, beginning with an immediate run."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='proof-refresher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the background thread after its current run."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        """Refresh every interval until stopped."""
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                # A failed run must not end the schedule
+                self.failures += 1
+                self.last_error = e
+                logger.exception("Proof refresh run failed")
+            self._stop.wait(self.interval)
@@ -2,22 +2,395 @@
 Wallet module for the privacy-preserving digital credential system.
 """
 
-import os
 import json
-from typing import Dict, List, Any, Optional
+import time
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Callable, Dict, Iterable, Iterator, List, Any, Optional
 
-from common.models import Credential
-from common.utils import (
-    generate_id, save_json, load_json, get_wallets_dir, get_credentials_dir
-)
+from cryptography.exceptions import InvalidTag
+
+from common.crypto import CryptoManager
+from common.models import Credential, attribute_digest, holder_binding_json
+from common.utils import generate_id
+from common.storage import get_storage, WALLETS, CREDENTIALS, REVOCATION_PUBLIC
+from holder.matching import WalletIndex
+from holder.encryption import WalletKey
+
+
+_NOT_LOADED = object()
+
+
+class LazyCredentialMap(MutableMapping):
+    """
+    Map of credential ID to credential that loads each record on first access.
+
+    Listing, counting and membership tests only use the IDs, so they never
+    parse a credential. A credential whose record cannot be loaded is
+    dropped from the map when it is first accessed.
+    """
+
+    def __init__(self, loader: Callable[[str], Optional[Credential]],
+                 credential_ids: Iterable[str] = ()):
+        """
+        Initialize the map.
+
+        Args:
+            loader (callable): Loads a credential by ID; returns None if not found
+            credential_ids: IDs of the credentials, in order
+        """
+        self._loader = loader
+        self._credentials = dict.fromkeys(credential_ids, _NOT_LOADED)
+
+    def __getitem__(self, credential_id):
+        credential = self._credentials[credential_id]
+        if credential is _NOT_LOADED:
+            credential = self._loader(credential_id)
+            if credential is None:
+                self._credentials.pop(credential_id, None)
+                raise KeyError(credential_id)
+            self._credentials[credential_id] = credential
+        return credential
+
+    def __setitem__(self, credential_id, credential):
+        self._credentials[credential_id] = credential
+
+    def __delitem__(self, credential_id):
+        del self._credentials[credential_id]
+
+    def __contains__(self, credential_id):
+        return credential_id in self._credentials
+
+    def __iter__(self):
+        return iter(list(self._credentials))
+
+    def __len__(self):
+        return len(self._credentials)
+
+    def is_loaded(self, credential_id) -> bool:
+        """Check whether a credential has already been loaded."""
+        return self._credentials.get(credential_id, _NOT_LOADED) is not _NOT_LOADED
+
+
+# A wallet's container is compacted in the background once it holds at
+# least this many superseded records, and more of them than live records
+COMPACTION_MIN_GARBAGE = 64
+
+# Number of times a compaction is retried when records are appended meanwhile
+_COMPACTION_ATTEMPTS = 3
+
+# Container record kinds: "P <key> <payload>" stores a credential, "D <key>"
+# removes it. The key is the credential ID and the payload its JSON, or
+# in an encrypted wallet a blinded key and the sealed credential
+_PUT = 'P'
+_DELETE = 'D'
+
+_compaction_lock = threading.Lock()
+_pending_compactions = set()
+
+
+def _put_record(record_key: str, payload: str) -> str:
+    """Build the container record storing a credential."""
+    return f"{_PUT} {record_key} {payload}"
+
+
+def _delete_record(record_key: str) -> str:
+    """Build the container record removing a credential."""
+    return f"{_DELETE} {record_key}"
+
+
+def replay_wallet_records(records: Iterable[str]) -> Dict[str, str]:
+    """
+    Replay the records of a wallet container without parsing the credentials.
+
+    Args:
+        records: Container records in the order they were appended
+
+    Returns:
+        dict: Map of record key to payload of the live credentials
+    """
+    credentials = {}
+    for record in records:
+        kind, _, rest = record.partition(' ')
+        if kind == _PUT:
+            record_key, _, payload = rest.partition(' ')
+            credentials[record_key] = payload
+        elif kind == _DELETE:
+            credentials.pop(rest, None)
+    return credentials
+
+
+def compact_wallet(holder_id: str, storage=None) -> bool:
+    """
+    Rewrite a wallet's container with only its live credentials.
+
+    Args:
+        holder_id (str): ID of the holder
+        storage (StorageBackend, optional): Storage to use instead of the default
+
+    Returns:
+        bool: False if records kept being appended while it was being
+            compacted and the container was left as it was
+    """
+    storage = storage or get_storage()
+    for _ in range(_COMPACTION_ATTEMPTS):
+        records = storage.read_wallet_records(holder_id)
+        live = replay_wallet_records(records)
+        if len(live) == len(records):
+            return True
+        compacted = [_put_record(record_key, payload) for record_key, payload in live.items()]
+        if storage.replace_wallet_records(holder_id, compacted, expected_count=len(records)):
+            return True
+    return False
+
+
+def _schedule_compaction(holder_id: str, storage) -> None:
+    """Compact a wallet's container on a background thread, unless already scheduled."""
+    with _compaction_lock:
+        if holder_id in _pending_compactions:
+            return
+        _pending_compactions.add(holder_id)
+
+    def run():
+        try:
+            compact_wallet(holder_id, storage)
+        finally:
+            with _compaction_lock:
+                _pending_compactions.discard(holder_id)
+
+    threading.Thread(target=run, name=f"wallet-compaction-{holder_id[:8]}", daemon=True).start()
+
+
+class PresentationCache:
+    """
+    Bounded LRU cache of presentations with a time to live.
+    
+    Keys are (credential ID, sorted disclosed attribute names, issuer
+    revocation root), so a presentation is never served once the issuer's
+    root has moved on. Entries of a credential are dropped explicitly when
+    the credential is replaced or removed.
+    """
+    
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize the cache.
+        
+        Args:
+            max_entries (int): Maximum number of cached presentations
+            ttl (float): Seconds a presentation stays cached
+            clock (callable): Monotonic time source
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # Key -> (expiry time, presentation)
+        self._keys_by_credential = {}  # Credential ID -> keys of its entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    @staticmethod
+    def make_key(credential_id: str, selective_disclosure, root_hash: Optional[str]) -> tuple:
+        """Build the cache key of a presentation request."""
+        if selective_disclosure and isinstance(selective_disclosure, list):
+            disclosed = tuple(sorted(set(selective_disclosure)))
+        else:
+            disclosed = None  # Every attribute
+        return (credential_id, disclosed, root_hash)
+    
+    def get(self, key: tuple) -> Optional[Dict[str, Any]]:
+        """Get a cached presentation, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def put(self, key: tuple, presentation: Dict[str, Any]) -> None:
+        """Cache a presentation."""
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (self._clock() + self.ttl, presentation)
+            self._keys_by_credential.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+    
+    def _remove(self, key: tuple) -> None:
+        """Drop an entry. Called with the lock held."""
+        if self._entries.pop(key, None) is None:
+            return
+        keys = self._keys_by_credential.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_credential[key[0]]
+    
+    def invalidate_credential(self, credential_id: str) -> None:
+        """Drop every cached presentation of a credential."""
+        with self._lock:
+            for key in list(self._keys_by_credential.get(credential_id, ())):
+                self._remove(key)
+    
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_credential.clear()
+    
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the cache metrics.
+        
+        Returns:
+            dict: hits, misses, evictions, expirations and entries
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'entries': len(self._entries),
+            }
+
+
+def _holder_signature(private_key: str, challenge: str, credential_id: str,
+                      attributes: Dict[str, Any], disclosures: Dict[str, str]) -> str:
+    """Sign a challenge and the disclosed attributes with the holder's key."""
+    digests = [attribute_digest(disclosures[name], name, value) for name, value in attributes.items()]
+    return CryptoManager.sign(private_key, holder_binding_json(challenge, credential_id, digests))
+
+
+class _PreparedCredential:
+    """
+    The parts of a credential's presentations that do not depend on the
+    disclosed attributes, computed once and shared between presentations.
+    """
+    
+    def __init__(self, credential: Credential, holder_id: str, holder_private_key: Optional[str] = None):
+        self.credential = credential
+        # Challenges are only signed for credentials certifying the holder's key
+        self.holder_private_key = (
+            holder_private_key if credential.holder_public_key and credential.presentation_signature else None
+        )
+        # This is a simplified presentation without actual ZKPs
+        # In a real implementation, this would generate ZKPs for selective disclosure
+        self.base = {
+            'credential_id': credential.id,
+            'issuer_id': credential.issuer_id,
+            'holder_id': holder_id,
+            'type': credential.type,
+            'revocation_uuid': credential.revocation_uuid,  # Include for revocation checking
+            'proof': credential.non_revoked_proof,
+            'signature': credential.signature,
+        }
+        if credential.presentation_signature is not None:
+            # What the verifier needs to check the disclosed attributes
+            self.base.update({
+                'issuer_name': credential.issuer_name,
+                'issuance_date': credential.issuance_date,
+                'expiration_date': credential.expiration_date,
+                'attribute_digests': credential.attribute_digests(),
+                'presentation_signature': credential.presentation_signature,
+            })
+            if credential.holder_public_key is not None:
+                self.base['holder_public_key'] = credential.holder_public_key
+        self._json_prefix = None
+        self._attribute_json = {}  # Map of attribute name to its '"name": value' member
+    
+    def _disclosed(self, selective_disclosure) -> List[str]:
+        """Get the names of the attributes a presentation discloses."""
+        attributes = self.credential.attributes
+        # If selective disclosure is requested, only include those attributes
+        if selective_disclosure and isinstance(selective_disclosure, list):
+            return [attr for attr in dict.fromkeys(selective_disclosure) if attr in attributes]
+        # Include all attributes
+        return list(attributes)
+    
+    def presentation(self, selective_disclosure=None, challenge=None) -> Dict[str, Any]:
+        """Build a presentation disclosing the given attributes, answering a verifier's challenge if given."""
+        attributes = self.credential.attributes
+        presentation = dict(self.base)
+        disclosed = self._disclosed(selective_disclosure)
+        presentation['attributes'] = {attr: attributes[attr] for attr in disclosed}
+        if self.credential.presentation_signature is not None:
+            salts = self.credential.disclosure_salts
+            presentation['disclosures'] = {attr: salts[attr] for attr in disclosed}
+        if challenge is not None:
+            presentation['challenge'] = challenge
+            if self.holder_private_key is not None:
+                presentation['holder_signature'] = _holder_signature(
+                    self.holder_private_key, challenge, self.credential.id,
+                    presentation['attributes'], presentation['disclosures']
+                )
+        return presentation
+    
+    def presentation_json(self, selective_disclosure=None, challenge=None) -> str:
+        """Build the JSON encoding of a presentation disclosing the given attributes."""
+        if self._json_prefix is None:
+            self._json_prefix = json.dumps(self.base)[:-1] + ', "attributes": {'
+        
+        disclosed = self._disclosed(selective_disclosure)
+        members = []
+        for attr in disclosed:
+            member = self._attribute_json.get(attr)
+            if member is None:
+                member = self._attribute_json[attr] = json.dumps(
+                    {attr: self.credential.attributes[attr]}
+                )[1:-1]
+            members.append(member)
+        suffix = '}' if challenge is None else ', "challenge": ' + json.dumps(challenge) + '}'
+        if self.credential.presentation_signature is None:
+            return self._json_prefix + ', '.join(members) + '}' + suffix
+        
+        salts = self.credential.disclosure_salts
+        disclosed_salts = {attr: salts[attr] for attr in disclosed}
+        if challenge is not None and self.holder_private_key is not None:
+            signature = _holder_signature(
+                self.holder_private_key, challenge, self.credential.id,
+                {attr: self.credential.attributes[attr] for attr in disclosed}, disclosed_salts
+            )
+            suffix = suffix[:-1] + ', "holder_signature": ' + json.dumps(signature) + '}'
+        disclosures = json.dumps(disclosed_salts)
+        return self._json_prefix + ', '.join(members) + '}, "disclosures": ' + disclosures + suffix
 
 
 class Wallet:
     """
     Digital wallet for storing and presenting credentials.
+
+    The holder's copies of their credentials are kept in a per-wallet
+    container of append-only records (see StorageBackend.read_wallet_records),
+    next to a small wallet document with the holder's name. Adding or
+    removing a credential appends one record; opening the credentials reads
+    the whole container at once. Superseded records are compacted away in
+    the background.
+    
+    A wallet can be encrypted at rest with a passphrase (see
+    holder.encryption). Its records are then sealed one by one, so opening
+    it only decrypts the credential IDs and each credential is decrypted
+    when it is first accessed. The holder's name stays readable.
+    
+    Each wallet has an Ed25519 holder key. Issuers certify its public key
+    in the credentials they issue, and the wallet signs every challenge it
+    answers with the private key, which is sealed with the other records
+    in an encrypted wallet.
     """
     
-    def __init__(self, holder_id=None, name=None):
+    def __init__(self, holder_id=None, name=None, storage=None, presentation_cache=None,
+                 passphrase=None, key=None):
         """
         Initialize a wallet for a holder.
         
@@ -25,46 +398,190 @@ class Wallet:
             holder_id (str, optional): ID of the holder.
                 If not provided, a new one will be generated.
             name (str, optional): Name of the holder.
+            storage (StorageBackend, optional): Storage to use instead of the default.
+            presentation_cache (PresentationCache, optional): Cache of
+                repeated presentations; each wallet gets its own by default.
+            passphrase (str, optional): Passphrase of an encrypted wallet.
+                A new wallet created with a passphrase is encrypted.
+            key (WalletKey, optional): Keys already derived in this session,
+                instead of the passphrase
+        
+        Raises:
+            ValueError: If the passphrase or key does not match the wallet
         """
+        self.storage = storage or get_storage()
+        self.presentation_cache = presentation_cache or PresentationCache()
         self.holder_id = holder_id or generate_id()
         self.name = name or f"Holder-{self.holder_id[:8]}"
-        self.credentials = {}  # Map of credential ID to credential
+        self._stored = False
+        # Credential IDs of a wallet saved before containers existed
+        self._legacy_credential_ids = None
+        # Container state, read on first access to the credentials
+        self._credentials = None
+        self._credential_records = {}  # Map of credential ID to (record key, payload)
+        self._record_count = 0
+        # Query index, built on the first request match
+        self._index = None
+        # Encryption parameters and keys of an encrypted wallet
+        self._encryption = None
+        self._key = None
+        # The holder key: public_key and either private_key or, as stored
+        # in a locked encrypted wallet, sealed_private_key
+        self._holder_key = None
         
         # Load existing wallet if it exists
         self._load_wallet()
-    
-    def _get_wallet_file_path(self):
-        """Get the file path for the wallet data."""
-        return os.path.join(get_wallets_dir(), f"wallet_{self.holder_id}.json")
+        self._unlock(passphrase, key)
+        if not self._stored:
+            self._holder_key = CryptoManager.generate_keypair()
     
     def _load_wallet(self):
-        """Load the wallet data from disk."""
-        wallet_file = self._get_wallet_file_path()
+        """
+        Load the wallet data from storage.
+        The credentials are read on first access.
+        """
+        wallet_data = self.storage.get(WALLETS, self.holder_id)
         
-        if os.path.exists(wallet_file):
-            wallet_data = load_json(wallet_file)
+        if wallet_data:
             self.holder_id = wallet_data.get('holder_id', self.holder_id)
             self.name = wallet_data.get('name', self.name)
-            
-            # Load credentials
-            credential_ids = wallet_data.get('credential_ids', [])
-            for cred_id in credential_ids:
-                credential = self._load_credential(cred_id)
-                if credential:
-                    self.credentials[cred_id] = credential
+            self._legacy_credential_ids = wallet_data.get('credential_ids')
+            self._encryption = wallet_data.get('encryption')
+            self._holder_key = wallet_data.get('holder_key')
+            self._stored = True
+    
+    def _unlock(self, passphrase=None, key=None):
+        """Set up the keys of an encrypted wallet, or of a new one created with a passphrase."""
+        if passphrase is None and key is None:
+            return
+        if self._encryption is None:
+            if self._stored:
+                raise ValueError("Wallet is not encrypted; use enable_encryption()")
+            self._start_encryption(passphrase, key)
+            return
+        
+        if key is not None:
+            if key.holder_id != self.holder_id or not key.verify_check(self._encryption.get('check', '')):
+                raise ValueError("Wrong wallet key")
+            self._key = key
+        else:
+            self._key = WalletKey.derive(self.holder_id, passphrase, self._encryption)
+    
+    def _start_encryption(self, passphrase=None, key=None):
+        """Create the encryption parameters and keys of the wallet."""
+        if key is not None:
+            raise ValueError("A new encrypted wallet needs a passphrase")
+        parameters = WalletKey.new_parameters()
+        self._key = WalletKey.derive(self.holder_id, passphrase, parameters)
+        parameters['check'] = self._key.make_check()
+        self._encryption = parameters
+    
+    @property
+    def encrypted(self) -> bool:
+        """Whether the wallet's credentials are encrypted at rest."""
+        return self._encryption is not None
+    
+    @property
+    def key(self) -> Optional[WalletKey]:
+        """The keys of an unlocked encrypted wallet, reusable for this session."""
+        return self._key
+    
+    @property
+    def public_key(self) -> Optional[str]:
+        """
+        The holder's base64-encoded public key, for issuers to certify.
+        
+        Wallets saved before holder keys get a key on first access. That
+        needs the keys of an encrypted wallet; while it is locked, this is None.
+        """
+        if self._holder_key is None:
+            if self.encrypted and self._key is None:
+                return None
+            self._holder_key = CryptoManager.generate_keypair()
+            if self._stored:
+                self._save_wallet()
+        return self._holder_key['public_key']
+    
+    def _holder_private_key(self) -> Optional[str]:
+        """Get the holder's private key, or None if there is none or the wallet is locked."""
+        holder_key = self._holder_key
+        if holder_key is None:
+            return None
+        if 'private_key' in holder_key:
+            return holder_key['private_key']
+        if self._key is None:
+            return None
+        private_key = self._key.decrypt(holder_key['sealed_private_key'], 'holder-key').decode('utf-8')
+        self._holder_key = {'public_key': holder_key['public_key'], 'private_key': private_key}
+        return private_key
+    
+    def _stored_holder_key(self) -> Dict[str, str]:
+        """Get the holder key as saved, with the private key sealed in an encrypted wallet."""
+        private_key = self._holder_private_key()
+        if private_key is None:
+            return self._holder_key
+        if self._key is None:
+            return {'public_key': self._holder_key['public_key'], 'private_key': private_key}
+        return {
+            'public_key': self._holder_key['public_key'],
+            'sealed_private_key': self._key.encrypt(private_key.encode('utf-8'), 'holder-key'),
+        }
+    
+    @property
+    def credentials(self) -> LazyCredentialMap:
+        """Map of credential ID to credential, loaded on first access."""
+        if self._credentials is None:
+            self._open_container()
+        return self._credentials
+    
+    def _open_container(self):
+        """
+        Read the wallet's container with a single read.
+        Credentials are only parsed when they are accessed.
+        """
+        if self._legacy_credential_ids is not None:
+            self._credentials = LazyCredentialMap(self._load_credential, self._legacy_credential_ids)
+            return
+        if self.encrypted and self._key is None:
+            raise ValueError("Wallet is encrypted; a passphrase is required")
+        
+        records = self.storage.read_wallet_records(self.holder_id)
+        self._credential_records = {}
+        for record_key, payload in replay_wallet_records(records).items():
+            credential_id = self._open_record_key(record_key, payload)
+            self._credential_records[credential_id] = (record_key, payload)
+        self._record_count = len(records)
+        self._credentials = LazyCredentialMap(self._parse_credential, self._credential_records)
+        self._check_compaction()
+    
+    def save(self):
+        """
+        Save the wallet to storage.
+        
+        A new wallet is otherwise only saved with its first credential;
+        saving it right away stores its holder key (and encryption
+        parameters) for issuers to certify.
+        """
+        self._save_wallet()
     
     def _save_wallet(self):
-        """Save the wallet data to disk."""
+        """Save the wallet data to storage."""
         wallet_data = {
             'holder_id': self.holder_id,
-            'name': self.name,
-            'credential_ids': list(self.credentials.keys())
+            'name': self.name
         }
-        save_json(wallet_data, self._get_wallet_file_path())
+        if self._legacy_credential_ids is not None:
+            wallet_data['credential_ids'] = list(self._legacy_credential_ids)
+        if self._encryption is not None:
+            wallet_data['encryption'] = self._encryption
+        if self._holder_key is not None:
+            wallet_data['holder_key'] = self._stored_holder_key()
+        self.storage.put(WALLETS, self.holder_id, wallet_data)
+        self._stored = True
     
     def _load_credential(self, credential_id):
         """
-        Load a credential from disk.
+        Load a credential from storage.
         
         Args:
             credential_id (str): ID of the credential to load
@@ -72,17 +589,94 @@ class Wallet:
         Returns:
             Credential: The loaded credential, or None if not found
         """
-        credential_path = os.path.join(
-            get_credentials_dir(), 
-            f"credential_{credential_id}.json"
-        )
+        credential_data = self.storage.get(CREDENTIALS, credential_id)
         
-        if os.path.exists(credential_path):
-            credential_data = load_json(credential_path)
+        if credential_data:
             return Credential(**credential_data)
         
         return None
     
+    def _encode_record(self, credential_id, credential_json):
+        """Get the (record key, payload) storing a credential, sealed if the wallet is encrypted."""
+        if self._key is None:
+            return credential_id, credential_json
+        record_key, _, payload = self._key.seal_record(credential_id, credential_json).partition(' ')
+        return record_key, payload
+    
+    def _open_record_key(self, record_key, payload):
+        """Get the credential ID of a container record, decrypting only its header."""
+        if self._key is None:
+            return record_key
+        try:
+            return self._key.open_header(record_key, payload)
+        except InvalidTag:
+            raise ValueError("Wallet record failed authentication")
+    
+    def _parse_credential(self, credential_id):
+        """Parse a credential of the container, or return None if it has none."""
+        entry = self._credential_records.get(credential_id)
+        if not entry:
+            return None
+        record_key, payload = entry
+        if self._key is not None:
+            try:
+                payload = self._key.open_body(record_key, payload)
+            except InvalidTag:
+                raise ValueError("Wallet record failed authentication")
+        return Credential.from_json(payload)
+    
+    def _record_key(self, credential_id):
+        """Get the key under which the container stores a credential."""
+        entry = self._credential_records.get(credential_id)
+        if entry is not None:
+            return entry[0]
+        return self._key.blind(credential_id) if self._key is not None else credential_id
+    
+    def enable_encryption(self, passphrase):
+        """
+        Encrypt the wallet at rest, rewriting its container with sealed records.
+        
+        Args:
+            passphrase (str): The holder's passphrase
+        """
+        if self.encrypted:
+            raise ValueError("Wallet is already encrypted")
+        
+        self.list_credentials()  # Load every credential before the keys change
+        self._start_encryption(passphrase)
+        self._rewrite_container()
+    
+    def _migrate_container(self):
+        """Move the credentials of a wallet saved before containers existed into a container."""
+        self._rewrite_container()
+    
+    def _rewrite_container(self):
+        """Replace the container with the current credentials, encoded with the current keys."""
+        records = [_put_record(*self._encode_record(credential.id, credential.to_json()))
+                   for credential in self.list_credentials()]
+        with self.storage.batch():
+            self.storage.replace_wallet_records(self.holder_id, records)
+            self._legacy_credential_ids = None
+            self._save_wallet()
+        self._credentials = None
+        self._open_container()
+    
+    def _append_records(self, records):
+        """Append records to the container, saving the wallet first if it is new."""
+        with self.storage.batch():
+            if not self._stored:
+                self._save_wallet()
+            self.storage.append_wallet_records(self.holder_id, records)
+        self._record_count += len(records)
+    
+    def _check_compaction(self):
+        """Schedule a compaction once enough of the container is superseded."""
+        garbage = self._record_count - len(self._credential_records)
+        if garbage >= COMPACTION_MIN_GARBAGE and garbage > len(self._credential_records):
+            _schedule_compaction(self.holder_id, self.storage)
+            # The container is now counted as compacted
+            self._record_count = len(self._credential_records)
+    
     def add_credential(self, credential):
         """
         Add a credential to the wallet.
@@ -90,18 +684,46 @@ class Wallet:
         Args:
             credential (Credential): The credential to add
         """
-        if not isinstance(credential, Credential):
-            raise ValueError("Credential should be of type Credential")
+        self.update_credentials([credential])
+    
+    def update_credentials(self, credentials):
+        """
+        Add or replace several credentials with a single write.
         
-        # Check if the credential is meant for this holder
-        if credential.holder_id != self.holder_id:
-            raise ValueError("Credential's holder_id does not match that of the wallet.")
+        Args:
+            credentials (list): The credentials to store
+        """
+        for credential in credentials:
+            if not isinstance(credential, Credential):
+                raise ValueError("Credential should be of type Credential")
+            
+            # Check if the credential is meant for this holder
+            if credential.holder_id != self.holder_id:
+                raise ValueError("Credential's holder_id does not match that of the wallet.")
         
-        # Add the credential to the wallet
-        self.credentials[credential.id] = credential
+        if not credentials:
+            return
         
-        # Save the wallet
-        self._save_wallet()
+        if self._legacy_credential_ids is not None:
+            self._migrate_container()
+        
+        if self.encrypted and self._key is None:
+            raise ValueError("Wallet is encrypted; a passphrase is required")
+        
+        # Append the credentials to the wallet's container
+        encoded = [(credential, self._encode_record(credential.id, credential.to_json()))
+                   for credential in credentials]
+        self._append_records([_put_record(*entry) for _, entry in encoded])
+        
+        if self._credentials is not None:
+            for credential, entry in encoded:
+                self._credential_records[credential.id] = entry
+                self._credentials[credential.id] = credential
+            self._check_compaction()
+        for credential in credentials:
+            self.presentation_cache.invalidate_credential(credential.id)
+            if self._index is not None:
+                self._index.add(credential)
         
     def get_credential(self, credential_id) -> Optional[Credential]:
         """
@@ -117,14 +739,49 @@ class Wallet:
 
     def list_credentials(self):
         """
-        List all credentials in the wallet.
+        List all credentials in the wallet, loading any not loaded yet.
         
         Returns:
             list: List of credentials
         """
-        return list(self.credentials.values())
+        credentials = (self.credentials.get(credential_id) for credential_id in self.credentials)
+        return [credential for credential in credentials if credential is not None]
+    
+    def match_request(self, request, now=None) -> List[Credential]:
+        """
+        Find the credentials that can answer a verifier's presentation request.
+        The wallet's query index is built on the first call and kept up to date.
+        
+        Args:
+            request (dict): The request, e.g. {"type": ..., "issuer_id": ...,
+                "attributes": [...]} (see holder.matching.normalize_request)
+            now (int, optional): Timestamp to check expiration against
+            
+        Returns:
+            list: Non-expired credentials with current proofs, best first
+        """
+        return self._get_index().match(request, now=now)
     
-    def create_presentation(self, credential_id, selective_disclosure=None):
+    def find_stale_credentials(self, now=None) -> List[Credential]:
+        """
+        Find the non-expired credentials whose non-revocation proof no
+        longer matches their issuer's current revocation root.
+        
+        Args:
+            now (int, optional): Timestamp to check expiration against
+            
+        Returns:
+            list: The credentials whose proofs need to be refreshed
+        """
+        return self._get_index().stale(now=now)
+    
+    def _get_index(self) -> WalletIndex:
+        """Get the wallet's query index, building it on first use."""
+        if self._index is None:
+            self._index = WalletIndex(self.storage, self.list_credentials())
+        return self._index
+    
+    def create_presentation(self, credential_id, selective_disclosure=None, challenge=None):
         """
         Create a presentation of a credential.
         For simplicity, this implementation doesn't actually implement
@@ -134,6 +791,10 @@ class Wallet:
         Args:
             credential_id (str): ID of the credential to present
             selective_disclosure (list, optional): List of attributes to disclose
+            challenge (str, optional): Challenge from the verifier
+                (Verifier.create_challenge), signed with the holder key
+                together with the disclosed attributes; the verifier then
+                accepts the presentation only once
             
         Returns:
             dict: The presentation data
@@ -142,30 +803,86 @@ class Wallet:
         if not credential:
             return None
         
-        # This is a simplified presentation without actual ZKPs
-        # In a real implementation, this would generate ZKPs for selective disclosure
-        presentation = {
-            'credential_id': credential.id,
-            'issuer_id': credential.issuer_id,
-            'holder_id': self.holder_id,
-            'type': credential.type,
-            'revocation_uuid': credential.revocation_uuid,  # Include for revocation checking
-            'proof': credential.non_revoked_proof,
-            'signature': credential.signature,
-            'attributes': {}
-        }
-        
-        # If selective disclosure is requested, only include those attributes
-        if selective_disclosure and isinstance(selective_disclosure, list):
-            for attr in selective_disclosure:
-                if attr in credential.attributes:
-                    presentation['attributes'][attr] = credential.attributes[attr]
-        else:
-            # Include all attributes
-            presentation['attributes'] = credential.attributes.copy()
+        # Repeated requests are served from the cache while the issuer's root is unchanged
+        root_data = self.storage.get_readonly(REVOCATION_PUBLIC, credential.issuer_id)
+        key = PresentationCache.make_key(
+            credential_id, selective_disclosure, root_data.get('root_hash') if root_data else None
+        )
+        presentation = self.presentation_cache.get(key)
+        if presentation is None:
+            presentation = _PreparedCredential(credential, self.holder_id).presentation(selective_disclosure)
+            self.presentation_cache.put(key, presentation)
         
+        # Cached presentations are shared, so callers get their own copy
+        presentation = dict(presentation, attributes=dict(presentation['attributes']))
+        if 'disclosures' in presentation:
+            presentation['disclosures'] = dict(presentation['disclosures'])
+        if challenge is not None:
+            presentation['challenge'] = challenge
+            private_key = self._holder_private_key()
+            if credential.holder_public_key and 'disclosures' in presentation and private_key:
+                presentation['holder_signature'] = _holder_signature(
+                    private_key, challenge, credential_id,
+                    presentation['attributes'], presentation['disclosures']
+                )
         return presentation
     
+    def create_presentations(self, requests, serialize=False) -> Iterator[Any]:
+        """
+        Create presentations for many requests, as a stream.
+        
+        Each credential is resolved and prepared once per call: the parts
+        of its presentations that do not depend on the disclosed
+        attributes, including their JSON encoding, are reused for every
+        request it answers. Repeated presentation requests are matched once.
+        
+        Args:
+            requests: Dicts with either
+                credential_id (str): ID of the credential to present, and
+                    optionally selective_disclosure (list) and challenge
+                    (str) as for create_presentation; or
+                the fields of a presentation request (see match_request),
+                    answered with the best match and disclosing the
+                    requested attributes (and answering its challenge, if any)
+            serialize (bool): Yield each presentation as a JSON string
+                (as json.dumps would encode it) instead of a dict
+            
+        Yields:
+            The presentation for each request in order, or None if no
+            credential of the wallet can answer it
+        """
+        prepared = {}  # Map of credential ID to _PreparedCredential
+        matched = {}  # Map of canonical request to matched credential ID
+        
+        for request in requests:
+            credential_id = request.get('credential_id')
+            if credential_id is not None:
+                selective_disclosure = request.get('selective_disclosure')
+            else:
+                selective_disclosure = request.get('attributes')
+                # Requests differing only in their challenge have the same match
+                request_key = json.dumps({key: value for key, value in request.items() if key != 'challenge'},
+                                         sort_keys=True, default=list)
+                if request_key not in matched:
+                    matches = self.match_request(dict(request, limit=1))
+                    matched[request_key] = matches[0].id if matches else None
+                credential_id = matched[request_key]
+            
+            entry = prepared.get(credential_id)
+            if entry is None and credential_id is not None:
+                credential = self.get_credential(credential_id)
+                if credential:
+                    entry = prepared[credential_id] = _PreparedCredential(
+                        credential, self.holder_id, self._holder_private_key()
+                    )
+            
+            if entry is None:
+                yield None
+            elif serialize:
+                yield entry.presentation_json(selective_disclosure, request.get('challenge'))
+            else:
+                yield entry.presentation(selective_disclosure, request.get('challenge'))
+    
     def remove_credential(self, credential_id):
         """
         Remove a credential from the wallet.
@@ -176,7 +893,15 @@ class Wallet:
         if credential_id not in self.credentials:
             raise ValueError("Credential does not belong to one of my crednetials!")
 
+        if self._legacy_credential_ids is not None:
+            self._migrate_container()
+
+        self._append_records([_delete_record(self._record_key(credential_id))])
+        self._credential_records.pop(credential_id, None)
         del self.credentials[credential_id]
-        self._save_wallet()
+        self._check_compaction()
+        self.presentation_cache.invalidate_credential(credential_id)
+        if self._index is not None:
+            self._index.remove(credential_id)
         return True
         
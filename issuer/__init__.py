@@ -4,5 +4,9 @@ Issuer package for the privacy-preserving digital credential system.
 
 from .issuer import Issuer, create_issuer, load_issuer
 from .revocation import RevocationManager
+from .registry import get_issuer_summaries, get_issuer_summary, rebuild_registry
 
-__all__ = ['Issuer', 'create_issuer', 'load_issuer', 'RevocationManager']
\ No newline at end of file
+__all__ = [
+    'Issuer', 'create_issuer', 'load_issuer', 'RevocationManager',
+    'get_issuer_summaries', 'get_issuer_summary', 'rebuild_registry'
+]
\ No newline at end of file
@@ -2,18 +2,19 @@
 Issuer module for the privacy-preserving digital credential system.
 """
 
-import os
 import json
-from typing import Dict, Any, Optional, List, Tuple
+import secrets
+import threading
+from typing import Dict, Any, Optional, List
 from dataclasses import asdict
 
 from common.crypto import CryptoManager
-from common.models import Credential, RevocationList
-from common.utils import (
-    generate_id, current_timestamp, save_json, load_json,
-    get_credentials_dir, get_revocation_dir, uuid
-)
+from common.models import Credential
+from common.utils import generate_id, current_timestamp
+from common.storage import get_storage, ISSUERS, CREDENTIALS, ISSUER_KEYS
+from common.metrics import get_metrics
 from .revocation import RevocationManager
+from .registry import register_issuer, get_credential_count, increment_credential_count
 
 
 class Issuer:
@@ -21,7 +22,7 @@ class Issuer:
     Issuer class responsible for creating and signing credentials.
     """
     
-    def __init__(self, issuer_id=None, name=None):
+    def __init__(self, issuer_id=None, name=None, storage=None):
         """
         Initialize an issuer with a unique ID and keys.
         
@@ -29,27 +30,34 @@ class Issuer:
             issuer_id (str, optional): Unique identifier for the issuer.
                 If not provided, a new one will be generated.
             name (str, optional): Name of the issuer.
+            storage (StorageBackend, optional): Storage to use instead of the default.
         """
+        self.storage = storage or get_storage()
         self.issuer_id = issuer_id or generate_id()
         self.name = name or f"Issuer-{self.issuer_id[:8]}"
+        self._issue_lock = threading.Lock()
+        self.metrics = get_metrics()
         
         # Load or generate keys
         self._load_or_generate_keys()
         
         # Initialize revocation manager
-        self.revocation_manager = RevocationManager(self.issuer_id)
+        self.revocation_manager = RevocationManager(self.issuer_id, storage=self.storage)
     
     def _load_or_generate_keys(self):
         """Load existing keys or generate new ones."""
-        issuer_file = self._get_issuer_file_path()
+        issuer_data = self.storage.get_readonly(ISSUERS, self.issuer_id)
         
-        if os.path.exists(issuer_file):
+        if issuer_data:
             # Load existing issuer data
-            issuer_data = load_json(issuer_file)
             self.issuer_id = issuer_data.get('issuer_id', self.issuer_id)
             self.name = issuer_data.get('name', self.name)
             self.private_key = issuer_data.get('private_key')
             self.public_key = issuer_data.get('public_key')
+            if not self.storage.exists(ISSUER_KEYS, self.issuer_id):
+                # Issuers created before keys were published separately
+                with self.storage.batch():
+                    self._publish_public_key()
         else:
             # Generate new keys
             keypair = CryptoManager.generate_keypair()
@@ -57,28 +65,74 @@ class Issuer:
             self.public_key = keypair['public_key']
             
             # Save issuer data
-            self._save_issuer_data()
+            with self.storage.batch():
+                self._save_issuer_data()
+                self._publish_public_key()
     
-    def _get_issuer_file_path(self):
-        """Get the file path for the issuer data."""
-        return os.path.join(get_credentials_dir(), f"issuer_{self.issuer_id}.json")
+    @property
+    def credential_count(self) -> int:
+        """Number of credentials issued, by any instance of this issuer."""
+        return get_credential_count(self.issuer_id, storage=self.storage)
     
     def _save_issuer_data(self):
-        """Save the issuer data to disk."""
+        """Save the issuer data to storage."""
         issuer_data = {
             'issuer_id': self.issuer_id,
             'name': self.name,
             'private_key': self.private_key,
             'public_key': self.public_key,
         }
-        save_json(issuer_data, self._get_issuer_file_path())
+        self.storage.put(ISSUERS, self.issuer_id, issuer_data)
+        register_issuer(self.issuer_id, self.name, self.public_key, self.credential_count,
+                        storage=self.storage)
+    
+    def _publish_public_key(self):
+        """
+        Add the current public key to the issuer's published keys.
+        
+        Verifiers read only this document, never the issuer data holding
+        the private key. Earlier keys stay listed, newest first, so
+        credentials signed before a rotation keep verifying.
+        """
+        kid = CryptoManager.key_id(self.public_key)
+        keys_data = self.storage.get(ISSUER_KEYS, self.issuer_id) or {'keys': []}
+        if keys_data.get('current') == kid:
+            return
+        keys = [key for key in keys_data['keys'] if key['kid'] != kid]
+        keys.insert(0, {'kid': kid, 'public_key': self.public_key, 'created': current_timestamp()})
+        self.storage.put(ISSUER_KEYS, self.issuer_id, {
+            'issuer_id': self.issuer_id,
+            'name': self.name,
+            'current': kid,
+            'keys': keys,
+        })
+    
+    def rotate_keys(self) -> str:
+        """
+        Replace the signing key with a new one.
+        
+        New credentials are signed with the new key. The old public key
+        stays published, so credentials signed with it remain valid.
+        
+        Returns:
+            str: The key ID (kid) of the new key
+        """
+        keypair = CryptoManager.generate_keypair()
+        with self.storage.batch():
+            with self._issue_lock:
+                self.private_key = keypair['private_key']
+                self.public_key = keypair['public_key']
+                self._save_issuer_data()
+            self._publish_public_key()
+        return CryptoManager.key_id(self.public_key)
     
     def issue_credential(
         self, 
         holder_id: str, 
         credential_type: str, 
         attributes: Dict[str, Any], 
-        expiration_date: Optional[int] = None
+        expiration_date: Optional[int] = None,
+        holder_public_key: Optional[str] = None
     ) -> Credential:
         """
         Issue a new credential to a holder.
@@ -88,16 +142,48 @@ class Issuer:
             credential_type (str): Type of credential (e.g., "driver_license")
             attributes (dict): Attributes to include in the credential
             expiration_date (int, optional): Unix timestamp for expiration
+            holder_public_key (str, optional): The holder's public key
+                (Wallet.public_key), certified in the credential so the
+                holder can answer verifiers' challenges with it
             
         Returns:
             Credential: The issued credential
+            
+        Raises:
+            ValueError: If holder_public_key is not an Ed25519 public key
         """
+        if holder_public_key is not None:
+            CryptoManager.load_public_key(holder_public_key)
+        trace = self.metrics.trace('issue_credential')
+        
         # Generate a unique credential ID
         credential_id = generate_id()
         
+        # All writes of one issuance are committed together
+        with self.storage.batch():
+            credential = self._issue_credential(
+                credential_id, holder_id, credential_type, attributes, expiration_date,
+                holder_public_key, trace
+            )
+        
+        if trace:
+            trace.mark('commit')
+            trace.finish()
+        return credential
+    
+    def _issue_credential(self, credential_id, holder_id, credential_type, attributes, expiration_date,
+                          holder_public_key=None, trace=None):
+        """
+        Create, sign and save a credential. Called within a storage batch.
+        
+        Args:
+            trace (StageTrace, optional): Records the time spent in each stage
+        """
         # Get the next index for revocation
         revocation_uuid = generate_id()
         proof = self.revocation_manager.add_credential(revocation_uuid)  # adds the credential to the non_revoked list
+        if trace:
+            trace.mark('revocation')
         
         # Create the credential
         credential = Credential(
@@ -111,25 +197,42 @@ class Issuer:
             expiration_date=expiration_date,
             non_revoked_proof=proof,
             revocation_uuid=revocation_uuid,
+            holder_public_key=holder_public_key,
         )
         
         # Sign the credential
         signable_data = credential.to_signable_json()
+        if trace:
+            trace.mark('serialization')
         signature = CryptoManager.sign(self.private_key, signable_data)
         credential.signature = signature
+        if trace:
+            trace.mark('signature')
+        self._sign_for_presentations(credential)
+        if trace:
+            trace.mark('presentation_signature')
         
         # Save the credential
-        credential_path = os.path.join(
-            get_credentials_dir(), 
-            f"credential_{credential_id}.json"
-        )
-        save_json(asdict(credential), credential_path)
+        self.storage.put(CREDENTIALS, credential_id, asdict(credential))
         
-        # Update issuer data to reflect new credential counter
-        self._save_issuer_data()
+        # Count the credential against storage, so other instances' issuances count too
+        increment_credential_count(self.issuer_id, storage=self.storage)
+        if trace:
+            trace.mark('storage')
         
         return credential
     
+    def _sign_for_presentations(self, credential):
+        """
+        Give a credential a secret salt per attribute and sign its salted
+        attribute digests, so presentations disclosing only some attributes
+        can be verified.
+        """
+        credential.disclosure_salts = {name: secrets.token_urlsafe(16) for name in credential.attributes}
+        credential.presentation_signature = CryptoManager.sign(
+            self.private_key, credential.to_presentation_signable_json()
+        )
+    
     def revoke_credential(self, credential_or_id):
         """
         Revoke a credential.
@@ -142,11 +245,7 @@ class Issuer:
         if isinstance(credential_or_id, Credential):
             credential = credential_or_id
         else:
-            credential_path = os.path.join(
-                get_credentials_dir(), 
-                f"credential_{credential_or_id}.json"
-            )
-            credential_data = load_json(credential_path)
+            credential_data = self.storage.get(CREDENTIALS, credential_or_id)
             if not credential_data:
                 raise FileNotFoundError("Could not find credential path")
             credential = Credential.from_json(json.dumps(credential_data))
@@ -154,6 +253,50 @@ class Issuer:
         # Revoke the credential using the revocation manager
         self.revocation_manager.revoke(credential.revocation_uuid)
     
+    def refresh_credentials(self, credential_ids: List[str]) -> Dict[str, Credential]:
+        """
+        Re-issue the non-revocation proofs of several credentials against
+        the current revocation root.
+        
+        The proof is part of the signed data, so each refreshed credential
+        is signed again. Refreshes start from the issuer's own stored copy
+        of each credential, never from data sent by the holder.
+        
+        Args:
+            credential_ids (list): IDs of credentials issued by this issuer
+            
+        Returns:
+            dict: Map of credential ID to refreshed credential; unknown,
+                foreign and revoked credentials are left out
+        """
+        credentials = []
+        for credential_id in credential_ids:
+            credential_data = self.storage.get(CREDENTIALS, credential_id)
+            if credential_data and credential_data.get('issuer_id') == self.issuer_id:
+                credentials.append(Credential(**credential_data))
+        
+        # Other instances of this issuer may have changed the list since
+        self.revocation_manager.reload()
+        proofs = self.revocation_manager.generate_proofs(
+            credential.revocation_uuid for credential in credentials
+        )
+        
+        refreshed = {}
+        with self.storage.batch():
+            for credential in credentials:
+                proof = proofs.get(credential.revocation_uuid)
+                if proof is None:
+                    continue
+                credential.non_revoked_proof = proof
+                credential.signature = CryptoManager.sign(self.private_key, credential.to_signable_json())
+                if credential.disclosure_salts is None:
+                    # Credentials issued before selective disclosure get it on refresh
+                    self._sign_for_presentations(credential)
+                self.storage.put(CREDENTIALS, credential.id, asdict(credential))
+                refreshed[credential.id] = credential
+        
+        return refreshed
+    
     def get_public_info(self) -> Dict[str, Any]:
         """
         Get the public information about the issuer.
@@ -164,7 +307,8 @@ class Issuer:
         return {
             'issuer_id': self.issuer_id,
             'name': self.name,
-            'public_key': self.public_key
+            'public_key': self.public_key,
+            'kid': CryptoManager.key_id(self.public_key)
         }
 
 
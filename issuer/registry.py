@@ -0,0 +1,206 @@
+"""
+Issuer registry for the privacy-preserving digital credential system.
+
+The registry is a single small document holding one summary record per
+issuer, so listing issuers costs O(issuers) instead of a scan of the
+credentials collection followed by a full load of every issuer.
+
+Credential counts change with every issuance, so they are kept in a
+small counter document per issuer instead, incremented within the
+issuance's storage batch. The count in a registry record is only the
+starting point of an issuer without a counter (one registered before
+counters existed, or rebuilt after an import).
+"""
+
+import threading
+from typing import Any, Dict, List, Optional
+
+from common.storage import StorageBackend, get_storage, ISSUERS, CREDENTIALS, META
+
+
+REGISTRY_KEY = 'issuers'
+
+# Prefix of the key of each issuer's credential counter
+COUNTER_KEY_PREFIX = 'credential_count_'
+
+_registry_lock = threading.Lock()
+
+
+def _load_registry(storage: StorageBackend, readonly: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    Load the registry, rebuilding it from storage if it does not exist yet.
+    A readonly registry may be shared with other callers and must not be modified.
+
+    Writers call this within a storage batch holding _registry_lock, so
+    the registry they modify is the latest one.
+    """
+    if readonly:
+        registry = storage.get_readonly(META, REGISTRY_KEY)
+        if registry is None:
+            # Written like any other update: batch first, then the lock
+            with storage.batch(), _registry_lock:
+                registry = _load_registry(storage)
+        return registry
+
+    registry = storage.get(META, REGISTRY_KEY)
+    if registry is None:
+        registry = _scan_issuers(storage)
+        storage.put(META, REGISTRY_KEY, registry)
+    return registry
+
+
+def _scan_issuers(storage: StorageBackend, count_credentials: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    Build registry records by scanning the issuers and credentials.
+    Only used to migrate data created before the registry existed, and
+    to rebuild the registry, which counts the credentials again.
+    """
+    issuers = dict(storage.items(ISSUERS))
+    credential_counts = None
+
+    # Issuer files only carry a count if they were written before counters
+    if count_credentials or any('credential_count' not in issuer_data for issuer_data in issuers.values()):
+        credential_counts = {}
+        for _, credential_data in storage.items(CREDENTIALS):
+            issuer_id = credential_data.get('issuer_id')
+            credential_counts[issuer_id] = credential_counts.get(issuer_id, 0) + 1
+
+    return {
+        issuer_id: {
+            'id': issuer_id,
+            'name': issuer_data.get('name'),
+            'public_key': issuer_data.get('public_key'),
+            'credential_count': (
+                credential_counts.get(issuer_id, 0) if credential_counts is not None
+                else issuer_data['credential_count']
+            ),
+        }
+        for issuer_id, issuer_data in issuers.items()
+    }
+
+
+def _counter_key(issuer_id: str) -> str:
+    """Get the key of an issuer's credential counter."""
+    return f"{COUNTER_KEY_PREFIX}{issuer_id}"
+
+
+def _with_count(summary: Dict[str, Any], storage: StorageBackend) -> Dict[str, Any]:
+    """Copy a registry record, with the issuer's current credential count."""
+    counter = storage.get_readonly(META, _counter_key(summary['id']))
+    if counter is not None:
+        return dict(summary, credential_count=counter['credential_count'])
+    return dict(summary)
+
+
+def register_issuer(issuer_id: str, name: str, public_key: str, credential_count: int = 0,
+                    storage: Optional[StorageBackend] = None) -> None:
+    """
+    Add or update the summary record of an issuer.
+
+    Args:
+        issuer_id (str): ID of the issuer
+        name (str): Name of the issuer
+        public_key (str): Base64-encoded public key of the issuer
+        credential_count (int): Number of credentials issued so far,
+            if the issuer has no counter yet
+        storage (StorageBackend, optional): Storage to use instead of the default
+    """
+    storage = storage or get_storage()
+    # Entering the batch first keeps other batches from committing an older
+    # registry over this update (see FileStorage.batch)
+    with storage.batch(), _registry_lock:
+        registry = _load_registry(storage)
+        registry[issuer_id] = {
+            'id': issuer_id,
+            'name': name,
+            'public_key': public_key,
+            'credential_count': credential_count,
+        }
+        storage.put(META, REGISTRY_KEY, registry)
+
+
+def get_issuer_summaries(storage: Optional[StorageBackend] = None) -> List[Dict[str, Any]]:
+    """
+    List the summary records of all issuers.
+
+    Args:
+        storage (StorageBackend, optional): Storage to use instead of the default
+
+    Returns:
+        list: Dicts with 'id', 'name', 'public_key' and 'credential_count'
+    """
+    storage = storage or get_storage()
+    return [_with_count(summary, storage) for summary in _load_registry(storage, readonly=True).values()]
+
+
+def get_issuer_summary(issuer_id: str, storage: Optional[StorageBackend] = None) -> Optional[Dict[str, Any]]:
+    """
+    Get the summary record of a single issuer.
+
+    Args:
+        issuer_id (str): ID of the issuer
+        storage (StorageBackend, optional): Storage to use instead of the default
+
+    Returns:
+        dict: The summary record, or None if the issuer is not registered
+    """
+    storage = storage or get_storage()
+    summary = _load_registry(storage, readonly=True).get(issuer_id)
+    return _with_count(summary, storage) if summary else None
+
+
+def get_credential_count(issuer_id: str, storage: Optional[StorageBackend] = None) -> int:
+    """
+    Get the number of credentials an issuer has issued.
+
+    Args:
+        issuer_id (str): ID of the issuer
+        storage (StorageBackend, optional): Storage to use instead of the default
+
+    Returns:
+        int: The count, or 0 for an unknown issuer
+    """
+    storage = storage or get_storage()
+    counter = storage.get(META, _counter_key(issuer_id))
+    if counter is not None:
+        return counter['credential_count']
+    summary = _load_registry(storage, readonly=True).get(issuer_id)
+    return summary['credential_count'] if summary else 0
+
+
+def increment_credential_count(issuer_id: str, storage: Optional[StorageBackend] = None) -> int:
+    """
+    Count one more credential issued by an issuer.
+
+    The count is read and written within one storage batch, so
+    concurrent issuances, by any Issuer instance sharing the storage,
+    are all counted. Only the issuer's counter is written.
+
+    Args:
+        issuer_id (str): ID of the issuer
+        storage (StorageBackend, optional): Storage to use instead of the default
+
+    Returns:
+        int: The new count
+    """
+    storage = storage or get_storage()
+    with storage.batch():
+        count = get_credential_count(issuer_id, storage=storage) + 1
+        storage.put(META, _counter_key(issuer_id), {'credential_count': count})
+    return count
+
+
+def rebuild_registry(storage: Optional[StorageBackend] = None) -> None:
+    """
+    Rebuild the registry from the stored issuers and credentials.
+    The credential counters start again from the rebuilt counts.
+
+    Args:
+        storage (StorageBackend, optional): Storage to use instead of the default
+    """
+    storage = storage or get_storage()
+    with storage.batch(), _registry_lock:
+        registry = _scan_issuers(storage, count_credentials=True)
+        for issuer_id in registry:
+            storage.delete(META, _counter_key(issuer_id))
+        storage.put(META, REGISTRY_KEY, registry)
@@ -2,63 +2,77 @@
 Revocation management for the privacy-preserving digital credential system.
 """
 
-import os
 import json
-from typing import List, Optional, Tuple
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from common.models import RevocationList
 from common.crypto import CryptoManager
-from common.utils import (
-    current_timestamp, save_json, load_json, get_revocation_dir
-)
+from common.utils import current_timestamp
+from common.storage import get_storage, REVOCATION_PUBLIC, REVOCATION_PRIVATE
 
 
 class RevocationManager:
     """
-    Manages the revocation of credentials using a bitstring approach.
-    The bitstring is stored as a list of booleans for simplicity.
+    Manages the revocation of credentials using a hash-tree approach.
+    
+    The manager is safe to share between threads. Writers (add, revoke,
+    unrevoke) are serialized by a lock and work on a copy of the stored
+    revocation list, which is published only once it has been saved.
+    The list is read again within the writer's storage batch, so changes
+    saved by other managers of the same issuer are kept.
+    Writers enter a storage batch before taking the lock, so storage
+    transactions and the lock are always acquired in the same order.
+    Since a storage batch serializes writers until it has committed,
+    lists are also committed in the order they were published.
+    Readers never take the lock: they work on whichever snapshot was
+    published when they started, so they never see a list that is being
+    mutated.
     """
     
-    def __init__(self, issuer_id: str):
+    def __init__(self, issuer_id: str, storage=None):
         """
         Initialize the revocation manager for a specific issuer.
         
         Args:
             issuer_id (str): ID of the issuer
+            storage (StorageBackend, optional): Storage to use instead of the default
         """
+        self.storage = storage or get_storage()
         self.issuer_id = issuer_id
-        self.revocation_list = self._load_or_create_revocation_list()
+        self._write_lock = threading.Lock()
+        self._revocation_list = self._load_or_create_revocation_list()
     
-    def _get_public_revocation_file_path(self) -> str:
-        """Get the file path for the hash-tree root hash (public)."""
-        return os.path.join(
-            get_revocation_dir(), 
-            f"revocation_list_{self.issuer_id}_public.json"
-        )
+    @property
+    def revocation_list(self) -> RevocationList:
+        """
+        The current revocation list snapshot.
+        
+        The returned object is never mutated by the manager and must be
+        treated as read-only by callers.
+        """
+        return self._revocation_list
     
-    def _get_private_revocation_file_path(self) -> str:
-        """Get the file path of the revoked credentials and other metadata."""
-        return os.path.join(
-            get_revocation_dir(), 
-            f"revocation_list_{self.issuer_id}_private.json"
+    def _load_revocation_list(self) -> Optional[RevocationList]:
+        """Load the stored revocation list, or return None if there is none."""
+        pub_data = self.storage.get_readonly(REVOCATION_PUBLIC, self.issuer_id)
+        if not pub_data:
+            return None
+        
+        # Snapshots are never mutated (writers copy them), so they can
+        # share the cached documents
+        priv_data = self.storage.get_readonly(REVOCATION_PRIVATE, self.issuer_id)
+        return RevocationList(
+            issuer_id=priv_data["issuer_id"],
+            non_revoked=priv_data["non_revoked"],
+            root_hash=pub_data["root_hash"],
+            last_updated=priv_data["last_updated"]
         )
     
     def _load_or_create_revocation_list(self) -> RevocationList:
         """Load the existing revocation list or create a new one."""
-        public_revocation_file = self._get_public_revocation_file_path()
-        private_revocation_file = self._get_private_revocation_file_path()
-        
-        if os.path.exists(public_revocation_file):
-            # Load existing revocation list
-            pub_data = load_json(public_revocation_file)
-            priv_data = load_json(private_revocation_file)
-            return RevocationList(
-                issuer_id=priv_data["issuer_id"],
-                non_revoked=priv_data["non_revoked"],
-                root_hash=pub_data["root_hash"],
-                last_updated=priv_data["last_updated"]
-            )
-        else:
+        revocation_list = self._load_revocation_list()
+        if revocation_list is None:
             # Create a new revocation list
             revocation_list = RevocationList(
                 issuer_id=self.issuer_id,
@@ -67,26 +81,56 @@ class RevocationManager:
                 last_updated=current_timestamp(),
             )
             self._save_revocation_list(revocation_list)
-            return revocation_list
+        return revocation_list
+    
+    def _copy_for_write(self) -> RevocationList:
+        """
+        Get a copy of the stored revocation list for a writer to mutate.
+        Called within the writer's storage batch, so no other manager
+        sharing the storage can save a list in between.
+        """
+        return (self._load_revocation_list() or self._revocation_list).copy()
     
     def _save_revocation_list(self, revocation_list: Optional[RevocationList] = None) -> None:
-        """Save the revocation list to disk."""
+        """Save the revocation list to storage."""
         if revocation_list is None:
-            revocation_list = self.revocation_list
+            revocation_list = self._revocation_list
         
-        save_json(
-            {"root_hash": revocation_list.root_hash},
-            self._get_public_revocation_file_path()
-        )
+        with self.storage.batch():
+            self.storage.put(
+                REVOCATION_PUBLIC,
+                self.issuer_id,
+                {"root_hash": revocation_list.root_hash}
+            )
 
-        save_json(
-            {
-                "issuer_id": revocation_list.issuer_id,
-                "non_revoked": revocation_list.non_revoked,
-                "last_updated": revocation_list.last_updated,
-            },
-            self._get_private_revocation_file_path()
-        )
+            self.storage.put(
+                REVOCATION_PRIVATE,
+                self.issuer_id,
+                {
+                    "issuer_id": revocation_list.issuer_id,
+                    "non_revoked": revocation_list.non_revoked,
+                    "last_updated": revocation_list.last_updated,
+                }
+            )
+    
+    def reload(self) -> RevocationList:
+        """
+        Make the stored revocation list the current snapshot, picking up
+        changes saved by other managers of the same issuer.
+        
+        Returns:
+            RevocationList: The new snapshot
+        """
+        with self._write_lock:
+            stored = self._load_revocation_list()
+            if stored is not None:
+                self._revocation_list = stored
+            return self._revocation_list
+    
+    def _publish(self, revocation_list: RevocationList) -> None:
+        """Save a new revocation list and make it the current snapshot."""
+        self._save_revocation_list(revocation_list)
+        self._revocation_list = revocation_list
     
     def revoke(self, cred_uuid: str):
         """
@@ -96,8 +140,10 @@ class RevocationManager:
             cred_uuid (string): Revocation UUID of the credential to be revoked
             
         """
-        self.revocation_list.revoke(cred_uuid)
-        self._save_revocation_list()
+        with self.storage.batch(), self._write_lock:
+            revocation_list = self._copy_for_write()
+            revocation_list.revoke(cred_uuid)
+            self._publish(revocation_list)
     
     def unrevoke(self, cred_uuid: str):
         """
@@ -107,8 +153,10 @@ class RevocationManager:
             cred_uuid (string): Revocation UUID of the credential to be revoked
             
         """
-        self.revocation_list.unrevoke(cred_uuid)
-        self._save_revocation_list()
+        with self.storage.batch(), self._write_lock:
+            revocation_list = self._copy_for_write()
+            revocation_list.unrevoke(cred_uuid)
+            self._publish(revocation_list)
     
     def is_revoked(self, cred_uuid: str) -> bool:
         """
@@ -120,7 +168,47 @@ class RevocationManager:
         Returns:
             bool: True if the credential is revoked, False otherwise
         """
-        return self.revocation_list.is_revoked(cred_uuid)
+        return self._revocation_list.is_revoked(cred_uuid)
+    
+    def get_root_hash(self) -> str:
+        """
+        Get the current root of the hash tree.
+        
+        Returns:
+            str: The root hash of the current snapshot
+        """
+        return self._revocation_list.root_hash
+    
+    def generate_proof(self, cred_uuid: str) -> List[Tuple[str, bool]]:
+        """
+        Generate a proof of non-revocation against the current root.
+        
+        Args:
+            cred_uuid (string): Revocation UUID of the credential
+            
+        Returns:
+            Proof of non-revocation.
+            
+        Raises:
+            ValueError: If the credential is revoked or unknown
+        """
+        return CryptoManager.generate_proof(self._revocation_list.non_revoked, cred_uuid)
+    
+    def generate_proofs(self, cred_uuids: Iterable[str]) -> Dict[str, List[Tuple[str, bool]]]:
+        """
+        Generate proofs of non-revocation for several credentials at once.
+        
+        All proofs are taken from the same snapshot, so they match the
+        same root.
+        
+        Args:
+            cred_uuids: Revocation UUIDs of the credentials
+            
+        Returns:
+            dict: Map of revocation UUID to proof; revoked or unknown
+                credentials are left out
+        """
+        return CryptoManager.generate_proofs(self._revocation_list.non_revoked, cred_uuids)
     
     def get_public_revocation_list(self) -> dict:
         """
@@ -129,7 +217,7 @@ class RevocationManager:
         Returns:
             dict: The revocation list as a JSON-serializable dictionary
         """
-        return json.loads(self.revocation_list.to_json())
+        return json.loads(self._revocation_list.to_json())
 
     def add_credential(self, cred_uuid) -> List[Tuple[str, bool]]:
         """
@@ -139,7 +227,9 @@ class RevocationManager:
         Returns:
             Proof of non-revocation.
         """
-        self.revocation_list.add_credential(cred_uuid)
-        self._save_revocation_list()
+        with self.storage.batch(), self._write_lock:
+            revocation_list = self._copy_for_write()
+            revocation_list.add_credential(cred_uuid)
+            self._publish(revocation_list)
 
-        return CryptoManager.generate_proof(self.revocation_list.non_revoked, cred_uuid)
+        return CryptoManager.generate_proof(revocation_list.non_revoked, cred_uuid)
@@ -9,6 +9,7 @@ import argparse
 
 from demo.cli import cli
 from demo.web import app
+from common.storage import set_storage, create_storage
 
 
 def main():
@@ -17,8 +18,13 @@ def main():
     parser.add_argument('--web', action='store_true', help='Run the web interface')
     parser.add_argument('--cli', action='store_true', help='Run the CLI interface')
     parser.add_argument('--port', type=int, default=5000, help='Port for web server (default: 5000)')
+    parser.add_argument('--storage', choices=['file', 'sqlite'],
+                        help='Storage backend (default: file, or $CREDENTIAL_STORAGE)')
     args, remaining_args = parser.parse_known_args()
     
+    if args.storage:
+        set_storage(create_storage(args.storage))
+    
     if args.web:
         # Run web interface
         app.run(debug=True, port=args.port)
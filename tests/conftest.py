@@ -0,0 +1,15 @@
+"""
+Shared fixtures of the test suite.
+"""
+
+import pytest
+
+import common.utils
+from common.storage import create_storage
+
+
+@pytest.fixture
+def file_storage(tmp_path, monkeypatch):
+    """A FileStorage writing under a temporary data directory."""
+    monkeypatch.setattr(common.utils, '_DATA_DIR', str(tmp_path / 'data'))
+    return create_storage('file')
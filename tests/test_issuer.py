@@ -0,0 +1,40 @@
+"""
+Tests for issuers sharing a store with other instances of themselves.
+"""
+
+from common.storage import META
+from issuer import Issuer, get_issuer_summary, rebuild_registry
+from issuer.registry import REGISTRY_KEY
+from verifier import Verifier
+
+
+def test_instances_of_an_issuer_count_each_others_credentials(file_storage):
+    first = Issuer(name='Shared', storage=file_storage)
+    second = Issuer(issuer_id=first.issuer_id, storage=file_storage)
+    registry = file_storage.get(META, REGISTRY_KEY)
+
+    first.issue_credential('holder', 'ID', {'name': 'A'})
+    second.issue_credential('holder', 'ID', {'name': 'B'})
+
+    assert Issuer(issuer_id=first.issuer_id, storage=file_storage).credential_count == 2
+    assert get_issuer_summary(first.issuer_id, storage=file_storage)['credential_count'] == 2
+    # Issuing only writes the issuer's counter, not the registry
+    assert file_storage.get(META, REGISTRY_KEY) == registry
+
+    rebuild_registry(storage=file_storage)
+    assert first.credential_count == 2
+    first.issue_credential('holder', 'ID', {'name': 'C'})
+    assert get_issuer_summary(first.issuer_id, storage=file_storage)['credential_count'] == 3
+
+
+def test_credentials_of_both_instances_verify_after_a_refresh(file_storage):
+    first = Issuer(name='Shared', storage=file_storage)
+    second = Issuer(issuer_id=first.issuer_id, storage=file_storage)
+    credentials = [first.issue_credential('holder', 'ID', {'name': 'A'}),
+                   second.issue_credential('holder', 'ID', {'name': 'B'})]
+
+    refreshed = first.refresh_credentials([credential.id for credential in credentials])
+
+    verifier = Verifier(storage=file_storage)
+    assert set(refreshed) == {credential.id for credential in credentials}
+    assert all(verifier.verify_credential(credential)[0] for credential in refreshed.values())
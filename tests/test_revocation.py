@@ -0,0 +1,126 @@
+"""
+Stress tests for the copy-on-write snapshots of the RevocationManager.
+"""
+
+import threading
+
+from common.crypto import CryptoManager
+from common.storage import create_storage, REVOCATION_PRIVATE, REVOCATION_PUBLIC
+from issuer.revocation import RevocationManager
+
+
+CREDENTIALS = 200
+REVOCATIONS = 150
+READERS = 8
+
+
+
+def _check_snapshot(snapshot):
+    """Check that a snapshot's root matches its list and its proofs verify against it."""
+    non_revoked = list(snapshot.non_revoked)
+    expected_root = CryptoManager.generate_root_hash(non_revoked) if non_revoked else ""
+    assert snapshot.root_hash == expected_root, "root hash does not match the list"
+    for cred_uuid in (non_revoked[0], non_revoked[-1]):
+        proof = CryptoManager.generate_proof(non_revoked, cred_uuid)
+        assert CryptoManager.check_proof(proof, cred_uuid, snapshot.root_hash)
+
+
+def test_readers_see_consistent_snapshots_while_writer_revokes(tmp_path):
+    storage = create_storage('sqlite', str(tmp_path / 'credentials.db'))
+    manager = RevocationManager('stress-issuer', storage=storage)
+    cred_uuids = [f"cred-{index:04d}" for index in range(CREDENTIALS)]
+    for cred_uuid in cred_uuids:
+        manager.add_credential(cred_uuid)
+
+    # Root of the list after each number of revocations, in revocation order
+    roots = [CryptoManager.generate_root_hash(cred_uuids[revoked:]) for revoked in range(REVOCATIONS + 1)]
+
+    done = threading.Event()
+    errors = []
+    snapshots_seen = [0] * READERS
+
+    def writer():
+        try:
+            for cred_uuid in cred_uuids[:REVOCATIONS]:
+                manager.revoke(cred_uuid)
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            done.set()
+
+    def reader(index):
+        last_size = CREDENTIALS
+        try:
+            while not done.is_set():
+                snapshot = manager.revocation_list
+                _check_snapshot(snapshot)
+                # Revocations only shrink the list, so snapshots never go back in time
+                assert len(snapshot.non_revoked) <= last_size
+                last_size = len(snapshot.non_revoked)
+
+                # Batch proofs come from one snapshot: they cover exactly the
+                # credentials of one published list and verify against its root
+                proofs = manager.generate_proofs(cred_uuids)
+                revoked = CREDENTIALS - len(proofs)
+                assert set(proofs) == set(cred_uuids[revoked:])
+                assert all(CryptoManager.check_proof(proof, cred_uuid, roots[revoked])
+                           for cred_uuid, proof in proofs.items())
+                snapshots_seen[index] += 1
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=reader, args=(index,)) for index in range(READERS)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=120)
+
+    assert not any(thread.is_alive() for thread in threads)
+    assert not errors, errors
+    assert all(snapshots_seen)
+
+    # The stored lists match the last published snapshot
+    final = manager.revocation_list
+    assert final.non_revoked == cred_uuids[REVOCATIONS:]
+    _check_snapshot(final)
+    assert storage.get(REVOCATION_PRIVATE, 'stress-issuer')['non_revoked'] == final.non_revoked
+    assert storage.get(REVOCATION_PUBLIC, 'stress-issuer')['root_hash'] == final.root_hash
+
+
+def test_managers_sharing_a_file_store_keep_each_others_changes(file_storage):
+    first = RevocationManager('shared-issuer', storage=file_storage)
+    second = RevocationManager('shared-issuer', storage=file_storage)
+
+    first.add_credential('cred-a')
+    second.add_credential('cred-b')
+    first.add_credential('cred-c')
+    second.revoke('cred-a')
+
+    stored = file_storage.get(REVOCATION_PRIVATE, 'shared-issuer')['non_revoked']
+    assert stored == ['cred-b', 'cred-c']
+    assert file_storage.get(REVOCATION_PUBLIC, 'shared-issuer')['root_hash'] == \
+        CryptoManager.generate_root_hash(stored)
+    assert second.revocation_list.non_revoked == stored
+
+
+def test_concurrent_managers_sharing_a_file_store_lose_no_credentials(file_storage):
+    managers = [RevocationManager('shared-issuer', storage=file_storage) for _ in range(4)]
+    errors = []
+
+    def writer(index, manager):
+        try:
+            for number in range(25):
+                manager.add_credential(f"cred-{index}-{number:02d}")
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=writer, args=(index, manager)) for index, manager in enumerate(managers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=120)
+
+    assert not errors, errors
+    stored = file_storage.get(REVOCATION_PRIVATE, 'shared-issuer')['non_revoked']
+    assert sorted(stored) == sorted(f"cred-{index}-{number:02d}" for index in range(4) for number in range(25))
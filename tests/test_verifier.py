@@ -0,0 +1,116 @@
+"""
+Tests for the verification of selective disclosure presentations and
+their answers to challenges.
+"""
+
+import pytest
+
+from common.models import attribute_digest
+from holder import Wallet
+from issuer import Issuer
+from verifier import Verifier
+from verifier.nonces import NonceStore
+
+
+ATTRIBUTES = {'name': 'Alice', 'age': 30, 'city': 'Utrecht'}
+
+
+@pytest.fixture
+def setup(file_storage):
+    """An issuer, a wallet holding a credential certifying its key, and a verifier."""
+    issuer = Issuer(name='Test Issuer', storage=file_storage)
+    wallet = Wallet(name='Alice', storage=file_storage)
+    credential = issuer.issue_credential(wallet.holder_id, 'ID', ATTRIBUTES,
+                                         holder_public_key=wallet.public_key)
+    wallet.add_credential(credential)
+    verifier = Verifier(storage=file_storage, nonce_store=NonceStore())
+    return issuer, wallet, credential, verifier
+
+
+def test_presentation_disclosing_some_attributes_verifies(setup):
+    _, wallet, credential, verifier = setup
+    presentation = wallet.create_presentation(credential.id, ['name'])
+
+    assert presentation['attributes'] == {'name': 'Alice'}
+    assert verifier.verify_presentation(presentation)[0]
+
+
+def test_tampered_disclosure_is_rejected(setup):
+    _, wallet, credential, verifier = setup
+    presentation = dict(wallet.create_presentation(credential.id, ['name', 'age']))
+    presentation['attributes'] = dict(presentation['attributes'], age=21)
+
+    is_valid, details = verifier.verify_presentation(presentation)
+    assert not is_valid
+    assert details['error'] == "Disclosed attribute does not match the credential: age"
+
+
+def test_attribute_the_credential_does_not_have_is_rejected(setup):
+    _, wallet, credential, verifier = setup
+    presentation = dict(wallet.create_presentation(credential.id, ['name']))
+    presentation['attributes'] = dict(presentation['attributes'], role='admin')
+    presentation['disclosures'] = dict(presentation['disclosures'], role='salt')
+
+    # Disclosing it with a made-up salt does not match any signed digest
+    is_valid, details = verifier.verify_presentation(presentation)
+    assert not is_valid
+    assert details['error'] == "Disclosed attribute does not match the credential: role"
+
+    # Adding its digest to the signed ones breaks the presentation signature
+    presentation['attribute_digests'] = presentation['attribute_digests'] + [
+        attribute_digest('salt', 'role', 'admin')
+    ]
+    assert not verifier.verify_presentation(presentation)[0]
+
+
+def test_challenge_answer_is_accepted_once(setup):
+    _, wallet, credential, verifier = setup
+    presentation = wallet.create_presentation(credential.id, ['name'], verifier.create_challenge())
+
+    assert verifier.verify_presentation(presentation)[0]
+    is_valid, details = verifier.verify_presentation(presentation)
+    assert not is_valid
+    assert details['error'] == "Challenge was already used"
+
+
+def test_challenge_cannot_be_moved_to_a_copied_presentation(setup):
+    _, wallet, credential, verifier = setup
+    presentation = wallet.create_presentation(credential.id, ['name'], verifier.create_challenge())
+
+    replayed = dict(presentation, challenge=verifier.create_challenge())
+    is_valid, details = verifier.verify_presentation(replayed)
+    assert not is_valid
+    assert details['error'] == "Invalid holder signature"
+
+    unsigned = dict(presentation)
+    del unsigned['holder_signature']
+    is_valid, details = verifier.verify_presentation(unsigned)
+    assert not is_valid
+    assert details['error'] == "Presentation is not signed by the holder"
+
+
+def test_holder_signature_covers_the_disclosed_attributes(setup):
+    _, wallet, credential, verifier = setup
+    challenge = verifier.create_challenge()
+    presentation = dict(wallet.create_presentation(credential.id, ['name'], challenge))
+    other = wallet.create_presentation(credential.id, ['name', 'age'])
+
+    presentation.update(attributes=other['attributes'], disclosures=other['disclosures'])
+    is_valid, details = verifier.verify_presentation(presentation)
+    assert not is_valid
+    assert details['error'] == "Invalid holder signature"
+
+
+def test_credential_without_holder_key_cannot_answer_a_challenge(setup):
+    issuer, wallet, _, verifier = setup
+    credential = issuer.issue_credential(wallet.holder_id, 'ID', ATTRIBUTES)
+    wallet.add_credential(credential)
+
+    is_valid, details = verifier.verify_presentation(
+        wallet.create_presentation(credential.id, ['name'], verifier.create_challenge())
+    )
+    assert not is_valid
+    assert details['error'] == "Credential has no holder key to answer a challenge with"
+
+    # It still verifies without a challenge
+    assert verifier.verify_presentation(wallet.create_presentation(credential.id, ['name']))[0]
@@ -0,0 +1,27 @@
+"""
+Tests for the JSON endpoints of the web demo.
+"""
+
+import pytest
+
+import common.storage
+from issuer import Issuer
+
+
+@pytest.fixture
+def client(file_storage, monkeypatch):
+    """A test client of the web demo, on the temporary store."""
+    monkeypatch.setattr(common.storage, '_storage', file_storage)
+    from demo.web import app
+    return app.test_client()
+
+
+def test_credential_search_returns_no_attributes_or_salts(client, file_storage):
+    issuer = Issuer(name='Test Issuer', storage=file_storage)
+    credential = issuer.issue_credential('holder', 'ID', {'name': 'Alice', 'age': 30})
+
+    response = client.get('/api/credentials?holder_id=holder')
+
+    results = response.get_json()['credentials']
+    assert [result['id'] for result in results] == [credential.id]
+    assert set(results[0]) == {'id', 'type', 'issuer_id', 'holder_id', 'issuance_date', 'expiration_date'}
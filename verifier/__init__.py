@@ -3,5 +3,14 @@ Verifier package for the privacy-preserving digital credential system.
 """
 
 from .verifier import Verifier
+from .trust import TrustStore, get_trust_store
+from .roots import RootCache, get_root_cache
+from .results import VerificationCache, get_result_cache
+from .bundle import VerifierBundle, build_bundle, generate_signing_key
+from .nonces import NonceStore, get_nonce_store, set_nonce_store
 
-__all__ = ['Verifier']
\ No newline at end of file
+__all__ = [
+    'Verifier', 'TrustStore', 'get_trust_store', 'RootCache', 'get_root_cache',
+    'VerificationCache', 'get_result_cache', 'VerifierBundle', 'build_bundle',
+    'generate_signing_key', 'NonceStore', 'get_nonce_store', 'set_nonce_store'
+]
\ No newline at end of file
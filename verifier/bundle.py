@@ -0,0 +1,350 @@
+"""
+Offline verifier bundles.
+
+A bundle is a single binary snapshot of everything a verifier needs,
+so field verifiers can start instantly and verify without the issuers'
+data directory: the issuers' public keys, their current revocation
+roots and, optionally, a revocation filter per issuer. It is memory
+mapped when loaded; only the small issuer table is parsed up front.
+
+Layout (little-endian):
+
+    header    magic b'VBND', version (u16), flags (u16), created_at (u64),
+              expires_at (u64), issuer count (u32), kid of the signing
+              key (8 bytes)
+    issuers   one fixed-size entry per issuer, sorted by issuer ID:
+              ID offset (u32), ID length (u16), root offset (u32),
+              root length (u16), keys offset (u32), key count (u16),
+              filter offset (u32), filter count (u32)
+    keys      per key: kid (8 bytes) and raw Ed25519 public key (32 bytes)
+    filters   per issuer: sorted u64 digests of its non-revoked revocation UUIDs
+    strings   UTF-8 issuer IDs and root hashes
+    trailer   SHA-256 of everything before it, then an Ed25519 signature
+              (64 bytes) of its hex form
+
+A bundle replaces the issuers' data directory as the verifier's source
+of trust, so it is signed with a bundle signing key (see
+generate_signing_key) and only opened with the matching public key.
+Loading checks the SHA-256 and the signature of the whole file.
+
+With a filter, a credential whose proof was made for an older root is
+still accepted if its revocation UUID is not revoked, so holders do not
+need a fresh proof for every root the issuer publishes.
+"""
+
+import os
+import mmap
+import struct
+import base64
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from common.crypto import CryptoManager
+from common.storage import (
+    StorageBackend, get_storage, ISSUER_KEYS, META, REVOCATION_PUBLIC, REVOCATION_PRIVATE
+)
+from common.utils import current_timestamp
+from issuer.registry import REGISTRY_KEY
+from .trust import TrustStore
+
+
+BUNDLE_MAGIC = b'VBND'
+BUNDLE_VERSION = 2
+
+FLAG_FILTERS = 1
+
+_HEADER = struct.Struct('<4sHHQQI8s')
+_ENTRY = struct.Struct('<IHIHIHII')
+_KEY = struct.Struct('<8s32s')
+_DIGEST = struct.Struct('<Q')
+_CHECKSUM_SIZE = 32
+_SIGNATURE_SIZE = 64
+_TRAILER_SIZE = _CHECKSUM_SIZE + _SIGNATURE_SIZE
+
+
+def _uuid_digest(revocation_uuid: str) -> int:
+    """Get the 64-bit filter digest of a revocation UUID."""
+    return _DIGEST.unpack(hashlib.sha256(revocation_uuid.encode('utf-8')).digest()[:8])[0]
+
+
+def _collect_public_keys(storage: StorageBackend) -> Dict[str, List[Tuple[str, str]]]:
+    """Get the (kid, base64 public key) pairs of every issuer, newest first."""
+    keys = {}
+    for issuer_id, keys_data in storage.items(ISSUER_KEYS):
+        keys[issuer_id] = [(key['kid'], key['public_key']) for key in keys_data.get('keys', [])]
+    # Issuers that have not published their keys yet, as in TrustStore
+    registry = storage.get_readonly(META, REGISTRY_KEY) or {}
+    for issuer_id, record in registry.items():
+        if issuer_id not in keys and record.get('public_key'):
+            keys[issuer_id] = [(CryptoManager.key_id(record['public_key']), record['public_key'])]
+    return keys
+
+
+def generate_signing_key() -> Dict[str, str]:
+    """
+    Create a key pair for signing bundles.
+
+    Returns:
+        dict: Base64-encoded private_key (for build_bundle) and
+            public_key (for VerifierBundle and Verifier.from_bundle)
+    """
+    return CryptoManager.generate_keypair()
+
+
+def build_bundle(path: str, signing_key: str, storage: Optional[StorageBackend] = None,
+                 valid_for: int = 86400, include_filters: bool = False) -> Dict[str, int]:
+    """
+    Write a signed bundle of the current issuer keys and roots.
+
+    Args:
+        path (str): File to write
+        signing_key (str): Base64-encoded private key signing the bundle
+        storage (StorageBackend, optional): Storage to read instead of the default
+        valid_for (int): Seconds the bundle may be used for
+        include_filters (bool): Add a revocation filter per issuer (needs
+            the private revocation lists)
+
+    Returns:
+        dict: Number of issuers, keys and filter entries in the bundle
+    """
+    storage = storage or get_storage()
+    created_at = current_timestamp()
+    issuers = sorted(_collect_public_keys(storage).items())
+
+    key_area = bytearray()
+    filter_area = bytearray()
+    string_area = bytearray()
+    entries = []
+    key_count = filter_count = 0
+    for issuer_id, issuer_keys in issuers:
+        root_data = storage.get(REVOCATION_PUBLIC, issuer_id) or {}
+        root = (root_data.get('root_hash') or '').encode('utf-8')
+        issuer_id_bytes = issuer_id.encode('utf-8')
+
+        keys_offset = len(key_area)
+        for kid, public_key in issuer_keys:
+            key_area += _KEY.pack(bytes.fromhex(kid), base64.b64decode(public_key))
+        key_count += len(issuer_keys)
+
+        filter_offset = len(filter_area)
+        digests = []
+        if include_filters:
+            private_data = storage.get(REVOCATION_PRIVATE, issuer_id) or {}
+            digests = sorted({_uuid_digest(uuid) for uuid in private_data.get('non_revoked', [])})
+            filter_area += struct.pack(f'<{len(digests)}Q', *digests)
+        filter_count += len(digests)
+
+        id_offset = len(string_area)
+        string_area += issuer_id_bytes
+        root_offset = len(string_area)
+        string_area += root
+        entries.append([id_offset, len(issuer_id_bytes), root_offset, len(root),
+                        keys_offset, len(issuer_keys), filter_offset, len(digests)])
+
+    # Turn area-relative offsets into file offsets
+    keys_start = _HEADER.size + _ENTRY.size * len(entries)
+    filters_start = keys_start + len(key_area)
+    strings_start = filters_start + len(filter_area)
+    table = bytearray()
+    for entry in entries:
+        entry[0] += strings_start
+        entry[2] += strings_start
+        entry[4] += keys_start
+        entry[6] += filters_start
+        table += _ENTRY.pack(*entry)
+
+    signer_kid = CryptoManager.key_id(CryptoManager.derive_public_key(signing_key))
+    header = _HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, FLAG_FILTERS if include_filters else 0,
+                          created_at, created_at + valid_for, len(entries), bytes.fromhex(signer_kid))
+    body = bytes(header + table + key_area + filter_area + string_area)
+    checksum = hashlib.sha256(body).digest()
+    signature = base64.b64decode(CryptoManager.sign(signing_key, checksum.hex()))
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(body)
+        f.write(checksum)
+        f.write(signature)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+    return {'issuers': len(entries), 'keys': key_count, 'filter_entries': filter_count}
+
+
+class VerifierBundle:
+    """
+    A memory-mapped bundle.
+    """
+
+    def __init__(self, path: str, public_key: str):
+        """
+        Open a bundle and check its signature.
+
+        Args:
+            path (str): Path of the bundle file
+            public_key (str): Base64-encoded public key the bundle must be
+                signed with
+
+        Raises:
+            ValueError: If the file is not a valid bundle or is not signed
+                with public_key
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            count = self._check(public_key)
+        except ValueError:
+            self._map.close()
+            raise
+
+        self._issuers = {}  # Map of issuer ID to its table entry
+        for index in range(count):
+            entry = _ENTRY.unpack_from(self._map, _HEADER.size + index * _ENTRY.size)
+            issuer_id = self._map[entry[0]:entry[0] + entry[1]].decode('utf-8')
+            self._issuers[issuer_id] = entry
+        self._keys = {}  # Map of issuer ID to parsed keys, filled on first use
+
+    def _check(self, public_key: str) -> int:
+        """
+        Read the header and check the checksum and signature.
+
+        Returns:
+            int: Number of issuers in the bundle
+        """
+        if len(self._map) < _HEADER.size + _TRAILER_SIZE:
+            raise ValueError("Not a verifier bundle")
+        magic, version = struct.unpack_from('<4sH', self._map)
+        if magic != BUNDLE_MAGIC:
+            raise ValueError("Not a verifier bundle")
+        if version != BUNDLE_VERSION:
+            raise ValueError(f"Unsupported bundle version: {version}")
+        (_, _, self.flags, self.created_at, self.expires_at, count,
+         signer_kid) = _HEADER.unpack_from(self._map)
+        self.signer_kid = signer_kid.hex()
+        if self.signer_kid != CryptoManager.key_id(public_key):
+            raise ValueError(f"Bundle is signed with an untrusted key: {self.signer_kid}")
+
+        end = len(self._map) - _TRAILER_SIZE
+        # Hashed in place; the views are released so the map can be closed
+        with memoryview(self._map) as view, view[:end] as data:
+            checksum = hashlib.sha256(data).digest()
+        if checksum != self._map[end:end + _CHECKSUM_SIZE]:
+            raise ValueError("Bundle checksum mismatch")
+        signature = base64.b64encode(self._map[end + _CHECKSUM_SIZE:]).decode('ascii')
+        if not CryptoManager.verify(public_key, checksum.hex(), signature):
+            raise ValueError("Bundle signature is invalid")
+        return count
+
+    @property
+    def has_filters(self) -> bool:
+        """Whether the bundle carries revocation filters."""
+        return bool(self.flags & FLAG_FILTERS)
+
+    def expired(self, now: Optional[int] = None) -> bool:
+        """Check whether the bundle is past its expiry."""
+        return (current_timestamp() if now is None else now) >= self.expires_at
+
+    def issuer_ids(self) -> List[str]:
+        """Get the IDs of the issuers in the bundle."""
+        return list(self._issuers)
+
+    def get_keys(self, issuer_id: str) -> Tuple[Tuple[str, Any], ...]:
+        """Get the (kid, parsed public key) pairs of an issuer, newest first."""
+        keys = self._keys.get(issuer_id)
+        if keys is None:
+            entry = self._issuers.get(issuer_id)
+            if entry is None:
+                return ()
+            keys = []
+            for index in range(entry[5]):
+                kid, public_bytes = _KEY.unpack_from(self._map, entry[4] + index * _KEY.size)
+                keys.append((kid.hex(), CryptoManager.load_public_key(base64.b64encode(public_bytes))))
+            keys = self._keys[issuer_id] = tuple(keys)
+        return keys
+
+    def get_root(self, issuer_id: str) -> Optional[str]:
+        """Get the revocation root of an issuer, or None if it had none."""
+        entry = self._issuers.get(issuer_id)
+        if entry is None or not entry[3]:
+            return None
+        return self._map[entry[2]:entry[2] + entry[3]].decode('utf-8')
+
+    def is_unrevoked(self, issuer_id: str, revocation_uuid: str) -> bool:
+        """Check a revocation UUID against the issuer's filter with a binary search."""
+        entry = self._issuers.get(issuer_id)
+        if entry is None or not entry[7]:
+            return False
+        target = _uuid_digest(revocation_uuid)
+        low, high = 0, entry[7]
+        while low < high:
+            middle = (low + high) // 2
+            value = _DIGEST.unpack_from(self._map, entry[6] + middle * _DIGEST.size)[0]
+            if value < target:
+                low = middle + 1
+            elif value > target:
+                high = middle
+            else:
+                return True
+        return False
+
+    def close(self) -> None:
+        """Unmap the bundle."""
+        self._map.close()
+
+
+class BundleTrustStore:
+    """
+    Issuer keys of a bundle, with the interface of TrustStore that Verifier uses.
+    """
+
+    verify_with_keys = staticmethod(TrustStore.verify_with_keys)
+
+    def __init__(self, bundle: VerifierBundle):
+        self.bundle = bundle
+
+    def get_keys(self, issuer_id: str) -> Tuple[Tuple[str, Any], ...]:
+        return self.bundle.get_keys(issuer_id)
+
+    def issuer_ids(self) -> List[str]:
+        return self.bundle.issuer_ids()
+
+    def refresh(self, force: bool = False) -> bool:
+        # A bundle never changes
+        return False
+
+    def refresh_after_miss(self) -> bool:
+        return False
+
+    def start(self) -> None:
+        pass
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        pass
+
+
+class BundleRootCache:
+    """
+    Revocation roots of a bundle, with the interface of RootCache that Verifier uses.
+    """
+
+    def __init__(self, bundle: VerifierBundle):
+        self.bundle = bundle
+        self.refresh_interval = bundle.expires_at - bundle.created_at
+
+    def get(self, issuer_id: str, max_staleness: Optional[float] = None) -> Optional[Tuple[str, float]]:
+        """Get the root of an issuer and its age, counted from when the bundle was built."""
+        root_hash = self.bundle.get_root(issuer_id)
+        if root_hash is None:
+            return None
+        return root_hash, float(max(0, current_timestamp() - self.bundle.created_at))
+
+    def reload_if_old(self, issuer_id: str) -> Optional[Tuple[str, float]]:
+        return None
+
+    def start(self) -> None:
+        pass
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        pass
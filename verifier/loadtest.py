@@ -0,0 +1,112 @@
+"""
+Load test for the verification HTTP service.
+
+Sends requests over keep-alive connections from a number of client
+threads and reports throughput and latency percentiles.
+"""
+
+import json
+import time
+import threading
+import http.client
+from typing import Any, Dict, List
+from urllib.parse import urlsplit
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    """Get a percentile of sorted values (nearest rank)."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run_load_test(url: str, documents: List[Dict[str, Any]], requests: int = 1000,
+                  concurrency: int = 8, batch_size: int = 1,
+                  timeout: float = 30) -> Dict[str, Any]:
+    """
+    Send verification requests and measure them.
+
+    Args:
+        url (str): Base URL of the service, e.g. http://127.0.0.1:8080
+        documents (list): Credentials and presentations to send, round robin
+        requests (int): Total number of requests
+        concurrency (int): Number of client threads, each with its own connection
+        batch_size (int): Items per request; more than 1 uses /verify/batch
+        timeout (float): Socket timeout in seconds
+
+    Returns:
+        dict: requests, items, errors, seconds, requests_per_second,
+            items_per_second and latency_ms (p50, p90, p99, max)
+    """
+    if not documents:
+        raise ValueError("No documents to send")
+    parts = urlsplit(url)
+    path = '/verify/batch' if batch_size > 1 else '/verify'
+
+    # Bodies are encoded up front so the clients only measure the service
+    bodies = []
+    for start in range(0, max(len(documents), batch_size), batch_size):
+        items = [documents[(start + offset) % len(documents)] for offset in range(batch_size)]
+        bodies.append(json.dumps(items if batch_size > 1 else items[0]).encode('utf-8'))
+
+    counter = iter(range(requests))
+    counter_lock = threading.Lock()
+    latencies = []
+    errors = [0]
+    results_lock = threading.Lock()
+
+    def client():
+        connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+        local_latencies = []
+        local_errors = 0
+        try:
+            while True:
+                with counter_lock:
+                    number = next(counter, None)
+                if number is None:
+                    break
+                body = bodies[number % len(bodies)]
+                started = time.perf_counter()
+                try:
+                    connection.request('POST', path, body, {'Content-Type': 'application/json'})
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status != 200:
+                        local_errors += 1
+                except (OSError, http.client.HTTPException):
+                    local_errors += 1
+                    connection.close()
+                    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+                    continue
+                local_latencies.append(time.perf_counter() - started)
+        finally:
+            connection.close()
+            with results_lock:
+                latencies.extend(local_latencies)
+                errors[0] += local_errors
+
+    threads = [threading.Thread(target=client, name=f'loadtest-{n}') for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    completed = len(latencies)
+    return {
+        'requests': completed,
+        'items': completed * batch_size,
+        'errors': errors[0],
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(completed / elapsed, 1) if elapsed else 0.0,
+        'items_per_second': round(completed * batch_size / elapsed, 1) if elapsed else 0.0,
+        'latency_ms': {
+            'p50': round(_percentile(latencies, 0.50) * 1000, 3),
+            'p90': round(_percentile(latencies, 0.90) * 1000, 3),
+            'p99': round(_percentile(latencies, 0.99) * 1000, 3),
+            'max': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+    }
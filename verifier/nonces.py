@@ -0,0 +1,267 @@
+"""
+Challenges for replay-protected presentations.
+
+A verifier hands out a challenge (a nonce) and accepts each challenge in
+one presentation only, within a time window. Challenges are stateless:
+they carry their issue time and a random part, authenticated with a
+keyed BLAKE2b MAC under the verifier's secret, so the verifier keeps no record of
+the challenges it handed out.
+
+To reject replays, used challenges are recorded in one Bloom filter per
+time bucket of issue time. A challenge is only ever looked up in the
+bucket of its own issue time, so a check is O(1), and buckets older than
+the window are dropped, so memory stays constant however many
+challenges are used. A Bloom filter false positive rejects a fresh
+challenge as already used, never the other way round.
+"""
+
+import os
+import hmac
+import math
+import time
+import hashlib
+import secrets
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+
+class _BloomFilter:
+    """
+    Fixed-size Bloom filter over bytes.
+    """
+
+    __slots__ = ('size', 'hashes', 'bits', 'count')
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: bytes):
+        # Double hashing: the k positions are derived from two 64-bit hashes
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        size = self.size
+        return [position % size for position in range(first, first + self.hashes * second, second)]
+
+    def add(self, item: bytes) -> bool:
+        """Add an item. Returns False if it was (probably) present already."""
+        bits = self.bits
+        added = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, item: bytes) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    @property
+    def memory(self) -> int:
+        return len(self.bits)
+
+
+class _ExactSet:
+    """
+    Set of items with the interface of _BloomFilter; no false positives,
+    but memory grows with the number of items.
+    """
+
+    __slots__ = ('items',)
+
+    def __init__(self):
+        self.items = set()
+
+    def add(self, item: bytes) -> bool:
+        if item in self.items:
+            return False
+        self.items.add(item)
+        return True
+
+    def __contains__(self, item: bytes) -> bool:
+        return item in self.items
+
+    @property
+    def count(self) -> int:
+        return len(self.items)
+
+    @property
+    def memory(self) -> int:
+        return len(self.items) * 100  # Rough size of a set entry and its bytes
+
+
+class NonceStore:
+    """
+    Issues challenges and remembers the used ones for a sliding window.
+    """
+
+    def __init__(self, window: float = 300, bucket_seconds: float = 60,
+                 capacity: Optional[int] = 100000, error_rate: float = 1e-6,
+                 secret: Optional[bytes] = None, clock: Callable[[], float] = time.time):
+        """
+        Initialize the store.
+
+        Args:
+            window (float): Seconds a challenge can be used for after it was issued
+            bucket_seconds (float): Span of issue times sharing one filter;
+                window / bucket_seconds + 1 filters are kept
+            capacity (int, optional): Expected number of used challenges per
+                bucket; each filter is sized for it. None keeps exact sets,
+                whose memory grows with traffic, instead of Bloom filters.
+            error_rate (float): False positive rate of a filter at capacity
+            secret (bytes, optional): Key of at most 64 bytes authenticating
+                the challenges; share it between verifier processes that
+                accept each other's challenges. Defaults to a random key.
+            clock (callable): Returns the current time in seconds
+
+        Raises:
+            ValueError: If the secret is longer than 64 bytes
+        """
+        if secret is not None and len(secret) > 64:
+            raise ValueError("Challenge secret is longer than 64 bytes")
+        self.window = window
+        self.bucket_seconds = bucket_seconds
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._secret = secret or secrets.token_bytes(32)
+        self._clock = clock
+        self._buckets = {}  # Map of bucket index to the filter of challenges used from that bucket
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _mac(self, issued_at: int, random_part: bytes) -> bytes:
+        return hashlib.blake2b(issued_at.to_bytes(8, 'big') + random_part,
+                               key=self._secret, digest_size=16).digest()
+
+    def issue(self) -> str:
+        """
+        Create a challenge.
+
+        Returns:
+            str: The challenge, to be included in one presentation
+        """
+        issued_at = int(self._clock())
+        random_part = secrets.token_bytes(16)
+        return f"{issued_at:x}.{random_part.hex()}.{self._mac(issued_at, random_part).hex()}"
+
+    def _parse(self, challenge) -> Tuple[Optional[int], Optional[bytes], Optional[str]]:
+        """
+        Authenticate a challenge and check its age.
+
+        Returns:
+            tuple: (issue time, random part, None), or (None, None, error)
+                if the challenge is not valid
+        """
+        try:
+            issued_hex, random_hex, mac_hex = challenge.split('.')
+            issued_at = int(issued_hex, 16)
+            random_part = bytes.fromhex(random_hex)
+            mac = bytes.fromhex(mac_hex)
+            expected = self._mac(issued_at, random_part)
+        except (AttributeError, ValueError, OverflowError):
+            return None, None, "Invalid challenge"
+        if not hmac.compare_digest(mac, expected):
+            return None, None, "Invalid challenge"
+
+        age = self._clock() - issued_at
+        if age > self.window:
+            return None, None, "Challenge has expired"
+        if age < -self.bucket_seconds:
+            # Issued in the future: another verifier's clock is far ahead
+            return None, None, "Invalid challenge"
+        return issued_at, random_part, None
+
+    def _bucket(self, issued_at: int):
+        """Get the filter of an issue time, dropping the buckets past the window."""
+        index = int(issued_at // self.bucket_seconds)
+        bucket = self._buckets.get(index)
+        if bucket is None:
+            oldest = int((self._clock() - self.window) // self.bucket_seconds)
+            for stale in [stale for stale in self._buckets if stale < oldest]:
+                del self._buckets[stale]
+            bucket = self._buckets[index] = (
+                _ExactSet() if self.capacity is None else _BloomFilter(self.capacity, self.error_rate)
+            )
+        return bucket
+
+    def check(self, challenge: str) -> Optional[str]:
+        """
+        Check a challenge without using it up.
+
+        Returns:
+            str: Why the challenge cannot be used, or None if it can
+        """
+        issued_at, random_part, error = self._parse(challenge)
+        with self._lock:
+            if error is None and random_part in self._bucket(issued_at):
+                error = "Challenge was already used"
+            if error is not None:
+                self.rejected += 1
+        return error
+
+    def use(self, challenge: str) -> Optional[str]:
+        """
+        Use up a challenge. Of concurrent uses of one challenge, only one succeeds.
+
+        Returns:
+            str: Why the challenge cannot be used, or None if it was used up now
+        """
+        issued_at, random_part, error = self._parse(challenge)
+        with self._lock:
+            if error is None and not self._bucket(issued_at).add(random_part):
+                error = "Challenge was already used"
+            if error is not None:
+                self.rejected += 1
+        return error
+
+    def stats(self) -> Dict[str, int]:
+        """Get the number of buckets, used challenges, rejections and filter memory in bytes."""
+        with self._lock:
+            buckets = list(self._buckets.values())
+        return {
+            'buckets': len(buckets),
+            'used': sum(bucket.count for bucket in buckets),
+            'rejected': self.rejected,
+            'memory': sum(bucket.memory for bucket in buckets),
+        }
+
+
+_nonce_store = None
+_nonce_store_lock = threading.Lock()
+
+
+def get_nonce_store() -> NonceStore:
+    """
+    Get the nonce store shared by every verifier of the process.
+
+    Its secret is read from the VERIFIER_CHALLENGE_SECRET environment
+    variable (hex), so verifier processes configured with the same secret
+    accept each other's challenges; without it, a random secret is used.
+    Used challenges are remembered in memory per process, so each process
+    accepts a challenge once; to accept it once overall, send all
+    presentations to one process.
+
+    Raises:
+        ValueError: If VERIFIER_CHALLENGE_SECRET is not a hex string of
+            at most 64 bytes
+    """
+    global _nonce_store
+    with _nonce_store_lock:
+        if _nonce_store is None:
+            secret = os.environ.get('VERIFIER_CHALLENGE_SECRET')
+            _nonce_store = NonceStore(secret=bytes.fromhex(secret) if secret else None)
+        return _nonce_store
+
+
+def set_nonce_store(nonce_store: NonceStore) -> None:
+    """Replace the nonce store shared by every verifier of the process."""
+    global _nonce_store
+    with _nonce_store_lock:
+        _nonce_store = nonce_store
@@ -0,0 +1,119 @@
+"""
+Cache of verification outcomes.
+
+Verifiers often see the same credentials again within minutes. The
+outcome of the expensive checks (the non-revocation proof and the
+Ed25519 signature) only depends on the credential's bytes, the issuer's
+revocation root and the issuer's keys, so it is cached under all three:
+
+    (SHA-256 of the signed data, signature and proof, root hash, key IDs)
+
+A new root or a key rotation changes the key, so stale outcomes are
+never served; they simply age out of the LRU order. Checks that depend
+on the time (expiration) are never cached.
+"""
+
+import json
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from common.storage import StorageBackend, get_storage
+
+
+class VerificationCache:
+    """
+    Bounded LRU cache of proof and signature check outcomes, valid and invalid.
+    """
+
+    def __init__(self, max_entries: int = 100000):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries (int): Maximum number of cached outcomes; 0 disables caching
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # Key -> (is valid, details)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def digest(signable: str, signature: str, proof) -> str:
+        """Hash the canonical bytes of a credential or presentation."""
+        data = json.dumps([signable, signature, proof], separators=(',', ':'))
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def make_key(digest: str, root_hash: str, key_ids: Tuple[str, ...]) -> tuple:
+        """Build the cache key of an outcome."""
+        return (digest, root_hash, key_ids)
+
+    def get(self, key: tuple) -> Optional[Tuple[bool, Dict[str, Any]]]:
+        """Get a cached outcome, or None if it is not cached."""
+        with self._lock:
+            outcome = self._entries.get(key)
+            if outcome is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return outcome
+
+    def put(self, key: tuple, outcome: Tuple[bool, Dict[str, Any]]) -> None:
+        """Cache an outcome."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = outcome
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the cache metrics.
+
+        Returns:
+            dict: hits, misses, evictions and entries
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+            }
+
+
+_result_caches = weakref.WeakKeyDictionary()
+_result_caches_lock = threading.Lock()
+
+
+def get_result_cache(storage: Optional[StorageBackend] = None) -> VerificationCache:
+    """
+    Get the verification cache shared by every verifier of a storage backend.
+
+    Args:
+        storage (StorageBackend, optional): Storage to use instead of the default
+
+    Returns:
+        VerificationCache: The shared cache
+    """
+    storage = storage or get_storage()
+    with _result_caches_lock:
+        result_cache = _result_caches.get(storage)
+        if result_cache is None:
+            result_cache = VerificationCache()
+            _result_caches[storage] = result_cache
+        return result_cache
@@ -0,0 +1,187 @@
+"""
+Cache of issuers' revocation roots for verifiers.
+
+Every verification checks a non-revocation proof against the issuer's
+current public root. The cache keeps the roots in memory together with
+the time they were read, so a verification only reads storage when the
+cached root is too old for its policy:
+
+    strict: a root older than the verifier's maximum staleness is read
+        again before it is used
+    fast: the cached root is always used; a background thread (see
+        start) re-reads the roots of all cached issuers every
+        refresh_interval, which bounds how stale they get
+
+Either way the age of the root used is reported, so callers can see how
+fresh each verification was.
+"""
+
+import time
+import logging
+import threading
+import weakref
+from typing import Callable, Dict, Optional, Tuple
+
+from common.storage import StorageBackend, get_storage, REVOCATION_PUBLIC
+
+
+logger = logging.getLogger(__name__)
+
+
+STRICT = 'strict'
+FAST = 'fast'
+ROOT_POLICIES = (STRICT, FAST)
+
+
+class RootCache:
+    """
+    In-memory map of issuer IDs to their revocation roots and load times.
+
+    Background refreshes that fail are logged and counted in failures,
+    with the latest exception in last_error; cached roots are kept until
+    a later refresh succeeds.
+    """
+
+    def __init__(self, storage: Optional[StorageBackend] = None, refresh_interval: float = 10,
+                 min_reload_interval: float = 1, clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize the cache.
+
+        Args:
+            storage (StorageBackend, optional): Storage to use instead of the default
+            refresh_interval (float): Seconds between reloads of all cached
+                roots by the background thread
+            min_reload_interval (float): Minimum age of a root before a
+                failed proof check may reload it
+            clock (callable): Monotonic time source in seconds
+        """
+        self.storage = storage or get_storage()
+        self.refresh_interval = refresh_interval
+        self.min_reload_interval = min_reload_interval
+        self._clock = clock
+        self._roots = {}  # Map of issuer ID to (root hash, load time)
+        self._stop = threading.Event()
+        self._thread = None
+        self.failures = 0
+        self.last_error = None
+
+    def load(self, issuer_id: str) -> Optional[Tuple[str, float]]:
+        """
+        Read the current root of an issuer from storage into the cache.
+
+        Returns:
+            tuple: (root hash, load time), or None if the issuer has no root
+        """
+        data = self.storage.get_readonly(REVOCATION_PUBLIC, issuer_id)
+        if not data:
+            self._roots.pop(issuer_id, None)
+            return None
+        entry = (data['root_hash'], self._clock())
+        self._roots[issuer_id] = entry
+        return entry
+
+    def get(self, issuer_id: str, max_staleness: Optional[float] = None) -> Optional[Tuple[str, float]]:
+        """
+        Get the root of an issuer.
+
+        Args:
+            issuer_id (str): ID of the issuer
+            max_staleness (float, optional): Reload the root if it was
+                loaded longer ago than this many seconds; a cached root of
+                any age is used if not given
+
+        Returns:
+            tuple: (root hash, age in seconds), or None if the issuer has no root
+        """
+        entry = self._roots.get(issuer_id)
+        now = self._clock()
+        if entry is None or (max_staleness is not None and now - entry[1] > max_staleness):
+            entry = self.load(issuer_id)
+            if entry is None:
+                return None
+        return entry[0], max(0.0, now - entry[1])
+
+    def reload_if_old(self, issuer_id: str) -> Optional[Tuple[str, float]]:
+        """
+        Reload a root after a failed proof check, unless it was loaded very
+        recently. The root may have changed since it was cached, e.g. for a
+        credential refreshed against a newer root.
+
+        Returns:
+            tuple: (root hash, age in seconds) if the root was reloaded, else None
+        """
+        entry = self._roots.get(issuer_id)
+        if entry is not None and self._clock() - entry[1] < self.min_reload_interval:
+            return None
+        entry = self.load(issuer_id)
+        return (entry[0], 0.0) if entry is not None else None
+
+    def ages(self) -> Dict[str, float]:
+        """Get the age in seconds of every cached root, by issuer ID."""
+        now = self._clock()
+        return {issuer_id: now - loaded for issuer_id, (_, loaded) in list(self._roots.items())}
+
+    def refresh(self) -> int:
+        """
+        Reload every cached root.
+
+        Returns:
+            int: Number of roots reloaded
+        """
+        issuer_ids = list(self._roots)
+        for issuer_id in issuer_ids:
+            self.load(issuer_id)
+        return len(issuer_ids)
+
+    def clear(self) -> None:
+        """Drop every cached root."""
+        self._roots.clear()
+
+    def start(self) -> None:
+        """Start reloading the cached roots in a background thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='root-cache-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the background thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        """Refresh every refresh_interval until stopped."""
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                # A failed run must not end the schedule
+                self.failures += 1
+                self.last_error = e
+                logger.exception("Revocation root refresh failed")
+
+
+_root_caches = weakref.WeakKeyDictionary()
+_root_caches_lock = threading.Lock()
+
+
+def get_root_cache(storage: Optional[StorageBackend] = None) -> RootCache:
+    """
+    Get the root cache shared by every verifier of a storage backend.
+
+    Args:
+        storage (StorageBackend, optional): Storage to use instead of the default
+
+    Returns:
+        RootCache: The shared root cache
+    """
+    storage = storage or get_storage()
+    with _root_caches_lock:
+        root_cache = _root_caches.get(storage)
+        if root_cache is None:
+            root_cache = RootCache(storage)
+            _root_caches[storage] = root_cache
+        return root_cache
@@ -0,0 +1,273 @@
+"""
+Standalone verification HTTP service.
+
+A small HTTP/1.1 server on asyncio, meant to sit in front of gate
+traffic instead of the Flask demo. Connections are kept alive, and one
+warmed-up Verifier (trust store, root cache and result cache) is shared
+by every request. Verification runs on a thread pool, so the event loop
+only parses requests and writes responses.
+
+Endpoints:
+
+    POST /verify        a credential or presentation (JSON object)
+                        -> {"valid": true, "details": {...}}
+    POST /verify/batch  a JSON array of credentials and presentations
+                        -> {"results": [{"valid": ..., "details": ...}, ...]}
+    GET  /challenge     -> {"challenge": "..."} to include in one presentation
+    GET  /health        -> {"status": "ok", "result_cache": {...}, "challenges": {...}}
+    GET  /metrics       stage latency histograms in the Prometheus text format
+    GET  /metrics/json  the same histograms as JSON
+
+The latency histograms are only filled while metrics are enabled (see
+common.metrics). Challenges are issued and used up through the nonce
+store shared by the process (see verifier.nonces.get_nonce_store); set
+VERIFIER_CHALLENGE_SECRET so that several server processes accept each
+other's challenges.
+"""
+
+import os
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from common.metrics import get_metrics
+from .verifier import Verifier
+from .roots import FAST
+
+
+MAX_BODY_SIZE = 16 * 1024 * 1024
+MAX_BATCH_SIZE = 10000
+MAX_HEADER_COUNT = 100
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            411: 'Length Required', 413: 'Payload Too Large'}
+
+
+class _BadRequest(Exception):
+    """A request that cannot be parsed; the connection is closed after the response."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class VerificationServer:
+    """
+    HTTP service verifying credentials and presentations with a shared Verifier.
+    """
+
+    def __init__(self, verifier: Optional[Verifier] = None, host: str = '127.0.0.1', port: int = 8080,
+                 workers: Optional[int] = None, batch_chunk_size: int = 64,
+                 keep_alive_timeout: float = 15):
+        """
+        Initialize the server.
+
+        Args:
+            verifier (Verifier, optional): Verifier to share; defaults to one
+                with the fast root policy
+            host (str): Address to listen on
+            port (int): Port to listen on; 0 picks a free port
+            workers (int, optional): Number of verification threads;
+                defaults to the number of CPUs
+            batch_chunk_size (int): Number of batch items verified per task
+            keep_alive_timeout (float): Seconds an idle connection is kept open
+        """
+        self.verifier = verifier or Verifier(root_policy=FAST)
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 4
+        self.batch_chunk_size = batch_chunk_size
+        self.keep_alive_timeout = keep_alive_timeout
+        self._executor = None
+        self._server = None
+        self._warmed_up = False
+
+    def warm_up(self) -> int:
+        """
+        Load every issuer's keys and revocation root before serving.
+
+        Returns:
+            int: Number of issuers whose root was loaded
+        """
+        trust_store = self.verifier.trust_store
+        trust_store.refresh(force=True)
+        trust_store.start()
+        loaded = 0
+        for issuer_id in trust_store.issuer_ids():
+            if self.verifier.root_cache.get(issuer_id) is not None:
+                loaded += 1
+        self._warmed_up = True
+        return loaded
+
+    async def start(self) -> None:
+        """Start listening. The actual port is in self.port afterwards."""
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='verify')
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        """Start the server if needed and serve until cancelled."""
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        """Stop listening and shut down the worker pool."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def run(self) -> None:
+        """Warm up, unless that was already done, and serve until interrupted."""
+        if not self._warmed_up:
+            self.warm_up()
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            pass
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve the requests of one connection until it is closed or idle."""
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.keep_alive_timeout)
+                except _BadRequest as e:
+                    self._write_response(writer, e.status, {'error': str(e)}, keep_alive=False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+
+                method, path, headers, body = request
+                status, payload = await self._dispatch(method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # Idle, dropped or oversized connections are simply closed
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        """
+        Read one request.
+
+        Returns:
+            tuple: (method, path, headers, body), or None if the client
+                closed the connection
+        """
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, path, version = request_line.decode('latin-1').split()
+        except ValueError:
+            raise _BadRequest(400, "Malformed request line")
+        if not version.startswith('HTTP/1.'):
+            raise _BadRequest(400, "Unsupported HTTP version")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            if len(headers) >= MAX_HEADER_COUNT:
+                raise _BadRequest(400, "Too many headers")
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if version == 'HTTP/1.0' and headers.get('connection', '').lower() != 'keep-alive':
+            headers['connection'] = 'close'
+
+        body = b''
+        if method == 'POST':
+            if 'transfer-encoding' in headers:
+                raise _BadRequest(411, "Chunked requests are not supported; send Content-Length")
+            try:
+                length = int(headers.get('content-length', '0'))
+            except ValueError:
+                raise _BadRequest(400, "Invalid Content-Length")
+            if length > MAX_BODY_SIZE:
+                raise _BadRequest(413, "Request body too large")
+            body = await reader.readexactly(length)
+        return method, path.split('?', 1)[0], headers, body
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, status: int, payload: Any, keep_alive: bool) -> None:
+        """Write a JSON response, or a plain text one if the payload is a string."""
+        if isinstance(payload, str):
+            body = payload.encode('utf-8')
+            content_type = 'text/plain; version=0.0.4'
+        else:
+            body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+            content_type = 'application/json'
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+
+    async def _dispatch(self, method: str, path: str, body: bytes) -> Tuple[int, Any]:
+        """Route a request and get its status and JSON payload."""
+        if path == '/health':
+            if method != 'GET':
+                return 405, {'error': "Use GET"}
+            return 200, {'status': 'ok', 'result_cache': self.verifier.result_cache.stats(),
+                         'challenges': self.verifier.nonce_store.stats()}
+        if path == '/challenge':
+            if method != 'GET':
+                return 405, {'error': "Use GET"}
+            return 200, {'challenge': self.verifier.create_challenge()}
+        if path in ('/metrics', '/metrics/json'):
+            if method != 'GET':
+                return 405, {'error': "Use GET"}
+            metrics = get_metrics()
+            return 200, metrics.to_dict() if path == '/metrics/json' else metrics.to_prometheus()
+
+        if path not in ('/verify', '/verify/batch'):
+            return 404, {'error': "Not found"}
+        if method != 'POST':
+            return 405, {'error': "Use POST"}
+        try:
+            document = json.loads(body)
+        except ValueError:
+            return 400, {'error': "Body is not JSON"}
+
+        loop = asyncio.get_running_loop()
+        if path == '/verify':
+            if not isinstance(document, dict):
+                return 400, {'error': "Expected a JSON object"}
+            is_valid, details = await loop.run_in_executor(self._executor, self.verifier.verify, document)
+            return 200, {'valid': is_valid, 'details': details}
+
+        if not isinstance(document, list):
+            return 400, {'error': "Expected a JSON array"}
+        if len(document) > MAX_BATCH_SIZE:
+            return 413, {'error': f"At most {MAX_BATCH_SIZE} items per batch"}
+        chunks = [document[start:start + self.batch_chunk_size]
+                  for start in range(0, len(document), self.batch_chunk_size)]
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self._executor, self._verify_chunk, chunk) for chunk in chunks
+        ))
+        return 200, {'results': [result for chunk_results in results for result in chunk_results]}
+
+    def _verify_chunk(self, items: List[Any]) -> List[Dict[str, Any]]:
+        """Verify part of a batch on a worker thread."""
+        results = []
+        for item in items:
+            is_valid, details = self.verifier.verify(item)
+            results.append({'valid': is_valid, 'details': details})
+        return results
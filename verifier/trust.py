@@ -0,0 +1,227 @@
+"""
+Trust store of issuer public keys for verifiers.
+
+Issuers publish their public keys in the ISSUER_KEYS collection,
+
+    {"issuer_id": "<id>", "name": "...", "current": "<kid>",
+     "keys": [{"kid": "<kid>", "public_key": "<base64>", "created": ...}]}
+
+with the newest key first. The trust store loads every published key
+once, parsed, so looking up and using the keys of an issuer is a
+dictionary hit without any I/O. It reloads when the collection changes:
+on a timer, or when an unknown issuer or a signature that none of the
+known keys accept suggests the store is behind. Reloads caused by
+failed lookups are rate limited, so bad input cannot make every
+verification read storage.
+"""
+
+import time
+import logging
+import threading
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+from common.crypto import CryptoManager
+from common.storage import StorageBackend, get_storage, ISSUER_KEYS, META
+from issuer.registry import REGISTRY_KEY
+
+
+logger = logging.getLogger(__name__)
+
+
+# The (kid, parsed public key) pairs of an issuer, newest first
+IssuerKeys = Tuple[Tuple[str, Any], ...]
+
+
+class TrustStore:
+    """
+    In-memory map of issuer IDs to their parsed public keys.
+
+    A background check that fails is logged, counted in failures and
+    kept in last_error; the loaded keys stay in use until a later check
+    succeeds.
+    """
+
+    def __init__(self, storage: Optional[StorageBackend] = None, refresh_interval: float = 60,
+                 min_reload_interval: float = 1):
+        """
+        Initialize the trust store. Keys are loaded on first use.
+
+        Args:
+            storage (StorageBackend, optional): Storage to use instead of the default
+            refresh_interval (float): Seconds between checks for changed keys
+                by the background thread (see start)
+            min_reload_interval (float): Minimum seconds between reloads
+                caused by unknown issuers or unverifiable signatures
+        """
+        self.storage = storage or get_storage()
+        self.refresh_interval = refresh_interval
+        self.min_reload_interval = min_reload_interval
+        self._keys = {}  # Map of issuer ID to IssuerKeys
+        self._version = None
+        self._loaded = False
+        self._last_reload = float('-inf')
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.failures = 0
+        self.last_error = None
+
+    def _get_version(self):
+        """Get the change token of the stored keys, or None if unknown."""
+        versions = (self.storage.collection_version(ISSUER_KEYS),
+                    self.storage.collection_version(META))
+        return None if None in versions else versions
+
+    def _read_keys(self) -> Dict[str, IssuerKeys]:
+        """Read and parse every published issuer key."""
+        keys = {}
+        for issuer_id, keys_data in self.storage.items(ISSUER_KEYS):
+            keys[issuer_id] = tuple(
+                (key['kid'], CryptoManager.load_public_key(key['public_key']))
+                for key in keys_data.get('keys', [])
+            )
+
+        # Issuers that have not published their keys yet are trusted with
+        # the key in the public issuer registry
+        registry = self.storage.get_readonly(META, REGISTRY_KEY) or {}
+        for issuer_id, record in registry.items():
+            public_key = record.get('public_key')
+            if issuer_id not in keys and public_key:
+                keys[issuer_id] = ((CryptoManager.key_id(public_key),
+                                    CryptoManager.load_public_key(public_key)),)
+        return keys
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Reload the keys if they changed since they were last loaded.
+
+        Args:
+            force (bool): Reload even if the keys look unchanged
+
+        Returns:
+            bool: Whether the keys were reloaded
+        """
+        with self._reload_lock:
+            self._last_reload = time.monotonic()
+            version = self._get_version()
+            if self._loaded and not force and version is not None and version == self._version:
+                return False
+            # Swapped in whole, so lookups never see a half-loaded store
+            self._keys = self._read_keys()
+            self._version = version
+            self._loaded = True
+            return True
+
+    def refresh_after_miss(self) -> bool:
+        """
+        Reload after a failed lookup or signature check, unless a reload
+        happened very recently.
+
+        Returns:
+            bool: Whether the keys were reloaded
+        """
+        if time.monotonic() - self._last_reload < self.min_reload_interval:
+            return False
+        return self.refresh()
+
+    def get_keys(self, issuer_id: str) -> IssuerKeys:
+        """
+        Get the keys of an issuer.
+
+        Args:
+            issuer_id (str): ID of the issuer
+
+        Returns:
+            tuple: The (kid, public key) pairs of the issuer, newest
+                first; empty if the issuer is unknown
+        """
+        if not self._loaded:
+            self.refresh()
+        keys = self._keys.get(issuer_id)
+        if keys is None and self.refresh_after_miss():
+            keys = self._keys.get(issuer_id)
+        return keys or ()
+
+    def issuer_ids(self) -> List[str]:
+        """Get the IDs of every trusted issuer."""
+        if not self._loaded:
+            self.refresh()
+        return list(self._keys)
+
+    def verify(self, issuer_id: str, message: str, signature_b64: str) -> Optional[str]:
+        """
+        Verify a signature made by an issuer with any of its keys.
+
+        Args:
+            issuer_id (str): ID of the issuer
+            message (str): Signed message
+            signature_b64 (str): Base64-encoded signature
+
+        Returns:
+            str: The kid of the key that verified the signature, or None
+                if no key of the issuer did
+        """
+        keys = self.get_keys(issuer_id)
+        kid = self.verify_with_keys(keys, message, signature_b64)
+        if kid is None and keys and self.refresh_after_miss():
+            # The issuer may have rotated to a key not loaded yet
+            kid = self.verify_with_keys(self._keys.get(issuer_id, ()), message, signature_b64)
+        return kid
+
+    @staticmethod
+    def verify_with_keys(keys: IssuerKeys, message: str, signature_b64: str) -> Optional[str]:
+        """Try keys from get_keys in order and get the kid of the first that verifies."""
+        for kid, public_key in keys:
+            if CryptoManager.verify_with_key(public_key, message, signature_b64):
+                return kid
+        return None
+
+    def start(self) -> None:
+        """Start checking for changed keys in a background thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='trust-store-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the background thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        """Refresh every refresh_interval until stopped."""
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                # A failed check must not end the schedule
+                self.failures += 1
+                self.last_error = e
+                logger.exception("Trust store refresh failed")
+
+
+_trust_stores = weakref.WeakKeyDictionary()
+_trust_stores_lock = threading.Lock()
+
+
+def get_trust_store(storage: Optional[StorageBackend] = None) -> TrustStore:
+    """
+    Get the trust store shared by every verifier of a storage backend.
+
+    Args:
+        storage (StorageBackend, optional): Storage to use instead of the default
+
+    Returns:
+        TrustStore: The shared trust store
+    """
+    storage = storage or get_storage()
+    with _trust_stores_lock:
+        trust_store = _trust_stores.get(storage)
+        if trust_store is None:
+            trust_store = TrustStore(storage)
+            _trust_stores[storage] = trust_store
+        return trust_store
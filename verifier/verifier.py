@@ -2,14 +2,89 @@
 Verifier module for the privacy-preserving digital credential system.
 """
 
-import os
 import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
 from common.crypto import CryptoManager
-from common.models import Credential, RevocationList
-from common.utils import (
-    current_timestamp, load_json, get_credentials_dir, get_revocation_dir
-)
+from common.models import Credential, attribute_digest, holder_binding_json, presentation_signable_json
+from common.utils import current_timestamp
+from common.storage import get_storage
+from common.metrics import get_metrics
+from .trust import get_trust_store
+from .roots import get_root_cache, STRICT, FAST, ROOT_POLICIES
+from .results import VerificationCache, get_result_cache
+from .bundle import VerifierBundle, BundleTrustStore, BundleRootCache
+from .nonces import get_nonce_store
+
+
+def _check_presentation_schema(presentation):
+    """
+    Check the shape of a presentation.
+    
+    Returns:
+        str: Why the presentation is malformed, or None if it is well-formed
+    """
+    if not isinstance(presentation, dict) or not isinstance(presentation.get('credential_id'), str):
+        return "Malformed presentation"
+    if 'presentation_signature' not in presentation or 'attribute_digests' not in presentation:
+        return "Presentation has no attribute digests; the credential must be refreshed by its issuer"
+    for field in ('challenge', 'holder_public_key', 'holder_signature'):
+        if not isinstance(presentation.get(field), (str, type(None))):
+            return f"Malformed presentation: {field}"
+    
+    for field in ('issuer_id', 'holder_id', 'issuer_name', 'type',
+                  'revocation_uuid', 'presentation_signature'):
+        if not isinstance(presentation.get(field), str):
+            return f"Malformed presentation: {field}"
+    if not isinstance(presentation.get('issuance_date'), int):
+        return "Malformed presentation: issuance_date"
+    if not isinstance(presentation.get('expiration_date'), (int, type(None))):
+        return "Malformed presentation: expiration_date"
+    
+    proof = presentation.get('proof')
+    if not isinstance(proof, list) or not all(
+            isinstance(step, (list, tuple)) and len(step) == 2
+            and isinstance(step[0], str) and isinstance(step[1], bool) for step in proof):
+        return "Malformed presentation: proof"
+    
+    digests = presentation.get('attribute_digests')
+    if not isinstance(digests, list) or not all(isinstance(digest, str) for digest in digests):
+        return "Malformed presentation: attribute_digests"
+    
+    attributes = presentation.get('attributes')
+    disclosures = presentation.get('disclosures')
+    if not isinstance(attributes, dict) or not isinstance(disclosures, dict):
+        return "Malformed presentation: attributes"
+    if any(not isinstance(disclosures.get(name), str) for name in attributes):
+        return "Malformed presentation: disclosures"
+    return None
+
+
+def _check_holder_signature(presentation, challenge, disclosed_digests):
+    """
+    Check that the holder signed the challenge and the disclosed attributes
+    with the key certified in the credential.
+    
+    Returns:
+        str: Why the presentation does not prove possession of the holder
+            key, or None if it does
+    """
+    holder_public_key = presentation.get('holder_public_key')
+    if holder_public_key is None:
+        return "Credential has no holder key to answer a challenge with"
+    signature = presentation.get('holder_signature')
+    if signature is None:
+        return "Presentation is not signed by the holder"
+    try:
+        public_key = CryptoManager.load_public_key(holder_public_key)
+    except ValueError:
+        return "Invalid holder signature"
+    message = holder_binding_json(challenge, presentation['credential_id'], disclosed_digests)
+    if not CryptoManager.verify_with_key(public_key, message, signature):
+        return "Invalid holder signature"
+    return None
 
 
 class Verifier:
@@ -17,38 +92,101 @@ class Verifier:
     Verifier class for validating credentials.
     """
     
-    def __init__(self, name=None):
+    def __init__(self, name=None, storage=None, trust_store=None, root_cache=None,
+                 root_policy=STRICT, max_root_staleness=None, result_cache=None,
+                 nonce_store=None, require_challenge=False):
         """
         Initialize a verifier.
         
         Args:
             name (str, optional): Name of the verifier.
+            storage (StorageBackend, optional): Storage to use instead of the default.
+            trust_store (TrustStore, optional): Issuer keys to trust. Defaults
+                to the trust store shared by all verifiers of the storage.
+            root_cache (RootCache, optional): Cache of revocation roots. Defaults
+                to the cache shared by all verifiers of the storage.
+            root_policy (str): 'strict' to reload roots older than
+                max_root_staleness before using them, or 'fast' to always use
+                the cached root and refresh roots in the background.
+            max_root_staleness (float, optional): Seconds a root may be used
+                for after it was read. Defaults to 0 (read for every
+                verification) under the strict policy, and to the root
+                cache's refresh interval under the fast policy.
+            result_cache (VerificationCache, optional): Cache of proof and
+                signature check outcomes. Defaults to the cache shared by all
+                verifiers of the storage.
+            nonce_store (NonceStore, optional): Issues the verifier's
+                challenges and remembers the used ones. Defaults to the
+                store shared by all verifiers of the process, so a
+                challenge can be answered to any of them.
+            require_challenge (bool): Reject presentations that do not
+                answer a challenge from the verifier's nonce store.
         """
+        if root_policy not in ROOT_POLICIES:
+            raise ValueError(f"Unknown root policy: {root_policy}")
         self.name = name or "Verifier"
+        self.storage = storage or get_storage()
+        self.trust_store = trust_store or get_trust_store(self.storage)
+        self.root_cache = root_cache or get_root_cache(self.storage)
+        self.result_cache = result_cache or get_result_cache(self.storage)
+        self.root_policy = root_policy
+        if max_root_staleness is None:
+            max_root_staleness = 0.0 if root_policy == STRICT else self.root_cache.refresh_interval
+        self.max_root_staleness = max_root_staleness
+        self.nonce_store = nonce_store or get_nonce_store()
+        self.require_challenge = require_challenge
+        self.bundle = None
+        self.metrics = get_metrics()
+        if root_policy == FAST:
+            self.root_cache.start()
     
-    def _get_issuer_public_key(self, issuer_id):
+    @classmethod
+    def from_bundle(cls, path, public_key, name=None, result_cache=None):
         """
-        Get the public key of an issuer.
+        Create a verifier from an offline bundle written by build_bundle.
+        
+        The bundle's signature is checked, then it is memory mapped and
+        only its issuer table is read, so the verifier is ready at once and
+        does not read the issuers' data directory. Once the bundle has
+        expired, every verification fails.
         
         Args:
-            issuer_id (str): ID of the issuer
+            path (str): Path of the bundle file
+            public_key (str): Base64-encoded public key of the bundle
+                signing key
+            name (str, optional): Name of the verifier.
+            result_cache (VerificationCache, optional): Cache of check outcomes;
+                defaults to a new cache for this verifier.
             
         Returns:
-            str: The public key, or None if not found
+            Verifier: The verifier
+            
+        Raises:
+            ValueError: If the file is not a bundle signed with public_key
         """
-        # Look for the issuer file
-        issuer_file = os.path.join(
-            get_credentials_dir(), 
-            f"issuer_{issuer_id}.json"
-        )
-        
-        if os.path.exists(issuer_file):
-            issuer_data = load_json(issuer_file)
-            public_key = issuer_data.get('public_key')
-            if public_key:
-                return public_key
+        bundle = VerifierBundle(path, public_key)
+        root_cache = BundleRootCache(bundle)
+        verifier = cls(name=name, trust_store=BundleTrustStore(bundle), root_cache=root_cache,
+                       root_policy=FAST, max_root_staleness=root_cache.refresh_interval,
+                       result_cache=result_cache or VerificationCache())
+        verifier.bundle = bundle
+        return verifier
+    
+    def _get_root(self, issuer_id):
+        """
+        Get the revocation root of an issuer under the verifier's root policy.
         
-        return None
+        Args:
+            issuer_id (str): ID of the issuer
+            
+        Returns:
+            tuple: (root hash, age of the root in seconds)
+        """
+        max_staleness = self.max_root_staleness if self.root_policy == STRICT else None
+        root = self.root_cache.get(issuer_id, max_staleness)
+        if root is None:
+            raise ValueError("Revocation entry not found.")
+        return root
     
     def _get_root_hash(self, issuer_id) -> str:
         """
@@ -60,58 +198,382 @@ class Verifier:
         Returns:
             The value at the root of the hash tree.
         """
-        # Look for the revocation list file
-        revocation_file = os.path.join(
-            get_revocation_dir(), 
-            f"revocation_list_{issuer_id}_public.json"
-        )
-        
-        if os.path.exists(revocation_file):
-            data = load_json(revocation_file)
-            if data:
-                return data["root_hash"]
-        
-        raise ValueError("Revocation entry not found.")
+        return self._get_root(issuer_id)[0]
+    
+    def _root_details(self, root_age):
+        """Describe the freshness of the root a verification used."""
+        return {
+            "root_age": round(root_age, 3),
+            "root_fresh": root_age <= self.max_root_staleness,
+        }
     
     def verify_credential(self, credential: Credential):
         """
-        Verify a credential or presentation.
+        Verify a credential.
+        
+        Checks run from cheapest to most expensive, so invalid credentials
+        are rejected early: issuer known, expiration, non-revocation proof,
+        and the Ed25519 signature last. While latency metrics are enabled,
+        the time spent in each stage is recorded (see common.metrics).
         
         Args:
-            credential_or_presentation: Either a Credential object or a presentation dict
+            credential (Credential): The credential to verify
             
         Returns:
             tuple: (is_valid, details)
                 is_valid (bool): True if the credential is valid
                 details (dict): Details about the validation
         """ 
-        issuer_id = credential.issuer_id
-        signature = credential.signature
-        revocation_uuid = credential.revocation_uuid
-
-        signable_data = credential.to_signable_json()
+        trace = self.metrics.trace('verify_credential')
+        result = self._verify_credential(credential, trace=trace)
+        if trace:
+            trace.finish()
+        return result
+    
+    def _verify_credential(self, credential: Credential, root=None, trace=None):
+        """
+        Verify a credential, optionally against an already looked up root.
         
-        # Get the issuer's public key
-        public_key = self._get_issuer_public_key(issuer_id)
-        if not public_key:
-            return (False, {"error": "Issuer not found"})
+        Args:
+            credential (Credential): The credential
+            root (tuple, optional): (root hash, age) of the issuer's revocation root
+            trace (StageTrace, optional): Records the time spent in each stage
+        """
+        if not isinstance(credential.issuer_id, str) or not isinstance(credential.signature, str):
+            return (False, {"error": "Malformed credential"})
         
-       # Verify the signature directly
-        signature_valid = CryptoManager.verify(
-            public_key, signable_data, signature
+        is_valid, details = self._run_checks(
+            credential.issuer_id, credential.expiration_date, credential.non_revoked_proof,
+            credential.revocation_uuid, credential.to_signable_json, credential.signature, root, trace
         )
+        if is_valid:
+            details = {"message": "Credential is valid", **details}
+        return (is_valid, details)
+    
+    def create_challenge(self):
+        """
+        Create a challenge for a holder to include in one presentation.
+        
+        Returns:
+            str: The challenge, valid for the nonce store's window
+        """
+        return self.nonce_store.issue()
+    
+    def verify_presentation(self, presentation, challenge=None):
+        """
+        Verify a presentation created by Wallet.create_presentation.
         
-        if not signature_valid:
-            return (False, {"error": "Invalid signature"})
+        Besides the checks of verify_credential, every disclosed attribute
+        must match one of the salted attribute digests covered by the
+        issuer's presentation signature. Attributes that are not disclosed
+        are only known by their digest.
         
-        # Check if the credential is revoked
-        true_root_value = self._get_root_hash(issuer_id)
-        if not CryptoManager.check_proof(credential.non_revoked_proof, revocation_uuid, true_root_value):
-            return (False, {"error": "Credential was revoked"})
+        A presentation answering a challenge (see create_challenge) must
+        be signed by the holder key certified in the credential, over the
+        challenge and the disclosed attributes, so it cannot be made to
+        answer another challenge. It is only valid once: its challenge is
+        used up when it verifies, so the same presentation replayed later
+        is rejected.
+        
+        Args:
+            presentation (dict): The presentation
+            challenge (str, optional): The challenge the presentation must
+                answer, e.g. the one handed to this holder's session
+            
+        Returns:
+            tuple: (is_valid, details)
+                is_valid (bool): True if the presentation is valid
+                details (dict): Details about the validation
+        """
+        trace = self.metrics.trace('verify_presentation')
+        result = self._verify_presentation(presentation, trace=trace, challenge=challenge)
+        if trace:
+            trace.finish()
+        return result
+    
+    def _verify_presentation(self, presentation, root=None, trace=None, challenge=None):
+        """Verify a presentation, optionally against an already looked up root."""
+        error = _check_presentation_schema(presentation)
+        if error:
+            return (False, {"error": error})
+        
+        # Reject replays before any hashing
+        presented = presentation.get('challenge')
+        if challenge is not None and presented != challenge:
+            return (False, {"error": "Presentation does not answer the challenge"})
+        if presented is not None:
+            error = self.nonce_store.check(presented)
+            if error:
+                return (False, {"error": error})
+        elif self.require_challenge:
+            return (False, {"error": "Presentation has no challenge"})
+        
+        # Recompute the digest of every disclosed attribute
+        digests = set(presentation['attribute_digests'])
+        salts = presentation['disclosures']
+        disclosed_digests = []
+        for name, value in presentation['attributes'].items():
+            digest = attribute_digest(salts[name], name, value)
+            if digest not in digests:
+                return (False, {"error": f"Disclosed attribute does not match the credential: {name}"})
+            disclosed_digests.append(digest)
+        if trace:
+            trace.mark('disclosures')
+        
+        is_valid, details = self._run_checks(
+            presentation['issuer_id'], presentation['expiration_date'], presentation['proof'],
+            presentation['revocation_uuid'], lambda: presentation_signable_json(presentation),
+            presentation['presentation_signature'], root, trace
+        )
+        if is_valid and presented is not None:
+            # The holder key is covered by the presentation signature checked above
+            error = _check_holder_signature(presentation, presented, disclosed_digests)
+            if trace:
+                trace.mark('holder_signature')
+            if error:
+                return (False, {"error": error})
+            # Only one of concurrent presentations answering a challenge is valid
+            error = self.nonce_store.use(presented)
+            if trace:
+                trace.mark('challenge')
+            if error:
+                return (False, {"error": error})
+        if is_valid:
+            details = {"message": "Presentation is valid", **details}
+        return (is_valid, details)
+    
+    def _run_checks(self, issuer_id, expiration_date, proof, revocation_uuid, signable, signature,
+                    root, trace=None):
+        """
+        Run the checks shared by credentials and presentations, cheapest first.
+        
+        Args:
+            signable (callable): Builds the signed message; only called
+                once the cheap checks have passed
+            root (tuple, optional): (root hash, age) of the issuer's revocation root
+            trace (StageTrace, optional): Records the time spent in each stage
+        
+        Returns:
+            tuple: (is_valid, details)
+        """
+        if self.bundle is not None and self.bundle.expired():
+            return (False, {"error": "Verifier bundle has expired"})
+        
+        # Check that the issuer is trusted
+        keys = self.trust_store.get_keys(issuer_id)
+        if trace:
+            trace.mark('key_lookup')
+        if not keys:
+            return (False, {"error": "Issuer not found"})
         
         # Check expiration if applicable
-        if credential.expiration_date and credential.expiration_date < current_timestamp():
+        if expiration_date and expiration_date < current_timestamp():
             return (False, {"error": "Credential has expired"})
         
-        # All checks passed
-        return (True, {"message": "Credential is valid"})
\ No newline at end of file
+        # Check the proof and signature, unless the outcome is cached
+        if root is None:
+            root = self._get_root(issuer_id)
+            if trace:
+                trace.mark('root_lookup')
+        root_hash, root_age = root
+        signable_data = signable()
+        if trace:
+            trace.mark('serialization')
+        digest = VerificationCache.digest(signable_data, signature, proof)
+        outcome = self._check_against_root(issuer_id, keys, digest, proof, revocation_uuid,
+                                           signable_data, signature, root_hash, trace)
+        
+        error = outcome[1].get("error")
+        if error == "Credential was revoked":
+            # The proof may be newer than the cached root
+            reloaded = self.root_cache.reload_if_old(issuer_id)
+            if trace:
+                trace.mark('root_lookup')
+            if reloaded is not None:
+                root_age = reloaded[1]
+                if reloaded[0] != root_hash:
+                    outcome = self._check_against_root(issuer_id, keys, digest, proof, revocation_uuid,
+                                                       signable_data, signature, reloaded[0], trace)
+        elif error == "Invalid signature" and self.trust_store.refresh_after_miss():
+            # The issuer may have rotated to a key not loaded yet
+            keys = self.trust_store.get_keys(issuer_id)
+            if trace:
+                trace.mark('key_lookup')
+            outcome = self._check_against_root(issuer_id, keys, digest, proof, revocation_uuid,
+                                               signable_data, signature, root_hash, trace)
+        
+        is_valid, details = outcome
+        return (is_valid, {**details, **self._root_details(root_age)})
+    
+    def _check_against_root(self, issuer_id, keys, digest, proof, revocation_uuid,
+                            signable_data, signature, root_hash, trace=None):
+        """
+        Check a non-revocation proof against a root, then the signature
+        against the issuer's keys, or get the cached outcome of doing so.
+        
+        With a bundle that has revocation filters, a proof for another root
+        is accepted if the filter lists the revocation UUID as not revoked.
+        
+        Returns:
+            tuple: (is_valid, details)
+        """
+        key = VerificationCache.make_key(digest, root_hash, tuple(kid for kid, _ in keys))
+        outcome = self.result_cache.get(key)
+        if trace:
+            trace.mark('result_cache')
+        if outcome is not None:
+            return outcome
+        
+        if not CryptoManager.check_proof(proof, revocation_uuid, root_hash) and not (
+                self.bundle is not None and self.bundle.is_unrevoked(issuer_id, revocation_uuid)):
+            outcome = (False, {"error": "Credential was revoked"})
+            if trace:
+                trace.mark('proof')
+        else:
+            if trace:
+                trace.mark('proof')
+            # Verify the signature with the issuer's keys, newest first
+            kid = self.trust_store.verify_with_keys(keys, signable_data, signature)
+            if trace:
+                trace.mark('signature')
+            outcome = (True, {"kid": kid}) if kid else (False, {"error": "Invalid signature"})
+        self.result_cache.put(key, outcome)
+        return outcome
+    
+    def verify(self, item):
+        """
+        Verify a credential or a presentation in any form verify_stream accepts.
+
+        Args:
+            item: A JSON string, a dict (a presentation if it has a
+                credential_id) or a Credential object
+
+        Returns:
+            tuple: (is_valid, details); malformed input is reported as invalid
+        """
+        try:
+            item = self._parse_stream_item(item)
+            issuer_id = item.issuer_id if isinstance(item, Credential) else item.get('issuer_id')
+            hash(issuer_id)
+        except (ValueError, TypeError, KeyError):
+            return (False, {"error": "Malformed credential"})
+        return self._verify_group(issuer_id, [(0, item)])[0][2]
+
+    def verify_stream(self, items, max_in_flight=1000, max_workers=4):
+        """
+        Verify a stream of credentials and presentations, e.g. the lines
+        of an NDJSON export.
+        
+        Items are read lazily, a window at a time. Each window is grouped by
+        issuer so the issuer's revocation root is looked up once per group,
+        and the groups are verified in parallel while the next window is
+        read. At most max_in_flight items are held at once, so memory use
+        does not depend on the length of the stream.
+        
+        Args:
+            items: Iterable of JSON lines, dicts or Credential objects; dicts
+                with a credential_id are verified as presentations
+            max_in_flight (int): Maximum number of items read ahead
+            max_workers (int): Number of verification threads
+            
+        Yields:
+            dict: One result per item, in input order, with the item's
+                position (index), credential ID (id), outcome (valid) and
+                the details of the verification
+        """
+        window_size = max(1, max_in_flight // 2)
+        items = iter(items)
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='verify') as executor:
+            pending = deque()
+            index = 0
+            while True:
+                window = list(islice(items, window_size))
+                if not window:
+                    break
+                pending.append(self._submit_window(executor, window, index, max_workers))
+                index += len(window)
+                # Keep one window verifying while the next one is read
+                if len(pending) > 1:
+                    yield from self._collect_window(pending.popleft())
+            while pending:
+                yield from self._collect_window(pending.popleft())
+    
+    def _submit_window(self, executor, window, first_index, max_workers):
+        """Parse a window of stream items and submit their verification by issuer."""
+        results = [None] * len(window)
+        groups = {}  # Map of issuer ID to (position in window, credential or presentation) pairs
+        for position, item in enumerate(window):
+            try:
+                item = self._parse_stream_item(item)
+                issuer_id = item.issuer_id if isinstance(item, Credential) else item.get('issuer_id')
+                groups.setdefault(issuer_id, []).append((position, item))
+            except (ValueError, TypeError, KeyError):
+                results[position] = {"index": first_index + position, "id": None,
+                                     "valid": False, "error": "Malformed credential"}
+        
+        # Split large groups so one issuer's window still uses every worker
+        slice_size = max(1, -(-len(window) // max_workers))
+        futures = []
+        for issuer_id, group in groups.items():
+            for start in range(0, len(group), slice_size):
+                futures.append(executor.submit(
+                    self._verify_group, issuer_id, group[start:start + slice_size]
+                ))
+        return first_index, results, futures
+    
+    @staticmethod
+    def _parse_stream_item(item):
+        """Turn a stream item into a Credential or a presentation dict."""
+        if isinstance(item, Credential):
+            return item
+        if isinstance(item, (str, bytes)):
+            item = json.loads(item)
+        if not isinstance(item, dict):
+            raise ValueError("Not a credential")
+        if 'credential_id' in item:
+            return item
+        return Credential(**item)
+    
+    def _verify_group(self, issuer_id, group):
+        """Verify credentials and presentations of one issuer, looking up its root once."""
+        group_trace = self.metrics.trace('verify_group')
+        known = isinstance(issuer_id, str) and bool(self.trust_store.get_keys(issuer_id))
+        if group_trace:
+            group_trace.mark('key_lookup')
+        root = None
+        if known:
+            try:
+                root = self._get_root(issuer_id)
+            except ValueError:
+                pass
+        if group_trace:
+            group_trace.mark('root_lookup')
+        
+        outcomes = []
+        for position, item in group:
+            is_credential = isinstance(item, Credential)
+            item_id = item.id if is_credential else item.get('credential_id')
+            trace = self.metrics.trace('verify_credential' if is_credential else 'verify_presentation')
+            try:
+                if known and root is None:
+                    outcome = (False, {"error": "Revocation entry not found"})
+                elif is_credential:
+                    outcome = self._verify_credential(item, root, trace)
+                else:
+                    outcome = self._verify_presentation(item, root, trace)
+            except Exception:
+                outcome = (False, {"error": "Malformed credential"})
+            if trace:
+                trace.finish()
+            outcomes.append((position, item_id if isinstance(item_id, str) else None, outcome))
+        return outcomes
+    
+    @staticmethod
+    def _collect_window(submitted):
+        """Wait for a window's verification and yield its results in input order."""
+        first_index, results, futures = submitted
+        for future in futures:
+            for position, credential_id, (is_valid, details) in future.result():
+                results[position] = {"index": first_index + position, "id": credential_id,
+                                     "valid": is_valid, **details}
+        yield from results